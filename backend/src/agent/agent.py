@@ -1,27 +1,114 @@
-import os
+import asyncio
+import re
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
-from src.agent.tools import legal_document_search, web_search_tool
+from src.agent.tools import (legal_document_search, web_search_tool, get_query_embedding, aget_query_embedding,
+                             prime_query_embeddings, search_legal_documents, asearch_legal_documents)
+from src.agent.context import build_context
+from src.agent.llm_pool import build_chat_model
+from src.agent.router import QueryRouter, RouteDecision, AGENT, DECLINE, FAST_PATH, DECLINE_MESSAGE
+from src.config import (MAX_CONCURRENT_AGENT_RUNS, BATCH_MAX_CONCURRENCY,
+                        FAST_PATH_ENABLED, SEARCH_RESULTS_PER_TOOL_CALL)
+from src.agent.cache import normalize_query, answer_cache, check_index_version
+from src.agent.metrics import RequestTrace, ROUTER_DECISIONS
 
 load_dotenv()
 
+FALLBACK_ANSWER = "I was unable to find a relevant answer."
+# Answers that are not cached: the "nothing found" reply the prompts ask for, and error text in place of an answer
+UNCACHEABLE_ANSWER_PATTERN = re.compile(r"\b(unable to find|could not find|couldn't find|no relevant|error occurred)\b",
+                                        re.IGNORECASE)
+
+TOOL_CODE_OPEN = "<tool_code>"
+TOOL_CODE_CLOSE = "</tool_code>"
+
+
+class ToolCodeFilter:
+    """
+    Incremental equivalent of re.sub(r"<tool_code>.*?</tool_code>", "", text, flags=re.DOTALL) for streamed text.
+    feed() returns the text that is safe to emit so far; a tag split across chunks is held back until it resolves.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._inside = False
+
+    def feed(self, text: str) -> str:
+        self._buffer += text
+        emitted = []
+        while True:
+            if self._inside:
+                end = self._buffer.find(TOOL_CODE_CLOSE)
+                if end == -1:
+                    break
+                self._buffer = self._buffer[end + len(TOOL_CODE_CLOSE):]
+                self._inside = False
+            else:
+                start = self._buffer.find(TOOL_CODE_OPEN)
+                if start == -1:
+                    held = _partial_tag_length(self._buffer, TOOL_CODE_OPEN)
+                    emitted.append(self._buffer[:len(self._buffer) - held])
+                    self._buffer = self._buffer[len(self._buffer) - held:]
+                    break
+                emitted.append(self._buffer[:start])
+                self._buffer = self._buffer[start + len(TOOL_CODE_OPEN):]
+                self._inside = True
+        return "".join(emitted)
+
+    def flush(self) -> str:
+        """Returns whatever is still held back. An unclosed block is kept, as the regex would keep it."""
+        remaining = TOOL_CODE_OPEN + self._buffer if self._inside else self._buffer
+        self._buffer = ""
+        self._inside = False
+        return remaining
+
+
+def _cacheable(answer: str, trace: RequestTrace) -> bool:
+    """Whether an answer may be served again from the answer cache."""
+    if not answer or UNCACHEABLE_ANSWER_PATTERN.search(answer):
+        return False
+    # Web results go stale, and an answer written around a failed tool call may be missing its sources
+    return not any(call["tool"] == web_search_tool.name or call["status"] == "error" for call in trace.tool_calls)
+
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """Length of the longest suffix of text that is a proper prefix of tag."""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+SYSTEM_PROMPT = (
+    "You are a helpful legal assistant named HaqooqAI, specializing in Pakistani law. "
+    "Your primary goal is to provide accurate and legally sound answers to user queries. "
+    "You have access to two powerful tools: a local legal document search and a general web search. "
+    "You MUST adhere to the following rules:"
+    "1. For questions related to static legal principles, ordinances, and historical legal information, always use the 'legal_document_search' tool. This is your primary source of legal truth. "
+    "2. For questions about current events, people, or facts that can change over time (e.g., 'Who is the current prime minister?'), you should use the 'web_search' tool. "
+    "3. If a query is not related to legal matters, politely decline to answer. "
+    "4. Your responses MUST be factually grounded in the information returned by the tools. "
+    "5. For every piece of information you provide, you must include the source of that information (e.g., 'Source: Legal Document Search' or 'Source: Web Search'). "
+    "6. Do not hallucinate or make up information. If a tool cannot find an answer, state that you were unable to find a relevant answer."
+)
+# Used on the fast path, where retrieval has already run and the model answers in a single call
+FAST_PATH_INSTRUCTIONS = (
+    " The local legal document search has already been run for this question; its results are below. "
+    "Answer from them and cite them as 'Source: Legal Document Search'. If they do not answer the question, "
+    "say that you were unable to find a relevant answer.\n\nRetrieved legal documents:\n{context}"
+)
+
+
 # Define the Agent Class
 class LegalAssistantAgent:
     def __init__(self):
         """Initializes the agent and its tools."""
         # 1. Initialize the LLM (using the same local model)
         # self.llm = ChatOllama(model="qwen3:1.7b")
-        # Now upadated to the openrouter model
-        self.llm = ChatOpenAI(
-            model="openai/gpt-oss-20b",
-            openai_api_base="https://api.groq.com/openai/v1",
-            openai_api_key=os.getenv("GROQ_API_KEY"),
-            temperature=0.1,
-            max_tokens=8000,
-            verbose=True
-        )
+        # Now upadated to the openrouter model, behind a pool of backends (config LLM_BACKENDS) with load
+        # balancing, hedging and failover
+        self.llm = build_chat_model(temperature=0.1, max_tokens=8000)
 
         # 2. Define the tools the agent will use
         self.tools = [
@@ -31,17 +118,7 @@ class LegalAssistantAgent:
 
         # 3. Define the prompt template
         self.prompt = ChatPromptTemplate.from_messages([
-                        ("system",
-                         "You are a helpful legal assistant named HaqooqAI, specializing in Pakistani law. "
-                         "Your primary goal is to provide accurate and legally sound answers to user queries. "
-                         "You have access to two powerful tools: a local legal document search and a general web search. "
-                         "You MUST adhere to the following rules:"
-                         "1. For questions related to static legal principles, ordinances, and historical legal information, always use the 'legal_document_search' tool. This is your primary source of legal truth. "
-                         "2. For questions about current events, people, or facts that can change over time (e.g., 'Who is the current prime minister?'), you should use the 'web_search' tool. "
-                         "3. If a query is not related to legal matters, politely decline to answer. "
-                         "4. Your responses MUST be factually grounded in the information returned by the tools. "
-                         "5. For every piece of information you provide, you must include the source of that information (e.g., 'Source: Legal Document Search' or 'Source: Web Search'). "
-                         "6. Do not hallucinate or make up information. If a tool cannot find an answer, state that you were unable to find a relevant answer."),
+                        ("system", SYSTEM_PROMPT),
                         ("placeholder", "{chat_history}"),
                         ("human", "{question}"),
                         ("placeholder", "{agent_scratchpad}"),
@@ -49,17 +126,283 @@ class LegalAssistantAgent:
 
         # 4. Create the agent executor
         self.agent_executor = create_tool_calling_agent(self.llm, self.tools, self.prompt)
-        self.agent_executor = AgentExecutor(agent=self.agent_executor, tools=self.tools, verbose=True)
+        # Per-run RequestTrace callbacks replace verbose=True: timings, token counts and tool calls end up in
+        # /metrics and one JSON trace line per run instead of the chain's console printout
+        self.agent_executor = AgentExecutor(agent=self.agent_executor, tools=self.tools)
 
-    def run(self, query: str):
-        """Runs the agent with a given query."""
-        response = self.agent_executor.invoke({"question": query, "chat_history": []})
-        output_string = response.get("output", "I was unable to find a relevant answer.")
-        import re
+        # 5. Fast path: a local pre-router sends clear legal questions to retrieval + one answer call
+        # and declines clearly off-topic ones without calling the LLM
+        self.answer_prompt = ChatPromptTemplate.from_messages([
+                        ("system", SYSTEM_PROMPT + FAST_PATH_INSTRUCTIONS),
+                        ("human", "{question}"),
+                    ])
+        self.router = QueryRouter() if FAST_PATH_ENABLED else None
+
+        # Created on first arun() so it binds to the serving event loop
+        self._semaphore = None
+
+    def warm_up(self):
+        """Prepares the pre-router (embeds its prototype questions)."""
+        if self.router is not None:
+            self.router.warm_up()
+
+    def _get_cached_answer(self, query: str, query_embedding):
+        check_index_version()
+        cached = answer_cache.get(normalize_query(query))
+        if cached is not None:
+            return cached[1]
+        if query_embedding is not None:
+            return answer_cache.get_similar(query_embedding)
+        return None
+
+    def _finalize_answer(self, query: str, query_embedding, response: dict, trace: RequestTrace) -> str:
+        output_string = response.get("output", FALLBACK_ANSWER)
         cleaned_output_string = re.sub(r"<tool_code>.*?</tool_code>", "", output_string, flags=re.DOTALL)
         final_response  = cleaned_output_string.strip()
+        if _cacheable(final_response, trace):
+            answer_cache.set(normalize_query(query), (query_embedding, final_response))
         return final_response
 
+    def _invoke_config(self, trace: RequestTrace) -> dict:
+        return {"callbacks": [trace], "metadata": {"request_id": trace.request_id}}
+
+    def _needs_query_embedding(self) -> bool:
+        return self.router is not None or answer_cache.similarity_threshold is not None
+
+    def _record_route(self, decision: RouteDecision, trace: RequestTrace) -> str:
+        ROUTER_DECISIONS.labels(route=decision.route).inc()
+        trace.route = decision.route
+        trace.route_reason = decision.reason
+        return decision.route
+
+    def _answer_messages(self, query: str, chunks: list) -> list:
+        return self.answer_prompt.format_messages(question=query, context=build_context(chunks))
+
+    def _route(self, query: str, query_embedding, trace: RequestTrace) -> str:
+        if self.router is None or query_embedding is None:
+            return AGENT
+        return self._record_route(self.router.classify(query, query_embedding), trace)
+
+    async def _aroute(self, query: str, query_embedding, trace: RequestTrace) -> str:
+        if self.router is None or query_embedding is None:
+            return AGENT
+        return self._record_route(await asyncio.to_thread(self.router.classify, query, query_embedding), trace)
+
+    def run(self, query: str):
+        """Runs the agent with a given query, answering from the answer cache when possible."""
+        trace = RequestTrace(query, mode="sync")
+        try:
+            query_embedding = get_query_embedding(query) if self._needs_query_embedding() else None
+            cached_answer = self._get_cached_answer(query, query_embedding)
+            if cached_answer is not None:
+                trace.finish("cache_hit")
+                return cached_answer
+
+            route = self._route(query, query_embedding, trace)
+            if route == DECLINE:
+                trace.finish("declined")
+                return DECLINE_MESSAGE
+
+            response = None
+            if route == FAST_PATH:
+                chunks = search_legal_documents(query, n_results=SEARCH_RESULTS_PER_TOOL_CALL)
+                if chunks:
+                    message = self.llm.invoke(self._answer_messages(query, chunks), config=self._invoke_config(trace))
+                    response = {"output": message.content}
+            if response is None:
+                response = self.agent_executor.invoke({"question": query, "chat_history": []},
+                                                      config=self._invoke_config(trace))
+            answer = self._finalize_answer(query, query_embedding, response, trace)
+        except Exception as e:
+            trace.finish("error", e)
+            raise
+        trace.finish("answered")
+        return answer
+
+    async def arun(self, query: str):
+        """Async variant of run. At most MAX_CONCURRENT_AGENT_RUNS invocations run at once per event loop."""
+        trace = RequestTrace(query, mode="async")
+        try:
+            query_embedding = await aget_query_embedding(query) if self._needs_query_embedding() else None
+            cached_answer = self._get_cached_answer(query, query_embedding)
+            if cached_answer is not None:
+                trace.finish("cache_hit")
+                return cached_answer
+
+            route = await self._aroute(query, query_embedding, trace)
+            if route == DECLINE:
+                trace.finish("declined")
+                return DECLINE_MESSAGE
+
+            response = None
+            async with self._get_semaphore():
+                if route == FAST_PATH:
+                    chunks = await asearch_legal_documents(query, n_results=SEARCH_RESULTS_PER_TOOL_CALL)
+                    if chunks:
+                        message = await self.llm.ainvoke(self._answer_messages(query, chunks),
+                                                          config=self._invoke_config(trace))
+                        response = {"output": message.content}
+                if response is None:
+                    response = await self.agent_executor.ainvoke({"question": query, "chat_history": []},
+                                                                 config=self._invoke_config(trace))
+            answer = self._finalize_answer(query, query_embedding, response, trace)
+        except Exception as e:
+            trace.finish("error", e)
+            raise
+        trace.finish("answered")
+        return answer
+
+    async def arun_batch(self, queries: list, max_concurrency: int = BATCH_MAX_CONCURRENCY) -> list:
+        """
+        Answers a list of questions. Questions with the same normalized text are answered once, all of them
+        are encoded in one batch up front, and at most `max_concurrency` agent runs are in flight at a time.
+        Returns one {"index", "query", "status", "answer" | "message", "duplicate"} dict per question, in order.
+        """
+        unique_queries = {}
+        for query in queries:
+            key = normalize_query(query)
+            if key:
+                unique_queries.setdefault(key, query)
+
+        try:
+            # The agent usually passes the question to legal_document_search as is, so its retrieval
+            # (and the answer-cache similarity lookup) finds these embeddings already cached
+            await asyncio.to_thread(prime_query_embeddings, list(unique_queries.values()))
+        except Exception as e:
+            print(f"Batch query encoding failed; questions will be encoded individually: {e}")
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def answer(query: str) -> dict:
+            async with semaphore:
+                try:
+                    return {"status": "success", "answer": await self.arun(query)}
+                except Exception as e:
+                    return {"status": "error", "message": str(e)}
+
+        answers = dict(zip(unique_queries, await asyncio.gather(*map(answer, unique_queries.values()))))
+
+        results = []
+        answered = set()
+        for index, query in enumerate(queries):
+            key = normalize_query(query)
+            result = answers.get(key, {"status": "error", "message": "Empty question."})
+            results.append(dict(result, index=index, query=query, duplicate=bool(key) and key in answered))
+            answered.add(key)
+        return results
+
+    async def astream(self, query: str):
+        """
+        Runs the agent and yields events as they happen:
+        {"type": "tool_start", "tool", "input"}, {"type": "tool_end", "tool"}, {"type": "token", "content"}
+        and finally {"type": "done", "answer"} with the same cleaned answer run() would return.
+        On the agent path tokens come from the answering LLM call only, released when that call ends.
+        """
+        trace = RequestTrace(query, mode="stream")
+        # A client that disconnects closes the generator mid-run; that run is recorded as "cancelled"
+        outcome, error = "cancelled", None
+        try:
+            async for event in self._astream(query, trace):
+                yield event
+            outcome = trace.outcome
+        except Exception as e:
+            outcome, error = "error", e
+            raise
+        finally:
+            trace.finish(outcome, error)
+
+    async def _astream(self, query: str, trace: RequestTrace):
+        query_embedding = await aget_query_embedding(query) if self._needs_query_embedding() else None
+        cached_answer = self._get_cached_answer(query, query_embedding)
+        if cached_answer is not None:
+            trace.outcome = "cache_hit"
+            yield {"type": "token", "content": cached_answer}
+            yield {"type": "done", "answer": cached_answer}
+            return
+
+        route = await self._aroute(query, query_embedding, trace)
+        if route == DECLINE:
+            trace.outcome = "declined"
+            yield {"type": "token", "content": DECLINE_MESSAGE}
+            yield {"type": "done", "answer": DECLINE_MESSAGE}
+            return
+
+        tool_code_filter = ToolCodeFilter()
+        started = False
+
+        def visible_text(content) -> str:
+            nonlocal started
+            text = tool_code_filter.feed(content) if isinstance(content, str) else ""
+            if not started:
+                # Mirror the .strip() applied to the full answer
+                text = text.lstrip()
+                started = bool(text)
+            return text
+
+        response = None
+        async with self._get_semaphore():
+            if route == FAST_PATH:
+                yield {"type": "tool_start", "tool": legal_document_search.name, "input": query}
+                chunks = await asearch_legal_documents(query, n_results=SEARCH_RESULTS_PER_TOOL_CALL)
+                yield {"type": "tool_end", "tool": legal_document_search.name}
+                if chunks:
+                    output = []
+                    async for chunk in self.llm.astream(self._answer_messages(query, chunks),
+                                                        config=self._invoke_config(trace)):
+                        if isinstance(chunk.content, str):
+                            output.append(chunk.content)
+                        text = visible_text(chunk.content)
+                        if text:
+                            yield {"type": "token", "content": text}
+                    response = {"output": "".join(output)}
+            if response is None:
+                response = {}
+                # A call that selects tools is an intermediate step whose text must not reach the client. Each
+                # call's text is held back only until that is known: a call streaming text without tool call
+                # chunks is the final answer and its tokens are emitted as they arrive
+                pending_text = {}  # run_id -> held text, or None once the call is known to select tools
+                answer_runs = set()
+                async for event in self.agent_executor.astream_events(
+                        {"question": query, "chat_history": []}, version="v2", config=self._invoke_config(trace)):
+                    kind = event["event"]
+                    if kind == "on_tool_start":
+                        yield {"type": "tool_start", "tool": event["name"], "input": event["data"].get("input")}
+                    elif kind == "on_tool_end":
+                        yield {"type": "tool_end", "tool": event["name"]}
+                    elif kind == "on_chat_model_stream":
+                        run_id = event["run_id"]
+                        chunk = event["data"]["chunk"]
+                        if getattr(chunk, "tool_call_chunks", None):
+                            pending_text[run_id] = None
+                        elif run_id in answer_runs:
+                            text = visible_text(chunk.content)
+                            if text:
+                                yield {"type": "token", "content": text}
+                        elif pending_text.get(run_id, []) is not None and isinstance(chunk.content, str):
+                            pending_text.setdefault(run_id, []).append(chunk.content)
+                            if chunk.content:
+                                answer_runs.add(run_id)
+                                text = visible_text("".join(pending_text.pop(run_id)))
+                                if text:
+                                    yield {"type": "token", "content": text}
+                    elif kind == "on_chat_model_end":
+                        pending_text.pop(event["run_id"], None)
+                        answer_runs.discard(event["run_id"])
+                    elif kind == "on_chain_end" and not event.get("parent_ids"):
+                        response = event["data"].get("output") or {}
+        tail = tool_code_filter.flush().rstrip()
+        if not started:
+            tail = tail.lstrip()
+        if tail:
+            yield {"type": "token", "content": tail}
+        trace.outcome = "answered"
+        yield {"type": "done", "answer": self._finalize_answer(query, query_embedding, response, trace)}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_AGENT_RUNS)
+        return self._semaphore
+
 
 # This block is for direct testing of the agent
 if __name__ == "__main__":
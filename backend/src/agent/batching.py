@@ -0,0 +1,107 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from src.config import QUERY_BATCH_MAX_SIZE, QUERY_BATCH_MAX_WAIT_MS
+
+
+class QueryEncodingBatcher:
+    """
+    Collects query texts submitted from concurrent requests and encodes them together.
+
+    A single background thread takes the first waiting query, keeps collecting for up to `max_wait_ms`
+    (or until `max_batch_size` queries are waiting), then passes the whole batch to `encode_fn` in one call.
+    Sync callers block on encode(); async callers await aencode() without tying up a thread.
+    """
+
+    def __init__(self, encode_fn, max_batch_size: int = QUERY_BATCH_MAX_SIZE,
+                 max_wait_ms: float = QUERY_BATCH_MAX_WAIT_MS):
+        self._encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._ensure_started()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str) -> list:
+        return self.submit(text).result()
+
+    async def aencode(self, text: str) -> list:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-encoding-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self) -> list:
+        batch = []
+        deadline = None
+        while len(batch) < self.max_batch_size:
+            if deadline is None:
+                item = self._queue.get()
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            # Marks the future running, so a caller can no longer cancel it; queries cancelled while waiting
+            # (e.g. an aborted request awaiting aencode()) are dropped here
+            if not item[1].set_running_or_notify_cancel():
+                continue
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.max_wait
+        return batch
+
+    @staticmethod
+    def _resolve(future: Future, result=None, exception: BaseException = None):
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except Exception as e:  # InvalidStateError: already resolved
+            print(f"Warning: could not resolve a query encoding future: {e!r}")
+
+    def _run(self):
+        # Nothing may end this loop: every later encode() would wait on a queue no thread reads
+        while True:
+            batch = []
+            try:
+                batch = self._collect_batch()
+                # Identical queries in the same window are encoded once
+                unique_texts = list(dict.fromkeys(text for text, _ in batch))
+                vectors = self._encode_fn(unique_texts)
+                by_text = dict(zip(unique_texts, vectors))
+                for text, future in batch:
+                    self._resolve(future, result=by_text[text])
+                self.batches += 1
+                self.queries += len(batch)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        self._resolve(future, exception=e)
@@ -0,0 +1,158 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from src.config import (INDEX_VERSION_PATH, CACHE_TTL_SECONDS, QUERY_EMBEDDING_CACHE_SIZE, RETRIEVAL_CACHE_SIZE,
+                        ANSWER_CACHE_SIZE, ANSWER_CACHE_SIMILARITY_THRESHOLD, INDEX_VERSION_CHECK_INTERVAL)
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Cache key form of a query: case-folded with whitespace collapsed."""
+    return _WHITESPACE_PATTERN.sub(" ", text).strip().casefold()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire `ttl` seconds after being stored."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float = CACHE_TTL_SECONDS):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def items(self):
+        """Snapshot of the live (key, value) pairs, oldest first."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at > now]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class AnswerCache(TTLCache):
+    """
+    Answer cache keyed on the normalized query. If a similarity threshold is set, a miss on the exact key
+    falls back to the cached answer whose query embedding has the highest cosine similarity above it.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float = CACHE_TTL_SECONDS,
+                 similarity_threshold: float = ANSWER_CACHE_SIMILARITY_THRESHOLD):
+        super().__init__(name, maxsize, ttl)
+        self.similarity_threshold = similarity_threshold
+        self.semantic_hits = 0
+
+    def get_similar(self, query_embedding):
+        if self.similarity_threshold is None or query_embedding is None:
+            return None
+        entries = self.items()
+        if not entries:
+            return None
+        query_vector = _unit(query_embedding)
+        matrix = np.stack([_unit(embedding) for _, (embedding, _) in entries])
+        scores = matrix @ query_vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        with self._lock:
+            self.semantic_hits += 1
+        return entries[best][1][1]
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["semantic_hits"] = self.semantic_hits
+        return stats
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+query_embedding_cache = TTLCache("query_embedding", QUERY_EMBEDDING_CACHE_SIZE)
+retrieval_cache = TTLCache("retrieval", RETRIEVAL_CACHE_SIZE)
+# Values are (query_embedding, answer) so semantic lookups can compare embeddings
+answer_cache = AnswerCache("answer", ANSWER_CACHE_SIZE)
+
+# --- Invalidation on index changes ---
+# generate_embeddings_and_index rewrites INDEX_VERSION_PATH after every sync; results cached against an
+# older version of the index are dropped the next time any cache is consulted.
+_index_version = None
+_index_version_checked_at = 0.0
+_index_version_lock = threading.Lock()
+
+
+def _read_index_version():
+    try:
+        return os.stat(INDEX_VERSION_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def check_index_version():
+    """Clears the retrieval and answer caches if the index changed. Stats the marker at most every few seconds."""
+    global _index_version, _index_version_checked_at
+    now = time.monotonic()
+    if now - _index_version_checked_at < INDEX_VERSION_CHECK_INTERVAL:
+        return
+    with _index_version_lock:
+        if now - _index_version_checked_at < INDEX_VERSION_CHECK_INTERVAL:
+            return
+        _index_version_checked_at = now
+        version = _read_index_version()
+        if version != _index_version:
+            if _index_version is not None:
+                print("Index changed; clearing retrieval and answer caches.")
+            retrieval_cache.clear()
+            answer_cache.clear()
+            _index_version = version
+
+
+def clear_all():
+    for cache in (query_embedding_cache, retrieval_cache, answer_cache):
+        cache.clear()
+
+
+def cache_stats() -> dict:
+    return {cache.name: cache.stats() for cache in (query_embedding_cache, retrieval_cache, answer_cache)}
@@ -0,0 +1,147 @@
+import json
+
+from src.config import CONTEXT_TOKEN_BUDGET, CONTEXT_TOKENIZER
+
+ADJACENT_GAP = 2  # Chunks starting at most this many characters after the previous one ends are merged too
+MIN_TRUNCATED_TOKENS = 50  # A passage is cut to fit the budget only if at least this much of it would remain
+PASSAGE_SEPARATOR = "\n...\n"
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+        except Exception as e:
+            # e.g. the encoding file cannot be downloaded; fall back to the ~4 characters per token estimate
+            print(f"tiktoken encoding '{CONTEXT_TOKENIZER}' unavailable, estimating token counts: {e}")
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    return len(encoding.encode(text, disallowed_special=())) if encoding else (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _get_encoding()
+    if encoding:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def _start_index(chunk: dict):
+    try:
+        return int(chunk.get("start_index_in_section"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _other_sources(chunk: dict) -> list:
+    """Other laws a deduplicated chunk also appears in (its `sources` JSON list minus its own source_file)."""
+    try:
+        sources = json.loads(chunk.get("sources") or "[]")
+    except (TypeError, ValueError):
+        return []
+    return [source for source in sources if source != chunk.get("source_file")]
+
+
+class _Passage:
+    """A contiguous span of one section, built from one or more retrieved chunks."""
+
+    def __init__(self, chunk: dict, rank: int):
+        self.start = _start_index(chunk)
+        self.text = chunk["chunk_content"]
+        self.rank = rank
+        self.other_sources = _other_sources(chunk)
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+    def absorb(self, other: "_Passage") -> bool:
+        """Merges `other` (starting at or after this passage) into it if the two spans overlap or touch."""
+        if self.start is None or other.start is None or other.start > self.end + ADJACENT_GAP:
+            return False
+        offset = other.start - self.start
+        if other.end <= self.end:
+            # Contained: a duplicate as long as the text really is the same (titles can repeat within a file)
+            if self.text[offset:offset + len(other.text)] != other.text:
+                return False
+        elif other.start <= self.end:
+            overlap = self.end - other.start
+            if self.text[offset:] != other.text[:overlap]:
+                return False
+            self.text += other.text[overlap:]
+        else:
+            self.text += "\n" + other.text
+        self.rank = min(self.rank, other.rank)
+        self.other_sources += [source for source in other.other_sources if source not in self.other_sources]
+        return True
+
+
+def merge_chunks(chunks: list) -> list:
+    """
+    Groups ranked chunks by (source_file, section_title), drops duplicates and merges chunks whose
+    start_index_in_section spans overlap or touch. Returns (source_file, section_title, passages) groups
+    ordered by their best-ranked chunk, each group's passages in document order.
+    """
+    groups = {}
+    seen = set()
+    for rank, chunk in enumerate(chunks):
+        key = chunk.get("chunk_id") or chunk["chunk_content"]
+        if key in seen or chunk["chunk_content"] in seen:
+            continue
+        seen.update((key, chunk["chunk_content"]))
+        groups.setdefault((chunk.get("source_file"), chunk.get("section_title")), []).append(_Passage(chunk, rank))
+
+    merged = []
+    for (source_file, section_title), passages in groups.items():
+        passages.sort(key=lambda passage: (passage.start is None, passage.start or 0))
+        combined = [passages[0]]
+        for passage in passages[1:]:
+            if not combined[-1].absorb(passage):
+                combined.append(passage)
+        merged.append((source_file, section_title, combined))
+    merged.sort(key=lambda group: min(passage.rank for passage in group[2]))
+    return merged
+
+
+def build_context(chunks: list, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Formats retrieved chunks for the LLM: merged per section under a "[Source: file | section]" header
+    (plus "[Also in: ...]" for text deduplicated across laws), best-ranked sections first, packed into
+    `token_budget` tokens. The passage that overflows the budget
+    is truncated if enough of it fits; everything after it is dropped.
+    """
+    blocks = []
+    remaining = token_budget
+    for source_file, section_title, passages in merge_chunks(chunks):
+        header = f"[Source: {source_file} | {section_title}]"
+        other_sources = list(dict.fromkeys(source for passage in passages for source in passage.other_sources))
+        if other_sources:
+            header += f" [Also in: {', '.join(other_sources)}]"
+        header_tokens = count_tokens(header) + 1
+        if remaining - header_tokens < MIN_TRUNCATED_TOKENS:
+            break
+        remaining -= header_tokens
+        texts = []
+        for passage in passages:
+            passage_tokens = count_tokens(passage.text) + 1
+            if passage_tokens <= remaining:
+                texts.append(passage.text)
+                remaining -= passage_tokens
+            else:
+                if remaining >= MIN_TRUNCATED_TOKENS:
+                    texts.append(truncate_to_tokens(passage.text, remaining) + " ...")
+                remaining = 0
+                break
+        if texts:
+            blocks.append(header + "\n" + PASSAGE_SEPARATOR.join(texts))
+        if remaining < MIN_TRUNCATED_TOKENS:
+            break
+    return "\n\n".join(blocks)
@@ -0,0 +1,508 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict
+
+from src.agent.metrics import LLM_BACKEND_LATENCY, LLM_BACKEND_REQUESTS, LLM_HEDGED_REQUESTS, LLM_CIRCUIT_OPEN
+from src.config import (LLM_BACKENDS, LLM_LOAD_BALANCING, LLM_HEDGING_ENABLED, LLM_HEDGE_DELAY_SECONDS,
+                        LLM_HEDGE_DEFAULT_DELAY_SECONDS, LLM_LATENCY_MIN_SAMPLES, LLM_MAX_ATTEMPTS,
+                        LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_RESET_SECONDS, LLM_REQUEST_TIMEOUT_SECONDS,
+                        LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS)
+
+
+class LLMBackendError(RuntimeError):
+    """Raised when no backend could complete a call; carries the (backend, error) pairs of every attempt."""
+
+    def __init__(self, errors: list):
+        self.errors = errors
+        details = "; ".join(f"{name}: {error!r}" for name, error in errors) or "no backend available"
+        super().__init__(f"All LLM backends failed ({details})")
+
+
+# --- Shared HTTP connection pools (one per process, reused by every OpenAI-compatible backend) ---
+_http_clients = {}
+_http_clients_lock = threading.Lock()
+
+
+def _shared_http_client(asynchronous: bool):
+    if asynchronous not in _http_clients:
+        with _http_clients_lock:
+            if asynchronous not in _http_clients:
+                import httpx
+
+                limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                      max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS)
+                timeout = httpx.Timeout(LLM_REQUEST_TIMEOUT_SECONDS, connect=10)
+                client_class = httpx.AsyncClient if asynchronous else httpx.Client
+                _http_clients[asynchronous] = client_class(limits=limits, timeout=timeout)
+    return _http_clients[asynchronous]
+
+
+def create_backend_model(spec: dict, temperature: float, max_tokens: int) -> BaseChatModel:
+    """Builds the chat model for one LLM_BACKENDS entry."""
+    if spec["type"] == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            model=spec["model"],
+            openai_api_base=spec["base_url"],
+            openai_api_key=os.getenv(spec.get("api_key_env", "GROQ_API_KEY")),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream_usage=True,  # Token counts on streamed responses too, for the request traces
+            max_retries=0,  # Retries are the pool's job: failing over beats retrying a struggling provider
+            timeout=LLM_REQUEST_TIMEOUT_SECONDS,
+            http_client=_shared_http_client(asynchronous=False),
+            http_async_client=_shared_http_client(asynchronous=True),
+        )
+    if spec["type"] == "ollama":
+        from langchain_ollama import ChatOllama
+        return ChatOllama(model=spec["model"], base_url=spec["base_url"], temperature=temperature,
+                          num_predict=max_tokens, client_kwargs={"timeout": LLM_REQUEST_TIMEOUT_SECONDS})
+    raise ValueError(f"Unknown LLM backend type: {spec['type']!r}")
+
+
+class LatencyTracker:
+    """Exponentially weighted mean plus a window of recent samples for quantiles."""
+
+    def __init__(self, window: int = 200, alpha: float = 0.2):
+        self.samples = deque(maxlen=window)
+        self.alpha = alpha
+        self.mean = None
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self.mean = seconds if self.mean is None else self.alpha * seconds + (1 - self.alpha) * self.mean
+
+    def quantile(self, q: float):
+        if len(self.samples) < LLM_LATENCY_MIN_SAMPLES:
+            return None
+        return float(np.quantile(np.fromiter(self.samples, dtype=np.float64), q))
+
+
+class LLMBackend:
+    """One chat model in the pool, with its latency statistics and circuit breaker."""
+
+    def __init__(self, name: str, model: BaseChatModel, fallback: bool = False):
+        self.name = name
+        self.model = model
+        self.fallback = fallback
+        self.completion_latency = LatencyTracker()
+        self.first_token_latency = LatencyTracker()
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.counts = {"ok": 0, "error": 0, "cancelled": 0}
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Closed circuit, or open for LLM_CIRCUIT_RESET_SECONDS with no trial request running (half-open).
+        Only a hint for ordering backends: begin() is what claims a call."""
+        if self.opened_at is None:
+            return True
+        return not self.trial_in_flight and time.monotonic() - self.opened_at >= LLM_CIRCUIT_RESET_SECONDS
+
+    def expected_latency(self) -> float:
+        # Backends without samples yet sort first, so each gets tried
+        latency = self.completion_latency.mean or 0.0
+        return latency * (1 + self.in_flight)
+
+    def hedge_delay(self, streaming: bool) -> float:
+        if LLM_HEDGE_DELAY_SECONDS is not None:
+            return LLM_HEDGE_DELAY_SECONDS
+        tracker = self.first_token_latency if streaming else self.completion_latency
+        p95 = tracker.quantile(0.95)
+        return LLM_HEDGE_DEFAULT_DELAY_SECONDS if p95 is None else p95
+
+    def begin(self):
+        """
+        Claims a call on this backend, checking the circuit under the lock so that concurrent callers cannot
+        both take the half-open trial. Returns None if the backend takes no calls now, else whether this call
+        is the trial; pass that to finish().
+        """
+        with self._lock:
+            if self.opened_at is not None:
+                if self.trial_in_flight or time.monotonic() - self.opened_at < LLM_CIRCUIT_RESET_SECONDS:
+                    return None
+                self.trial_in_flight = True
+                self.in_flight += 1
+                return True
+            self.in_flight += 1
+            return False
+
+    def finish(self, outcome: str, seconds: float = None, streaming: bool = False, trial: bool = False):
+        """Records the end of a call: outcome "ok" (with its latency), "error" or "cancelled"."""
+        with self._lock:
+            self.in_flight -= 1
+            if trial:
+                self.trial_in_flight = False
+            self.counts[outcome] += 1
+            if outcome == "ok":
+                (self.first_token_latency if streaming else self.completion_latency).add(seconds)
+                self.consecutive_failures = 0
+                self.opened_at = None
+            elif outcome == "error":
+                self.consecutive_failures += 1
+                # A failed half-open trial re-opens the circuit straight away
+                if trial or (self.opened_at is None
+                             and self.consecutive_failures >= LLM_CIRCUIT_FAILURE_THRESHOLD):
+                    self.opened_at = time.monotonic()
+        LLM_BACKEND_REQUESTS.labels(backend=self.name, outcome=outcome).inc()
+        if outcome == "ok":
+            LLM_BACKEND_LATENCY.labels(backend=self.name, kind="first_token" if streaming else "completion") \
+                .observe(seconds)
+        LLM_CIRCUIT_OPEN.labels(backend=self.name).set(self.opened_at is not None)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "fallback": self.fallback,
+            "in_flight": self.in_flight,
+            "circuit_open": self.opened_at is not None,
+            "consecutive_failures": self.consecutive_failures,
+            "mean_completion_seconds": self.completion_latency.mean,
+            "p95_completion_seconds": self.completion_latency.quantile(0.95),
+            "mean_first_token_seconds": self.first_token_latency.mean,
+            **self.counts,
+        }
+
+
+class LLMBackendPool:
+    """
+    Spreads chat-model calls over several backends.
+
+    Each call goes to the best available backend (load balancing by recent latency and in-flight requests,
+    or by list order), fallback backends last. If it has not answered after its hedge delay, the call is also
+    sent to the next backend and the first answer wins (for streams: the first token). A failed attempt fails
+    over to the next backend, up to LLM_MAX_ATTEMPTS. Backends that keep failing are skipped by a circuit breaker.
+    """
+
+    def __init__(self, backends: list, load_balancing: str = LLM_LOAD_BALANCING, hedging: bool = LLM_HEDGING_ENABLED,
+                 max_attempts: int = LLM_MAX_ATTEMPTS):
+        if not backends:
+            raise ValueError("LLMBackendPool needs at least one backend")
+        self.backends = backends
+        self.load_balancing = load_balancing
+        self.hedging = hedging
+        self.max_attempts = max_attempts
+        self.hedged = 0
+        # Sync calls run attempts on threads so a hedge can start while the first attempt is still waiting
+        self._executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONNECTIONS, thread_name_prefix="llm-backend")
+
+    def select(self) -> list:
+        """Available backends in the order they should be tried."""
+        candidates = [backend for backend in self.backends if backend.available()]
+        if self.load_balancing == "latency":
+            candidates.sort(key=LLMBackend.expected_latency)
+        return [b for b in candidates if not b.fallback] + [b for b in candidates if b.fallback]
+
+    def _candidates(self) -> "_Attempts":
+        return _Attempts(self.select(), self.max_attempts)
+
+    def _hedge_timeout(self, attempts: "_Attempts", pending: int, streaming: bool):
+        """Seconds to wait before hedging, or None if no hedge should be sent now."""
+        if self.hedging and attempts.started == 1 and pending == 1 and attempts.remaining():
+            return attempts.first.hedge_delay(streaming)
+        return None
+
+    # --- Non-streaming calls ---
+    def generate(self, messages: list, stop=None, **kwargs) -> ChatResult:
+        attempts = self._candidates()
+        errors = []
+        pending = {}
+
+        def launch() -> bool:
+            backend, trial = attempts.claim()
+            if backend is None:
+                return False
+            start_time = time.perf_counter()
+            future = self._executor.submit(backend.model._generate, messages, stop=stop, **kwargs)
+            pending[future] = (backend, trial, start_time)
+            return True
+
+        if not launch():
+            raise LLMBackendError([])
+        while pending:
+            timeout = self._hedge_timeout(attempts, len(pending), streaming=False)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if launch():
+                    self.hedged += 1
+                    LLM_HEDGED_REQUESTS.inc()
+                continue
+            for future in done:
+                backend, trial, start_time = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    backend.finish("error", trial=trial)
+                    errors.append((backend.name, e))
+                    continue
+                backend.finish("ok", time.perf_counter() - start_time, trial=trial)
+                # Threads cannot be interrupted: a losing attempt runs to completion and only updates its stats
+                for other, (other_backend, other_trial, other_start) in pending.items():
+                    other.add_done_callback(self._late_finish(other_backend, other_trial, other_start))
+                return result
+            if not pending:
+                launch()
+        raise LLMBackendError(errors)
+
+    @staticmethod
+    def _late_finish(backend: LLMBackend, trial: bool, start_time: float):
+        def callback(future):
+            if future.exception() is not None:
+                backend.finish("error", trial=trial)
+            else:
+                backend.finish("ok", time.perf_counter() - start_time, trial=trial)
+        return callback
+
+    async def agenerate(self, messages: list, stop=None, **kwargs) -> ChatResult:
+        attempts = self._candidates()
+        errors = []
+        pending = {}
+
+        def launch() -> bool:
+            backend, trial = attempts.claim()
+            if backend is None:
+                return False
+            task = asyncio.ensure_future(backend.model._agenerate(messages, stop=stop, **kwargs))
+            pending[task] = (backend, trial, time.perf_counter())
+            return True
+
+        if not launch():
+            raise LLMBackendError([])
+        try:
+            while pending:
+                timeout = self._hedge_timeout(attempts, len(pending), streaming=False)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch():
+                        self.hedged += 1
+                        LLM_HEDGED_REQUESTS.inc()
+                    continue
+                for task in done:
+                    backend, trial, start_time = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        backend.finish("error", trial=trial)
+                        errors.append((backend.name, e))
+                        continue
+                    backend.finish("ok", time.perf_counter() - start_time, trial=trial)
+                    return result
+                if not pending:
+                    launch()
+        finally:
+            # The losing (or abandoned) attempts are cancelled, which also returns their connections to the pool
+            for task, (backend, trial, _) in pending.items():
+                task.cancel()
+                backend.finish("cancelled", trial=trial)
+        raise LLMBackendError(errors)
+
+    # --- Streaming calls ---
+    def stream(self, messages: list, stop=None, **kwargs):
+        """Streams from the first backend that produces a first chunk; failover only, no hedging."""
+        attempts = self._candidates()
+        errors = []
+        while True:
+            backend, trial = attempts.claim()
+            if backend is None:
+                break
+            start_time = time.perf_counter()
+            iterator = backend.model._stream(messages, stop=stop, **kwargs)
+            try:
+                first_chunk = next(iterator, None)
+            except Exception as e:
+                backend.finish("error", trial=trial)
+                errors.append((backend.name, e))
+                continue
+            yield from self._finish_stream(backend, trial, start_time, first_chunk, iterator)
+            return
+        raise LLMBackendError(errors)
+
+    def _finish_stream(self, backend: LLMBackend, trial: bool, start_time: float, first_chunk, iterator):
+        first_token_seconds = time.perf_counter() - start_time
+        try:
+            if first_chunk is not None:
+                yield first_chunk
+                yield from iterator
+        except GeneratorExit:
+            backend.finish("cancelled", trial=trial)
+            raise
+        except Exception:
+            backend.finish("error", trial=trial)
+            raise
+        backend.finish("ok", first_token_seconds, streaming=True, trial=trial)
+
+    async def astream(self, messages: list, stop=None, **kwargs):
+        """
+        Streams from whichever attempt yields its first chunk first. A hedge attempt starts when the
+        first backend has produced nothing after its hedge delay; failed attempts fail over.
+        """
+        attempts = self._candidates()
+        errors = []
+        pending = {}
+
+        def launch() -> bool:
+            backend, trial = attempts.claim()
+            if backend is None:
+                return False
+            iterator = backend.model._astream(messages, stop=stop, **kwargs).__aiter__()
+            pending[asyncio.ensure_future(_first_chunk(iterator))] = (backend, trial, iterator, time.perf_counter())
+            return True
+
+        if not launch():
+            raise LLMBackendError([])
+        winner = None
+        try:
+            while pending and winner is None:
+                timeout = self._hedge_timeout(attempts, len(pending), streaming=True)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch():
+                        self.hedged += 1
+                        LLM_HEDGED_REQUESTS.inc()
+                    continue
+                for task in done:
+                    backend, trial, iterator, start_time = pending.pop(task)
+                    if winner is not None:
+                        await _abandon(backend, trial, iterator, task)
+                        continue
+                    try:
+                        first_chunk = task.result()
+                    except Exception as e:
+                        backend.finish("error", trial=trial)
+                        errors.append((backend.name, e))
+                        continue
+                    winner = (backend, trial, iterator, start_time, first_chunk)
+                if winner is None and not pending:
+                    launch()
+        finally:
+            for task, (backend, trial, iterator, _) in pending.items():
+                task.cancel()
+                await _abandon(backend, trial, iterator, task)
+        if winner is None:
+            raise LLMBackendError(errors)
+
+        backend, trial, iterator, start_time, first_chunk = winner
+        first_token_seconds = time.perf_counter() - start_time
+        try:
+            if first_chunk is not None:
+                yield first_chunk
+                async for chunk in iterator:
+                    yield chunk
+        except (GeneratorExit, asyncio.CancelledError):
+            backend.finish("cancelled", trial=trial)
+            raise
+        except Exception:
+            backend.finish("error", trial=trial)
+            raise
+        backend.finish("ok", first_token_seconds, streaming=True, trial=trial)
+
+    def stats(self) -> dict:
+        return {
+            "load_balancing": self.load_balancing,
+            "hedging": self.hedging,
+            "hedged_requests": self.hedged,
+            "backends": [backend.stats() for backend in self.backends],
+        }
+
+
+class _Attempts:
+    """The backends one call may try, in order, claimed one at a time as the call hedges or fails over."""
+
+    def __init__(self, candidates: list, max_attempts: int):
+        self.candidates = candidates
+        self.max_attempts = max_attempts
+        self.position = 0
+        self.started = 0
+        self.first = None
+
+    def remaining(self) -> bool:
+        return self.started < self.max_attempts and self.position < len(self.candidates)
+
+    def claim(self) -> tuple:
+        """(backend, trial) of the next candidate that accepts the call, or (None, False) if none is left.
+        A candidate can refuse: another call may have taken its half-open trial since select()."""
+        while self.remaining():
+            backend = self.candidates[self.position]
+            self.position += 1
+            trial = backend.begin()
+            if trial is not None:
+                self.started += 1
+                self.first = self.first or backend
+                return backend, trial
+        return None, False
+
+
+async def _first_chunk(iterator):
+    """The first chunk of an async iterator, or None if it is empty."""
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _abandon(backend: LLMBackend, trial: bool, iterator, task):
+    try:
+        await task
+    except BaseException:
+        pass
+    if hasattr(iterator, "aclose"):
+        await iterator.aclose()
+    backend.finish("cancelled", trial=trial)
+
+
+class PooledChatModel(BaseChatModel):
+    """
+    LangChain chat model backed by an LLMBackendPool, so the agent (bind_tools, invoke, astream_events)
+    uses it exactly like a single ChatOpenAI. Tools are converted to the OpenAI format once and passed
+    through to whichever backend serves the call.
+    """
+
+    pool: Any
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-chat-model"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return self.pool.generate(messages, stop, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return await self.pool.agenerate(messages, stop, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for chunk in self.pool.stream(messages, stop, **kwargs):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async for chunk in self.pool.astream(messages, stop, **kwargs):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def build_chat_model(temperature: float, max_tokens: int, backends: list = LLM_BACKENDS) -> PooledChatModel:
+    """The agent's chat model: every LLM_BACKENDS entry behind one LLMBackendPool."""
+    pool = LLMBackendPool([
+        LLMBackend(spec.get("name", spec["type"]), create_backend_model(spec, temperature, max_tokens),
+                   fallback=spec.get("fallback", False))
+        for spec in backends
+    ])
+    return PooledChatModel(pool=pool)
@@ -0,0 +1,163 @@
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import Counter, Gauge, Histogram
+
+from src.config import TRACE_LOGGING_ENABLED
+
+# Buckets from 1 ms to 60 s: query encoding and vector search sit at the low end, LLM round trips at the high end
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+REQUEST_LATENCY = Histogram("haqooq_request_seconds", "End-to-end HTTP request latency.",
+                            ["endpoint", "status"], buckets=LATENCY_BUCKETS)
+AGENT_RUN_LATENCY = Histogram("haqooq_agent_run_seconds", "Latency of one agent run, from query to final answer.",
+                              ["mode", "outcome"], buckets=LATENCY_BUCKETS)
+# Stages: query_encoding, document_routing, vector_search, lexical_search, citation_lookup,
+# and retrieve for the whole dense retrieval call
+RETRIEVAL_LATENCY = Histogram("haqooq_retrieval_seconds", "Latency of each retrieval stage.",
+                              ["stage"], buckets=LATENCY_BUCKETS)
+TOOL_LATENCY = Histogram("haqooq_tool_seconds", "Latency of each tool invocation.",
+                         ["tool", "status"], buckets=LATENCY_BUCKETS)
+LLM_LATENCY = Histogram("haqooq_llm_seconds", "Latency of each LLM round trip in the agent loop.",
+                        ["status"], buckets=LATENCY_BUCKETS)
+LLM_BACKEND_LATENCY = Histogram("haqooq_llm_backend_seconds",
+                                "Per-backend LLM latency: full completion, or time to first token when streaming.",
+                                ["backend", "kind"], buckets=LATENCY_BUCKETS)
+LLM_BACKEND_REQUESTS = Counter("haqooq_llm_backend_requests", "LLM backend calls by outcome (ok, error, cancelled).",
+                               ["backend", "outcome"])
+LLM_HEDGED_REQUESTS = Counter("haqooq_llm_hedged_requests", "LLM calls that were also sent to a second backend.")
+# "livemax": with pre-forked workers, open if it is open in any live worker
+LLM_CIRCUIT_OPEN = Gauge("haqooq_llm_circuit_open", "1 while a backend's circuit breaker is open.", ["backend"],
+                         multiprocess_mode="livemax")
+LLM_TOKENS = Counter("haqooq_llm_tokens", "Tokens sent to and received from the LLM.", ["direction"])
+ROUTER_DECISIONS = Counter("haqooq_router_decisions", "Pre-router decisions (fast_path, decline, agent).", ["route"])
+AGENT_TOOL_CALLS = Histogram("haqooq_agent_tool_calls", "Tool calls made in one agent run.",
+                             buckets=(0, 1, 2, 3, 4, 6, 8, 12))
+
+trace_logger = logging.getLogger("haqooq.trace")
+if TRACE_LOGGING_ENABLED and not trace_logger.handlers:
+    # The rest of the backend reports through print(); give traces a bare stdout handler so they show up the same way
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(_handler)
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """Observes the duration of the with-block in `histogram` under `labels`."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start_time)
+
+
+def _token_usage(response) -> tuple:
+    """(input_tokens, output_tokens) of an LLMResult, from usage_metadata or the provider's token_usage."""
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+    if not (input_tokens or output_tokens):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        input_tokens, output_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return input_tokens or 0, output_tokens or 0
+
+
+class RequestTrace(BaseCallbackHandler):
+    """
+    Per-run LangChain callback handler. Times every LLM round trip and tool call into the Prometheus
+    histograms and collects a trace of the run, which finish() writes as one JSON line to the haqooq.trace logger.
+    Create one per agent run and pass it in the run's callbacks.
+    """
+
+    run_inline = True  # Cheap bookkeeping only; no need for the executor hop in async runs
+
+    def __init__(self, query: str, mode: str):
+        self.request_id = uuid.uuid4().hex
+        self.query = query
+        self.mode = mode
+        self.start_time = time.perf_counter()
+        self.llm_calls = []
+        self.tool_calls = []
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.outcome = "answered"
+        self.route = "agent"
+        self.route_reason = None
+        self._started = {}
+
+    # --- LLM round trips ---
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        elapsed = time.perf_counter() - self._started.pop(run_id, self.start_time)
+        input_tokens, output_tokens = _token_usage(response)
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        LLM_LATENCY.labels(status="ok").observe(elapsed)
+        LLM_TOKENS.labels(direction="input").inc(input_tokens)
+        LLM_TOKENS.labels(direction="output").inc(output_tokens)
+        self.llm_calls.append({"seconds": round(elapsed, 4), "input_tokens": input_tokens,
+                               "output_tokens": output_tokens})
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        elapsed = time.perf_counter() - self._started.pop(run_id, self.start_time)
+        LLM_LATENCY.labels(status="error").observe(elapsed)
+        self.llm_calls.append({"seconds": round(elapsed, 4), "error": repr(error)})
+
+    # --- Tool calls ---
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), (serialized or {}).get("name") or kwargs.get("name", "unknown"))
+
+    def _end_tool(self, run_id, status: str):
+        start_time, tool = self._started.pop(run_id, (self.start_time, "unknown"))
+        elapsed = time.perf_counter() - start_time
+        TOOL_LATENCY.labels(tool=tool, status=status).observe(elapsed)
+        self.tool_calls.append({"tool": tool, "seconds": round(elapsed, 4), "status": status})
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id, "ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, "error")
+
+    def finish(self, outcome: str, error: Exception = None):
+        """Records the whole run ("answered", "cache_hit", "declined", "error" or "cancelled") and emits the trace log line."""
+        elapsed = time.perf_counter() - self.start_time
+        AGENT_RUN_LATENCY.labels(mode=self.mode, outcome=outcome).observe(elapsed)
+        if outcome != "cache_hit":
+            AGENT_TOOL_CALLS.observe(len(self.tool_calls))
+        if TRACE_LOGGING_ENABLED:
+            trace = {
+                "event": "agent_run",
+                "request_id": self.request_id,
+                "mode": self.mode,
+                "outcome": outcome,
+                "route": self.route,
+                "route_reason": self.route_reason,
+                "query_chars": len(self.query),
+                "seconds": round(elapsed, 4),
+                "llm_calls": len(self.llm_calls),
+                "tool_call_count": len(self.tool_calls),
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "llm": self.llm_calls,
+                "tools": self.tool_calls,
+            }
+            if error is not None:
+                trace["error"] = repr(error)
+            trace_logger.info(json.dumps(trace))
@@ -0,0 +1,191 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from src.config import EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR, ONNX_QUANTIZE, ONNX_MIN_COSINE_AGREEMENT
+
+CONFIG_FILE = "encoder_config.json"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+
+# Texts used to check that the ONNX encoder agrees with the SentenceTransformer that built the index
+VERIFICATION_TEXTS = [
+    "What are the functions and powers of the Privatisation Commission as per the Ordinance?",
+    "section 302 PPC punishment for qatl-i-amd",
+    "Article 25 equality of citizens",
+    "Can a tenant be evicted without notice under the rent restriction ordinance?",
+    "bail",
+    "What is the procedure for registration of a company under the Companies Act 2017, "
+    "and what documents must accompany the application to the registrar?",
+]
+
+
+def get_export_dir(model_name: str = EMBEDDING_MODEL_NAME) -> str:
+    return os.path.join(ONNX_MODEL_DIR, model_name.replace("/", "__"))
+
+
+class OnnxQueryEncoder:
+    """
+    Query encoder that runs an exported transformer through onnxruntime, with the tokenizer from the
+    `tokenizers` library and the pooling/normalization of the original SentenceTransformer.
+    Neither torch nor sentence-transformers is imported.
+
+    encode() follows SentenceTransformer.encode closely enough to be used in its place on the query path.
+    """
+
+    def __init__(self, export_dir: str, quantized: bool = ONNX_QUANTIZE, config: dict = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if config is None:
+            with open(os.path.join(export_dir, CONFIG_FILE)) as f:
+                config = json.load(f)
+        self.config = config
+        self.device = "cpu"
+        self.pooling = self.config["pooling"]
+        self.normalize = self.config["normalize"]
+        self.input_names = self.config["input_names"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(export_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = QUANTIZED_MODEL_FILE if quantized else MODEL_FILE
+        self.session = ort.InferenceSession(os.path.join(export_dir, model_file), options,
+                                            providers=["CPUExecutionProvider"])
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        if self.pooling == "mean":
+            return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.pooling == "max":
+            return np.where(mask > 0, hidden, -1e9).max(axis=1)
+        raise ValueError(f"Unsupported pooling mode for ONNX encoder: {self.pooling}")
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False, **_) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            inputs = {
+                "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.asarray([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+            pooled = self._pool(hidden, inputs["attention_mask"])
+            if self.normalize or normalize_embeddings:
+                pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            outputs.append(pooled.astype(np.float32))
+        embeddings = np.concatenate(outputs) if outputs else np.empty((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+def cosine_agreement(encoder, reference_model, texts: list = VERIFICATION_TEXTS) -> float:
+    """Lowest cosine similarity between the two models' embeddings of the same texts."""
+    ours = np.asarray(encoder.encode(texts), dtype=np.float32)
+    theirs = np.asarray(reference_model.encode(texts), dtype=np.float32)
+    ours /= np.linalg.norm(ours, axis=1, keepdims=True)
+    theirs /= np.linalg.norm(theirs, axis=1, keepdims=True)
+    return float((ours * theirs).sum(axis=1).min())
+
+
+def export_onnx_encoder(model_name: str = EMBEDDING_MODEL_NAME, export_dir: str = None,
+                        quantize: bool = ONNX_QUANTIZE) -> str:
+    """
+    Exports the transformer of a SentenceTransformer to ONNX (plus a dynamically int8-quantized copy),
+    saves its tokenizer and pooling settings, and records the cosine agreement of each variant
+    with the original model in encoder_config.json. Returns the export directory.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+
+    export_dir = export_dir or get_export_dir(model_name)
+    os.makedirs(export_dir, exist_ok=True)
+    print(f"Exporting '{model_name}' to ONNX in {export_dir}...")
+
+    reference_model = SentenceTransformer(model_name, device='cpu')
+    transformer = reference_model[0]
+    hf_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+    tokenizer.save_pretrained(export_dir)
+
+    sample = tokenizer(["sample query"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    with torch.no_grad():
+        torch.onnx.export(_LastHiddenState(hf_model), tuple(sample[name] for name in input_names),
+                          os.path.join(export_dir, MODEL_FILE), input_names=input_names,
+                          output_names=["last_hidden_state"], dynamic_axes=dynamic_axes, opset_version=14)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(os.path.join(export_dir, MODEL_FILE), os.path.join(export_dir, QUANTIZED_MODEL_FILE),
+                         weight_type=QuantType.QInt8)
+
+    pooling = next((module for module in reference_model if isinstance(module, models.Pooling)), None)
+    config = {
+        "model_name": model_name,
+        "pooling": pooling.get_pooling_mode_str() if pooling else "mean",
+        "normalize": any(isinstance(module, models.Normalize) for module in reference_model),
+        "max_seq_length": reference_model.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "input_names": input_names,
+        "cosine_agreement": {},
+    }
+    for quantized in ([False, True] if quantize else [False]):
+        encoder = OnnxQueryEncoder(export_dir, quantized=quantized, config=config)
+        agreement = cosine_agreement(encoder, reference_model)
+        config["cosine_agreement"][QUANTIZED_MODEL_FILE if quantized else MODEL_FILE] = agreement
+        print(f"{'int8' if quantized else 'fp32'} ONNX encoder: min cosine agreement {agreement:.5f}")
+
+    # The config marks a finished export, so it is only written once verification has succeeded
+    config_path = os.path.join(export_dir, CONFIG_FILE)
+    with open(f"{config_path}.tmp", "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(f"{config_path}.tmp", config_path)
+    return export_dir
+
+
+def load_onnx_encoder(model_name: str = EMBEDDING_MODEL_NAME, quantize: bool = ONNX_QUANTIZE,
+                      min_agreement: float = ONNX_MIN_COSINE_AGREEMENT):
+    """
+    Returns an OnnxQueryEncoder for model_name, exporting it on first use.
+    Falls back from the int8 to the fp32 model, and returns None if neither agrees with the original
+    model to at least `min_agreement` cosine similarity, since its vectors would not match the stored index.
+    """
+    export_dir = get_export_dir(model_name)
+    if not os.path.exists(os.path.join(export_dir, CONFIG_FILE)) or \
+            (quantize and not os.path.exists(os.path.join(export_dir, QUANTIZED_MODEL_FILE))):
+        export_onnx_encoder(model_name, export_dir, quantize)
+    with open(os.path.join(export_dir, CONFIG_FILE)) as f:
+        agreement = json.load(f)["cosine_agreement"]
+
+    for quantized in ([True, False] if quantize else [False]):
+        model_file = QUANTIZED_MODEL_FILE if quantized else MODEL_FILE
+        if agreement.get(model_file, 0.0) >= min_agreement:
+            return OnnxQueryEncoder(export_dir, quantized=quantized)
+        print(f"ONNX model {model_file} agrees with '{model_name}' only to {agreement.get(model_file, 0.0):.5f} "
+              f"(< {min_agreement}); not using it.")
+    return None
+
+
+if __name__ == "__main__":
+    # Pre-export the encoder, e.g. at image build time: python -m src.agent.onnx_encoder
+    export_onnx_encoder(sys.argv[1] if len(sys.argv) > 1 else EMBEDDING_MODEL_NAME)
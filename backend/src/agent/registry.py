@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+
+from src.config import (VECTOR_DB_DIR, COLLECTION_NAME, EMBEDDING_MODEL_NAME, LEXICAL_INDEX_PATH, VECTOR_BACKEND,
+                        VECTOR_INDEX_DIR, QUERY_ENCODER_BACKEND, DOCUMENT_INDEX_PATH)
+
+# --- Process-wide model/index registry ---
+# Each heavy resource is loaded at most once per process, on first use or by warm_up(),
+# and shared by everything that needs it (the Chroma collection and the query path).
+_lock = threading.RLock()
+_embedding_model = None
+_collection = None
+_numpy_vector_store = None
+_numpy_vector_store_mtime = None
+_lexical_index = None
+_lexical_index_mtime = None
+_document_index = None
+_document_index_mtime = None
+_warmup_thread = None
+_warmup_error = None
+_warmup_hooks = []
+_load_times = {}
+
+
+def get_embedding_model():
+    """
+    Returns the shared query encoder, loading it on first call: a SentenceTransformer, or an
+    OnnxQueryEncoder when QUERY_ENCODER_BACKEND = "onnx" and the exported model passes its agreement check.
+    """
+    global _embedding_model
+    if _embedding_model is not None:
+        return _embedding_model
+    with _lock:
+        if _embedding_model is None and QUERY_ENCODER_BACKEND == "onnx":
+            start_time = time.perf_counter()
+            try:
+                from src.agent.onnx_encoder import load_onnx_encoder
+
+                _embedding_model = load_onnx_encoder(EMBEDDING_MODEL_NAME)
+            except Exception as e:
+                # Export or session creation failed (e.g. onnxruntime or the exporter missing, or a bad export)
+                print(f"Error loading ONNX query encoder: {e}")
+                _embedding_model = None
+            if _embedding_model is not None:
+                _load_times["embedding_model"] = time.perf_counter() - start_time
+                print(f"ONNX query encoder for '{EMBEDDING_MODEL_NAME}' loaded "
+                      f"in {_load_times['embedding_model']:.1f}s.")
+            else:
+                print("Falling back to the SentenceTransformer query encoder.")
+        if _embedding_model is None:
+            from sentence_transformers import SentenceTransformer
+            from src.data_processing.embedding_engine import get_device
+
+            start_time = time.perf_counter()
+            try:
+                _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=get_device())
+            except Exception as e:
+                print(f"Error loading query embedding model: {e}")
+                print("Falling back to CPU.")
+                # The fallback must stay the same model, otherwise queries will not match the stored index
+                _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
+            _load_times["embedding_model"] = time.perf_counter() - start_time
+            print(f"Query embedding model '{EMBEDDING_MODEL_NAME}' loaded on {_embedding_model.device} "
+                  f"in {_load_times['embedding_model']:.1f}s.")
+    return _embedding_model
+
+
+def register_embedding_model(model):
+    """
+    Installs an already-loaded query encoder as the shared one. Anything with a SentenceTransformer-style
+    encode() works; must be called before the collection is first opened.
+    """
+    global _embedding_model
+    with _lock:
+        _embedding_model = model
+
+
+def get_collection():
+    """Returns the shared Chroma collection, whose embedding function reuses the shared model."""
+    global _collection
+    if _collection is not None:
+        return _collection
+    with _lock:
+        if _collection is None:
+            import chromadb
+            from chromadb.utils import embedding_functions
+
+            model = get_embedding_model()
+            start_time = time.perf_counter()
+            # SentenceTransformerEmbeddingFunction caches models by name at class level;
+            # seeding that cache makes it reuse our encoder (torch or ONNX) instead of loading a second copy.
+            embedding_functions.SentenceTransformerEmbeddingFunction.models[EMBEDDING_MODEL_NAME] = model
+            embedding_function_for_chroma = embedding_functions.SentenceTransformerEmbeddingFunction(
+                model_name=EMBEDDING_MODEL_NAME,
+                device=str(model.device)
+            )
+            client = chromadb.PersistentClient(path=VECTOR_DB_DIR)
+            _collection = client.get_or_create_collection(
+                name=COLLECTION_NAME,
+                embedding_function=embedding_function_for_chroma
+            )
+            _load_times["collection"] = time.perf_counter() - start_time
+            print(f"ChromaDB collection '{COLLECTION_NAME}' connected ({_collection.count()} chunks).")
+    return _collection
+
+
+def get_vector_store():
+    """
+    Returns the configured vector search backend: the Chroma collection, or the memory-mapped
+    NumpyVectorStore when VECTOR_BACKEND = "numpy" (None until that index has been built).
+    Both expose the same query()/get() calls.
+    """
+    global _numpy_vector_store, _numpy_vector_store_mtime
+    if VECTOR_BACKEND == "chroma":
+        return get_collection()
+    if VECTOR_BACKEND != "numpy":
+        raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND!r}")
+    # chunks.parquet is the last file written by build_vector_index, so its mtime marks a rebuild
+    try:
+        mtime = os.stat(os.path.join(VECTOR_INDEX_DIR, "chunks.parquet")).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if mtime != _numpy_vector_store_mtime:
+        with _lock:
+            if mtime != _numpy_vector_store_mtime:
+                from src.data_processing.vector_index import NumpyVectorStore
+
+                start_time = time.perf_counter()
+                _numpy_vector_store = NumpyVectorStore(VECTOR_INDEX_DIR)
+                _numpy_vector_store_mtime = mtime
+                _load_times["vector_store"] = time.perf_counter() - start_time
+                print(f"Local vector index loaded ({_numpy_vector_store.count()} vectors, "
+                      f"{_numpy_vector_store.quantization or 'float32'}).")
+    return _numpy_vector_store
+
+
+def get_lexical_index():
+    """
+    Returns the shared BM25 index, or None if it has not been built yet.
+    The index file is re-read whenever indexing replaces it.
+    """
+    global _lexical_index, _lexical_index_mtime
+    try:
+        mtime = os.stat(LEXICAL_INDEX_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if mtime != _lexical_index_mtime:
+        with _lock:
+            if mtime != _lexical_index_mtime:
+                from src.data_processing.lexical_index import LexicalIndex
+
+                start_time = time.perf_counter()
+                _lexical_index = LexicalIndex.load(LEXICAL_INDEX_PATH)
+                _lexical_index_mtime = mtime
+                _load_times["lexical_index"] = time.perf_counter() - start_time
+                print(f"Lexical index loaded ({_lexical_index.num_docs} chunks) "
+                      f"in {_load_times['lexical_index'] * 1000:.0f}ms.")
+    return _lexical_index
+
+
+def get_document_index():
+    """Returns the shared per-law routing index, or None if it has not been built yet. Reloaded after re-indexing."""
+    global _document_index, _document_index_mtime
+    try:
+        mtime = os.stat(DOCUMENT_INDEX_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if mtime != _document_index_mtime:
+        with _lock:
+            if mtime != _document_index_mtime:
+                from src.data_processing.document_index import DocumentIndex
+
+                start_time = time.perf_counter()
+                _document_index = DocumentIndex.load(DOCUMENT_INDEX_PATH)
+                _document_index_mtime = mtime
+                _load_times["document_index"] = time.perf_counter() - start_time
+                print(f"Document routing index loaded ({_document_index.num_sources} laws).")
+    return _document_index
+
+
+def warm_up(background: bool = True):
+    """
+    Loads every registered resource. With background=True this returns immediately
+    and the loading happens in a daemon thread; poll is_ready() to find out when it is done.
+    """
+    global _warmup_thread
+
+    def _load_all():
+        global _warmup_error
+        try:
+            get_embedding_model()
+            get_vector_store()
+            get_lexical_index()
+            get_document_index()
+            for hook in list(_warmup_hooks):
+                hook()
+        except Exception as e:
+            _warmup_error = e
+            print(f"Warm-up failed: {e}")
+
+    if not background:
+        _load_all()
+        return
+    with _lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_load_all, name="registry-warmup", daemon=True)
+            _warmup_thread.start()
+
+
+def preload_shared():
+    """
+    Loads the resources that can be inherited across fork(): the query encoder (torch on CPU) and the
+    numpy, BM25 and routing indexes. A pre-forking server calls this in its parent so all workers share one
+    copy-on-write copy. The Chroma client (SQLite handles, native threads), ONNX Runtime sessions (thread pools)
+    and CUDA state are not fork-safe; those stay with each worker's own warm_up().
+    """
+    if QUERY_ENCODER_BACKEND != "onnx":
+        from src.data_processing.embedding_engine import get_device
+
+        if get_device() == "cpu":
+            get_embedding_model()
+    if VECTOR_BACKEND == "numpy":
+        get_vector_store()
+    get_lexical_index()
+    get_document_index()
+
+
+def register_warmup(hook):
+    """Adds a zero-argument callable that warm_up() runs after the core resources are loaded."""
+    _warmup_hooks.append(hook)
+    return hook
+
+
+def is_ready() -> bool:
+    vector_store_loaded = _collection is not None if VECTOR_BACKEND == "chroma" else _numpy_vector_store is not None
+    if _embedding_model is None or not vector_store_loaded or _warmup_error is not None:
+        return False
+    return _warmup_thread is None or not _warmup_thread.is_alive()
+
+
+def status() -> dict:
+    return {
+        "ready": is_ready(),
+        "embedding_model_loaded": _embedding_model is not None,
+        "query_encoder": type(_embedding_model).__name__ if _embedding_model is not None else None,
+        "vector_backend": VECTOR_BACKEND,
+        "collection_loaded": _collection is not None,
+        "numpy_vector_store_loaded": _numpy_vector_store is not None,
+        "lexical_index_loaded": _lexical_index is not None,
+        "document_index_loaded": _document_index is not None,
+        "warming_up": _warmup_thread is not None and _warmup_thread.is_alive(),
+        "error": str(_warmup_error) if _warmup_error else None,
+        "load_seconds": {name: round(seconds, 2) for name, seconds in _load_times.items()},
+    }
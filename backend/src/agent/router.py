@@ -0,0 +1,145 @@
+import re
+import threading
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from src.agent.registry import get_embedding_model, get_lexical_index, get_document_index
+from src.config import (ROUTER_LEGAL_MARGIN, ROUTER_OFF_TOPIC_MARGIN, ROUTER_MIN_CORPUS_SIMILARITY,
+                        ROUTER_MIN_LEXICAL_COVERAGE, ROUTER_DECLINE_ENABLED)
+
+FAST_PATH = "fast_path"  # Retrieval, then a single answer call
+DECLINE = "decline"  # Off-topic: canned reply, no LLM call
+AGENT = "agent"  # Uncertain or needs web search: the full tool-calling agent
+
+DECLINE_MESSAGE = ("I'm sorry, but I can only help with questions about Pakistani law, ordinances and legal affairs. "
+                   "Please ask a legal question and I will do my best to answer it.")
+
+# Prototype questions for the nearest-prototype classifier. They are embedded once with the query encoder,
+# so the classifier follows whatever model built the index.
+LEGAL_PROTOTYPES = [
+    "What are the functions and powers of the commission under this ordinance?",
+    "What is the punishment for this offence under the Pakistan Penal Code?",
+    "What does the law say about the rights of a tenant facing eviction?",
+    "How is a company registered under the Companies Act?",
+    "What is the procedure for filing an appeal against the order?",
+    "Who can grant bail and on what conditions?",
+    "What penalties apply for violating the provisions of this Act?",
+    "What are the fundamental rights guaranteed by the Constitution of Pakistan?",
+    "How is inheritance divided under Muslim family laws?",
+    "What is the limitation period for filing a suit?",
+    "What are the requirements for a valid contract?",
+    "Which authority is empowered to make rules under this law?",
+]
+OFF_TOPIC_PROTOTYPES = [
+    "What is the capital of France?",
+    "Write me a poem about the sea.",
+    "How do I bake a chocolate cake?",
+    "What is the best smartphone to buy?",
+    "Tell me a joke.",
+    "Explain how photosynthesis works.",
+    "Who won the football world cup?",
+    "How do I fix a Python import error?",
+    "What is the weather like today?",
+    "Recommend a good movie to watch tonight.",
+    "hello, how are you?",
+    "Translate this sentence into Spanish.",
+]
+# Legal questions whose answer changes over time: left to the agent, which can use web search
+TIME_SENSITIVE_PROTOTYPES = [
+    "Who is the current Chief Justice of Pakistan?",
+    "What is the latest amendment passed by the National Assembly?",
+    "Who is the current prime minister of Pakistan?",
+    "What did the Supreme Court decide in the case this week?",
+    "What is the new tax rate announced in this year's budget?",
+    "Has the new law been passed yet?",
+]
+TIME_SENSITIVE_PATTERN = re.compile(r"\b(current|currently|latest|recent|recently|today|this (week|month|year)|"
+                                    r"news|upcoming)\b", re.IGNORECASE)
+
+
+@dataclass
+class RouteDecision:
+    route: str
+    reason: str
+    signals: dict = field(default_factory=dict)
+
+
+class QueryRouter:
+    """
+    Classifies a question locally, before any LLM call, into FAST_PATH, DECLINE or AGENT.
+
+    Signals: a citation hit in the lexical index; the share of the question's terms in the BM25 vocabulary;
+    the cosine similarity of the question to the nearest law centroid; and a nearest-prototype classifier
+    (mean similarity to the three closest legal / off-topic / time-sensitive example questions).
+    Only clear cases leave the agent path: anything ambiguous or time-sensitive goes to the full agent.
+    A DECLINE cannot be undone by the agent, so it is only returned with `decline_enabled`, after the margins
+    have been checked against the labeled questions (src/benchmarks/calibrate_router.py).
+    """
+
+    def __init__(self, legal_margin: float = ROUTER_LEGAL_MARGIN, off_topic_margin: float = ROUTER_OFF_TOPIC_MARGIN,
+                 min_corpus_similarity: float = ROUTER_MIN_CORPUS_SIMILARITY,
+                 min_lexical_coverage: float = ROUTER_MIN_LEXICAL_COVERAGE,
+                 decline_enabled: bool = ROUTER_DECLINE_ENABLED):
+        self.legal_margin = legal_margin
+        self.off_topic_margin = off_topic_margin
+        self.min_corpus_similarity = min_corpus_similarity
+        self.min_lexical_coverage = min_lexical_coverage
+        self.decline_enabled = decline_enabled
+        self._prototypes = None
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Embeds the prototype questions (once per process)."""
+        if self._prototypes is None:
+            with self._lock:
+                if self._prototypes is None:
+                    self._prototypes = {
+                        name: _unit_rows(get_embedding_model().encode(texts))
+                        for name, texts in (("legal", LEGAL_PROTOTYPES), ("off_topic", OFF_TOPIC_PROTOTYPES),
+                                            ("time_sensitive", TIME_SENSITIVE_PROTOTYPES))
+                    }
+        return self._prototypes
+
+    def _prototype_scores(self, query_embedding) -> dict:
+        query_vector = _unit_rows([query_embedding])[0]
+        scores = {}
+        for name, vectors in self.warm_up().items():
+            similarities = np.sort(vectors @ query_vector)[::-1]
+            scores[name] = float(similarities[:3].mean())
+        return scores
+
+    def classify(self, query: str, query_embedding) -> RouteDecision:
+        lexical_index = get_lexical_index()
+        signals = self._prototype_scores(query_embedding)
+        document_index = get_document_index()
+        nearest_law = document_index.route(query_embedding, 1) if document_index is not None else []
+        signals["corpus_similarity"] = nearest_law[0][1] if nearest_law else None
+        signals["lexical_coverage"] = lexical_index.coverage(query) if lexical_index is not None else None
+        signals = {name: round(value, 4) if value is not None else None for name, value in signals.items()}
+
+        # Checked before citations: "the latest amendment to section 302" cites a section but needs web search
+        if signals["time_sensitive"] > signals["legal"] or TIME_SENSITIVE_PATTERN.search(query):
+            return RouteDecision(AGENT, "time_sensitive", signals)
+        if lexical_index is not None and lexical_index.lookup_citations(query, k=1):
+            return RouteDecision(FAST_PATH, "citation", signals)
+
+        margin = signals["legal"] - signals["off_topic"]
+        in_corpus = (signals["corpus_similarity"] is not None
+                     and signals["corpus_similarity"] >= self.min_corpus_similarity)
+        well_covered = (signals["lexical_coverage"] or 0) >= self.min_lexical_coverage
+        if margin >= self.legal_margin and (in_corpus or well_covered):
+            return RouteDecision(FAST_PATH, "legal", signals)
+        # Declining needs both the classifier and the corpus to agree: common words say little about the topic
+        if margin <= -self.off_topic_margin and signals["corpus_similarity"] is not None and not in_corpus:
+            if self.decline_enabled:
+                return RouteDecision(DECLINE, "off_topic", signals)
+            return RouteDecision(AGENT, "off_topic", signals)
+        return RouteDecision(AGENT, "uncertain", signals)
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
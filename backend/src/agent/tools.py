@@ -1,55 +1,105 @@
-import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
+import asyncio
+
 from langchain.tools import Tool
-from langchain_community.tools import DuckDuckGoSearchRun
-import torch
-import os
-
-# Import constants from config.py
-# from src.config import VECTOR_DB_DIR, COLLECTION_NAME, EMBEDDING_MODEL_NAME
-# from config import VECTOR_DB_DIR, COLLECTION_NAME, EMBEDDING_MODEL_NAME
-from src.config import VECTOR_DB_DIR, COLLECTION_NAME, EMBEDDING_MODEL_NAME
-# --- Initialize ChromaDB Client and Connect to Collection ---
-# This will be done once when the tools are loaded
-client = chromadb.PersistentClient(path=VECTOR_DB_DIR)
-embedding_function_for_chroma = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name=EMBEDDING_MODEL_NAME,
-    device='cuda' if torch.cuda.is_available() else 'cpu'
-)
-collection = client.get_or_create_collection(  # Use get_or_create_collection for robustness
-    name=COLLECTION_NAME,
-    embedding_function=embedding_function_for_chroma
-)
-print(f"ChromaDB collection '{COLLECTION_NAME}' connected for tool use.")
-
-# --- Load the Embedding Model for Query Encoding ---
-# This must be the SAME model used to embed your chunks
-query_embedding_model = None
-try:
-    query_embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME,
-                                                device='cuda' if torch.cuda.is_available() else 'cpu')
-    print(f"Query embedding model '{EMBEDDING_MODEL_NAME}' loaded for tool use.")
-except Exception as e:
-    print(f"Error loading query embedding model for tools: {e}")
-    print("Fallback to CPU or ensure model is downloaded. Agent might not function correctly.")
-    # Fallback to CPU if GPU fails, or handle as needed
-    query_embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
 
+# The embedding model and vector store (ChromaDB or the local numpy index) live in the process-wide registry.
+# They are loaded on first use (or by registry.warm_up()), not when this module is imported.
+from src.agent.registry import get_embedding_model, get_vector_store, get_lexical_index, get_document_index
+from src.agent.cache import normalize_query, query_embedding_cache, retrieval_cache, check_index_version
+from src.agent.batching import QueryEncodingBatcher
+from src.agent.web_search import CachedWebSearch
+from src.agent.metrics import RETRIEVAL_LATENCY, timed
+from src.agent.context import build_context
+from src.data_processing.dedup import source_key
+from src.config import (LEXICAL_SEARCH_ENABLED, RRF_K, HYBRID_CANDIDATES, QUERY_BATCH_MAX_SIZE,
+                        SEARCH_RESULTS_PER_TOOL_CALL, DOCUMENT_ROUTING_ENABLED, ROUTING_TOP_DOCUMENTS)
 
-# --- Define the Retriever Function ---
-def retrieve_relevant_chunks(query_text: str, n_results: int = 5) -> list:
-    if query_embedding_model is None:
-        print("Query embedding model not loaded. Cannot retrieve chunks.")
-        return []
 
-    query_embedding = query_embedding_model.encode(query_text).tolist()
+def _encode_queries(texts: list) -> list:
+    return get_embedding_model().encode(texts, batch_size=len(texts)).tolist()
+
+
+# Queries from concurrent requests are encoded together in a single model.encode call
+query_batcher = QueryEncodingBatcher(_encode_queries)
+
+
+def get_query_embedding(query_text: str) -> list:
+    """Encodes a query, reusing the cached embedding of any query with the same normalized text."""
+    key = normalize_query(query_text)
+    query_embedding = query_embedding_cache.get(key)
+    if query_embedding is None:
+        with timed(RETRIEVAL_LATENCY, stage="query_encoding"):
+            query_embedding = query_batcher.encode(query_text)
+        query_embedding_cache.set(key, query_embedding)
+    return query_embedding
+
+
+async def aget_query_embedding(query_text: str) -> list:
+    """Async variant of get_query_embedding; waits on the micro-batcher without blocking a thread."""
+    key = normalize_query(query_text)
+    query_embedding = query_embedding_cache.get(key)
+    if query_embedding is None:
+        with timed(RETRIEVAL_LATENCY, stage="query_encoding"):
+            query_embedding = await query_batcher.aencode(query_text)
+        query_embedding_cache.set(key, query_embedding)
+    return query_embedding
+
+
+def prime_query_embeddings(query_texts: list) -> int:
+    """
+    Encodes every query whose normalized text is not in the embedding cache, QUERY_BATCH_MAX_SIZE per
+    model call, and caches the results. Returns how many queries were encoded.
+    """
+    missing = {}
+    for query_text in query_texts:
+        key = normalize_query(query_text)
+        if key not in missing and query_embedding_cache.get(key) is None:
+            missing[key] = query_text
+    keys = list(missing)
+    for start in range(0, len(keys), QUERY_BATCH_MAX_SIZE):
+        batch_keys = keys[start:start + QUERY_BATCH_MAX_SIZE]
+        with timed(RETRIEVAL_LATENCY, stage="query_encoding"):
+            embeddings = _encode_queries([missing[key] for key in batch_keys])
+        for key, query_embedding in zip(batch_keys, embeddings):
+            query_embedding_cache.set(key, query_embedding)
+    return len(keys)
+
+
+def _get_cached_chunks(cache_key):
+    check_index_version()
+    cached_chunks = retrieval_cache.get(cache_key)
+    if cached_chunks is None:
+        return None
+    return [dict(chunk) for chunk in cached_chunks]
+
 
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=n_results,
-        include=['documents', 'metadatas', 'distances']
-    )
+def build_where(source_files: list = None, section_title: str = None):
+    """
+    Chroma `where` filter for chunks of any of source_files and/or one section_title; None if neither is given.
+    Laws are matched on the per-law metadata flags, which a collapsed duplicate chunk carries for each of its sources.
+    """
+    clauses = []
+    if source_files:
+        source_clauses = [{source_key(source_file): True} for source_file in dict.fromkeys(source_files)]
+        clauses.append(source_clauses[0] if len(source_clauses) == 1 else {"$or": source_clauses})
+    if section_title:
+        clauses.append({"section_title": section_title})
+    if len(clauses) > 1:
+        return {"$and": clauses}
+    return clauses[0] if clauses else None
+
+
+def _search_collection(query_embedding: list, n_results: int, where: dict = None) -> list:
+    vector_store = get_vector_store()
+    if vector_store is None:
+        return []
+    with timed(RETRIEVAL_LATENCY, stage="vector_search"):
+        results = vector_store.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=where,
+            include=['documents', 'metadatas', 'distances']
+        )
 
     retrieved_chunks_info = []
     if results and results['documents']:
@@ -59,35 +109,231 @@ def retrieve_relevant_chunks(query_text: str, n_results: int = 5) -> list:
             distance = results['distances'][0][i]
 
             retrieved_chunks_info.append({
+                "chunk_id": results['ids'][0][i],
                 "chunk_content": chunk_content,
                 "source_file": metadata.get('source_file'),
                 "section_title": metadata.get('section_title'),
+                "start_index_in_section": metadata.get('start_index_in_section'),
+                "sources": metadata.get('sources'),
                 "distance": distance
             })
     return retrieved_chunks_info
 
 
+def route_query(query_embedding: list, k: int = ROUTING_TOP_DOCUMENTS) -> list:
+    """Source files of the k laws whose centroids are closest to the query; [] when routing is off or pointless."""
+    document_index = get_document_index() if DOCUMENT_ROUTING_ENABLED else None
+    if document_index is None or document_index.num_sources <= k:
+        return []
+    with timed(RETRIEVAL_LATENCY, stage="document_routing"):
+        return [source_file for source_file, _ in document_index.route(query_embedding, k)]
+
+
+def _query_collection(query_embedding: list, n_results: int, cache_key, source_files: list = None,
+                      section_title: str = None) -> list:
+    """
+    Dense chunk search. Without explicit source_files the query is first routed to its closest laws and only
+    their chunks are searched; if that finds fewer than n_results chunks, the whole collection is searched.
+    """
+    routed_sources = [] if source_files else route_query(query_embedding)
+    retrieved_chunks_info = []
+    if routed_sources:
+        retrieved_chunks_info = _search_collection(query_embedding, n_results,
+                                                   build_where(routed_sources, section_title))
+    if len(retrieved_chunks_info) < n_results:
+        retrieved_chunks_info = _search_collection(query_embedding, n_results,
+                                                   build_where(source_files, section_title))
+    retrieval_cache.set(cache_key, [dict(chunk) for chunk in retrieved_chunks_info])
+    return retrieved_chunks_info
+
+
+def _retrieval_cache_key(query_text: str, n_results: int, source_files: list, section_title: str) -> tuple:
+    return normalize_query(query_text), n_results, tuple(sorted(source_files or ())), section_title or None
+
+
+# --- Define the Retriever Function ---
+def retrieve_relevant_chunks(query_text: str, n_results: int = 5, source_files: list = None,
+                             section_title: str = None) -> list:
+    """Dense retrieval, optionally limited to chunks of source_files and/or the section titled section_title."""
+    with timed(RETRIEVAL_LATENCY, stage="retrieve"):
+        return _retrieve_relevant_chunks(query_text, n_results, source_files, section_title)
+
+
+def _retrieve_relevant_chunks(query_text: str, n_results: int, source_files: list, section_title: str) -> list:
+    cache_key = _retrieval_cache_key(query_text, n_results, source_files, section_title)
+    cached_chunks = _get_cached_chunks(cache_key)
+    if cached_chunks is not None:
+        return cached_chunks
+
+    try:
+        query_embedding = get_query_embedding(query_text)
+    except Exception as e:
+        print(f"Query embedding model not loaded. Cannot retrieve chunks: {e}")
+        return []
+    return _query_collection(query_embedding, n_results, cache_key, source_files, section_title)
+
+
+async def aretrieve_relevant_chunks(query_text: str, n_results: int = 5, source_files: list = None,
+                                    section_title: str = None) -> list:
+    """Async variant of retrieve_relevant_chunks for the async serving path."""
+    with timed(RETRIEVAL_LATENCY, stage="retrieve"):
+        return await _aretrieve_relevant_chunks(query_text, n_results, source_files, section_title)
+
+
+async def _aretrieve_relevant_chunks(query_text: str, n_results: int, source_files: list,
+                                     section_title: str) -> list:
+    cache_key = _retrieval_cache_key(query_text, n_results, source_files, section_title)
+    cached_chunks = _get_cached_chunks(cache_key)
+    if cached_chunks is not None:
+        return cached_chunks
+
+    try:
+        query_embedding = await aget_query_embedding(query_text)
+    except Exception as e:
+        print(f"Query embedding model not loaded. Cannot retrieve chunks: {e}")
+        return []
+    return await asyncio.to_thread(_query_collection, query_embedding, n_results, cache_key,
+                                   source_files, section_title)
+
+
+# --- Hybrid (lexical + dense) Search ---
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    """Merges several rankings of chunk IDs; each ID scores sum(1 / (k + rank)) over the rankings it appears in."""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def _get_chunks_by_id(chunk_ids: list) -> dict:
+    vector_store = get_vector_store()
+    if vector_store is None:
+        return {}
+    results = vector_store.get(ids=chunk_ids, include=['documents', 'metadatas'])
+    return {
+        chunk_id: {
+            "chunk_id": chunk_id,
+            "chunk_content": document,
+            "source_file": metadata.get('source_file'),
+            "section_title": metadata.get('section_title'),
+            "start_index_in_section": metadata.get('start_index_in_section'),
+            "sources": metadata.get('sources'),
+            "distance": None
+        }
+        for chunk_id, document, metadata in zip(results['ids'], results['documents'], results['metadatas'])
+    }
+
+
+def _in_order(chunk_ids: list, chunks_by_id: dict, n_results: int, section_title: str = None) -> list:
+    # The lexical index knows sources but not section titles, so a section filter is applied to the fetched chunks
+    chunks = [chunks_by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in chunks_by_id]
+    if section_title:
+        chunks = [chunk for chunk in chunks if chunk["section_title"] == section_title]
+    return chunks[:n_results]
+
+
+def _lexical_candidates(lexical_index, query: str, n_results: int, source_files: list, section_title: str):
+    """Returns (citation_ids, lexical_ids): chunk IDs from the citation fast path, else the BM25 ranking."""
+    # With a section filter, fetch a longer ranking since some of it may be filtered out afterwards
+    k = HYBRID_CANDIDATES if section_title else n_results
+    with timed(RETRIEVAL_LATENCY, stage="citation_lookup"):
+        citation_ids = [chunk_id for chunk_id, _ in
+                        lexical_index.lookup_citations(query, k=k, source_files=source_files)]
+    if citation_ids:
+        return citation_ids, None
+    with timed(RETRIEVAL_LATENCY, stage="lexical_search"):
+        lexical_ids = [chunk_id for chunk_id, _ in
+                       lexical_index.search(query, k=HYBRID_CANDIDATES, source_files=source_files)]
+    return None, lexical_ids
+
+
+def search_legal_documents(query: str, n_results: int = 5, source_files: list = None,
+                           section_title: str = None) -> list:
+    """
+    Hybrid retrieval. Queries citing a provision ("section 302 PPC") are answered straight from the
+    lexical index without encoding the query; everything else fuses BM25 and dense rankings with RRF.
+    Falls back to dense-only retrieval when the lexical index is disabled or not built.
+    source_files and section_title restrict every ranking to those laws / that section.
+    """
+    lexical_index = get_lexical_index() if LEXICAL_SEARCH_ENABLED else None
+    if lexical_index is None:
+        return retrieve_relevant_chunks(query, n_results, source_files, section_title)
+
+    citation_ids, lexical_ids = _lexical_candidates(lexical_index, query, n_results, source_files, section_title)
+    if citation_ids:
+        return _in_order(citation_ids, _get_chunks_by_id(citation_ids), n_results, section_title)
+
+    dense_chunks = retrieve_relevant_chunks(query, HYBRID_CANDIDATES, source_files, section_title)
+    fused_ids = reciprocal_rank_fusion([[chunk["chunk_id"] for chunk in dense_chunks], lexical_ids])
+    if not section_title:
+        fused_ids = fused_ids[:n_results]
+    chunks_by_id = {chunk["chunk_id"]: chunk for chunk in dense_chunks}
+    missing_ids = [chunk_id for chunk_id in fused_ids if chunk_id not in chunks_by_id]
+    if missing_ids:
+        chunks_by_id.update(_get_chunks_by_id(missing_ids))
+    return _in_order(fused_ids, chunks_by_id, n_results, section_title)
+
+
+async def asearch_legal_documents(query: str, n_results: int = 5, source_files: list = None,
+                                  section_title: str = None) -> list:
+    """Async variant of search_legal_documents."""
+    lexical_index = get_lexical_index() if LEXICAL_SEARCH_ENABLED else None
+    if lexical_index is None:
+        return await aretrieve_relevant_chunks(query, n_results, source_files, section_title)
+
+    citation_ids, lexical_ids = _lexical_candidates(lexical_index, query, n_results, source_files, section_title)
+    if citation_ids:
+        return _in_order(citation_ids, await asyncio.to_thread(_get_chunks_by_id, citation_ids),
+                         n_results, section_title)
+
+    dense_chunks = await aretrieve_relevant_chunks(query, HYBRID_CANDIDATES, source_files, section_title)
+    fused_ids = reciprocal_rank_fusion([[chunk["chunk_id"] for chunk in dense_chunks], lexical_ids])
+    if not section_title:
+        fused_ids = fused_ids[:n_results]
+    chunks_by_id = {chunk["chunk_id"]: chunk for chunk in dense_chunks}
+    missing_ids = [chunk_id for chunk_id in fused_ids if chunk_id not in chunks_by_id]
+    if missing_ids:
+        chunks_by_id.update(await asyncio.to_thread(_get_chunks_by_id, missing_ids))
+    return _in_order(fused_ids, chunks_by_id, n_results, section_title)
+
+
 # --- Define the Local Legal Document Search Tool ---
 def _legal_document_search_func(query: str) -> str:
     """Searches the local legal documents for relevant information.
     Input should be a clear, standalone question or keyword phrase relevant to the local documents."""
     print(f"\n--- Using legal_document_search tool for query: '{query}' ---")
-    chunks = retrieve_relevant_chunks(query, n_results=5)
+    chunks = search_legal_documents(query, n_results=SEARCH_RESULTS_PER_TOOL_CALL)
     if not chunks:
         return "No relevant information found in local legal documents."
-    formatted_context = "\n\n".join(chunk["chunk_content"] for chunk in chunks)
-    return formatted_context
+    # Overlapping chunks of a section are merged and the result is capped at CONTEXT_TOKEN_BUDGET tokens
+    return build_context(chunks)
+
+
+async def _alegal_document_search_func(query: str) -> str:
+    """Async variant used when the agent runs through ainvoke."""
+    print(f"\n--- Using legal_document_search tool for query: '{query}' ---")
+    chunks = await asearch_legal_documents(query, n_results=SEARCH_RESULTS_PER_TOOL_CALL)
+    if not chunks:
+        return "No relevant information found in local legal documents."
+    return build_context(chunks)
 
 
 legal_document_search = Tool(
     name="legal_document_search",
     func=_legal_document_search_func,
+    coroutine=_alegal_document_search_func,
     description="Searches the local legal documents for relevant information. Use this tool when the question is about specific Pakistani laws, ordinances, or legal documents that might be in the local knowledge base. Input should be a clear, standalone question or keyword phrase relevant to the local documents."
 )
 
 # --- Define the Web Search Tool ---
-web_search_tool = DuckDuckGoSearchRun(
+# Cached, time-bounded and concurrency-limited wrapper around DuckDuckGo (or WEB_SEARCH_BACKEND_URL)
+web_search = CachedWebSearch()
+
+web_search_tool = Tool(
     name="web_search",
+    func=web_search.run,
+    coroutine=web_search.arun,
     description="Useful for general knowledge questions or when information is not found in local legal documents. Input should be a concise search query."
 )
 
@@ -0,0 +1,177 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from src.agent.cache import normalize_query
+from src.config import (WEB_SEARCH_CACHE_PATH, WEB_SEARCH_CACHE_TTL_SECONDS, WEB_SEARCH_TIMEOUT_SECONDS,
+                        WEB_SEARCH_MAX_CONCURRENCY, WEB_SEARCH_BACKEND_URL)
+
+TIMEOUT_MESSAGE = "Web search did not respond in time. Answer from the local legal documents instead."
+ERROR_MESSAGE = "Web search is currently unavailable. Answer from the local legal documents instead."
+
+
+# --- Search backends: callables taking a query string and returning the result text ---
+class DuckDuckGoBackend:
+    """
+    DuckDuckGo text search, returning the result snippets joined as DuckDuckGoSearchRun does.
+    Each request gets its own `timeout`, so a hung search gives its executor thread back.
+    """
+
+    def __init__(self, timeout: float = WEB_SEARCH_TIMEOUT_SECONDS, max_results: int = 5):
+        self.timeout = timeout
+        self.max_results = max_results
+
+    def __call__(self, query: str) -> str:
+        from duckduckgo_search import DDGS
+
+        results = DDGS(timeout=self.timeout).text(query, max_results=self.max_results)
+        if not results:
+            return "No good DuckDuckGo Search Result was found"
+        return " ".join(result["body"] for result in results)
+
+
+class HttpSearchBackend:
+    """
+    Calls GET <url>?q=<query> and returns the body (or its "results" field if the body is JSON).
+    Lets a local stub server stand in for the real search engine in tests and benchmarks.
+    """
+
+    def __init__(self, url: str, timeout: float = WEB_SEARCH_TIMEOUT_SECONDS):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, query: str) -> str:
+        import requests
+
+        response = requests.get(self.url, params={"q": query}, timeout=self.timeout)
+        response.raise_for_status()
+        if response.headers.get("content-type", "").startswith("application/json"):
+            return str(response.json().get("results", ""))
+        return response.text
+
+
+class SearchResultCache:
+    """Persistent query -> result cache in SQLite, with entries expiring after `ttl` seconds."""
+
+    def __init__(self, path: str = WEB_SEARCH_CACHE_PATH, ttl: float = WEB_SEARCH_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS web_search (query TEXT PRIMARY KEY, result TEXT, created_at REAL)")
+        self._connection.commit()
+
+    def get(self, query: str):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT result FROM web_search WHERE query = ? AND created_at > ?",
+                (query, time.time() - self.ttl)).fetchone()
+        return row[0] if row else None
+
+    def set(self, query: str, result: str):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO web_search (query, result, created_at) VALUES (?, ?, ?)",
+                (query, result, time.time()))
+            self._connection.commit()
+
+
+class CachedWebSearch:
+    """
+    Wraps a search backend with a persistent TTL cache, a concurrency limit, coalescing of identical
+    in-flight queries and a hard time budget. Callers never wait longer than `timeout` seconds;
+    on timeout or error they get a short message telling the agent to carry on without web results.
+    """
+
+    def __init__(self, backend=None, cache: SearchResultCache = None, timeout: float = WEB_SEARCH_TIMEOUT_SECONDS,
+                 max_concurrency: int = WEB_SEARCH_MAX_CONCURRENCY):
+        self._backend = backend
+        self._cache = cache
+        self.timeout = timeout
+        # At most max_concurrency searches run at once; the rest queue, and the wait counts against the budget
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="web-search")
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.stats = {"cache_hits": 0, "searches": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = HttpSearchBackend(WEB_SEARCH_BACKEND_URL) if WEB_SEARCH_BACKEND_URL \
+                else DuckDuckGoBackend()
+        return self._backend
+
+    @property
+    def cache(self) -> SearchResultCache:
+        if self._cache is None:
+            self._cache = SearchResultCache()
+        return self._cache
+
+    def _search(self, key: str, query: str) -> str:
+        result = self.backend(query)
+        self.cache.set(key, result)
+        return result
+
+    def _cached(self, key: str):
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+        return cached
+
+    def _submit(self, key: str, query: str):
+        """Starts a search for `query`, or returns the future of an identical in-flight one."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future
+            future = self._executor.submit(self._search, key, query)
+            self._in_flight[key] = future
+            self.stats["searches"] += 1
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future
+
+    def _forget(self, key: str, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _on_timeout(self) -> str:
+        # The search itself keeps going (other callers may share it) and still fills the cache when it finishes
+        self.stats["timeouts"] += 1
+        return TIMEOUT_MESSAGE
+
+    def _on_error(self, query: str, error: Exception) -> str:
+        self.stats["errors"] += 1
+        print(f"Web search failed for '{query}': {error}")
+        return ERROR_MESSAGE
+
+    def run(self, query: str) -> str:
+        key = normalize_query(query)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        future = self._submit(key, query)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            return self._on_timeout()
+        except Exception as e:
+            return self._on_error(query, e)
+
+    async def arun(self, query: str) -> str:
+        key = normalize_query(query)
+        # The SQLite lookup runs off the event loop
+        cached = await asyncio.to_thread(self._cached, key)
+        if cached is not None:
+            return cached
+        future = self._submit(key, query)
+        try:
+            # shield: a timed-out waiter must not cancel a search other requests are sharing
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return self._on_timeout()
+        except Exception as e:
+            return self._on_error(query, e)
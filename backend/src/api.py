@@ -1,11 +1,51 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
 from pydantic import BaseModel
+from src.agent import registry
 from src.agent.agent import LegalAssistantAgent
+from src.agent.cache import cache_stats
+from src.agent.metrics import REQUEST_LATENCY
+from src.agent.tools import query_batcher, web_search
+from src.config import WARMUP_ON_STARTUP, BATCH_MAX_QUESTIONS
+
+# The agent (and the models behind it) is built on first use or by the background warm-up,
+# so the server can answer health checks as soon as it starts.
+_agent = None
+_agent_lock = threading.Lock()
+
+
+def get_agent() -> LegalAssistantAgent:
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = LegalAssistantAgent()
+    return _agent
+
 
-app = FastAPI(title="HaqooqAI", version="0.0.1")
-agent = LegalAssistantAgent()
+@registry.register_warmup
+def _warm_up_agent():
+    get_agent().warm_up()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ON_STARTUP:
+        registry.warm_up(background=True)
+    yield
+
+
+app = FastAPI(title="HaqooqAI", version="0.0.1", lifespan=lifespan)
 
 # Add the CORS middleware
 origins = [
@@ -21,13 +61,74 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    # For /ask/stream this is the time until the stream starts; the agent run itself is in haqooq_agent_run_seconds
+    start_time = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_LATENCY.labels(endpoint=route.path if route else "unmatched",
+                           status=str(response.status_code)).observe(time.perf_counter() - start_time)
+    return response
+
+
 class QueryRequest(BaseModel):
     query: str
 
+
+class BatchQueryRequest(BaseModel):
+    queries: list[str]
+
+@app.get("/health")
+def health():
+    """Liveness check: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready(response: Response):
+    """Readiness check: models and index are loaded. Returns 503 while warming up."""
+    status = registry.status()
+    status["agent_loaded"] = _agent is not None
+    if not status["ready"]:
+        response.status_code = 503
+    return status
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Hit rates and sizes of the query-embedding, retrieval and answer caches, plus batching and web search stats."""
+    stats = cache_stats()
+    stats["query_batcher"] = query_batcher.stats()
+    stats["web_search"] = dict(web_search.stats)
+    return stats
+
+
+@app.get("/llm/stats")
+def get_llm_stats():
+    """Per-backend latency, in-flight requests, outcomes and circuit state of the agent's LLM pool."""
+    if _agent is None:
+        return {"agent_loaded": False}
+    return _agent.llm.pool.stats()
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: request, agent run, retrieval stage, tool and LLM latencies, and LLM token counts."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Pre-forked workers (src/serve.py): aggregate every worker's metrics, not just this one's
+        collector_registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collector_registry)
+        return Response(generate_latest(collector_registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/ask/")
-def ask_agent(request: QueryRequest):
+async def ask_agent(request: QueryRequest):
     try:
-        response = agent.run(request.query)
+        # Building the agent can load models, so keep it off the event loop
+        agent = _agent or await asyncio.to_thread(get_agent)
+        response = await agent.arun(request.query)
         return {
             "status": "success",
             "answer": response
@@ -38,5 +139,48 @@ def ask_agent(request: QueryRequest):
             "message": str(e)
         }
 
+@app.post("/ask/batch")
+async def ask_agent_batch(request: BatchQueryRequest, response: Response):
+    """
+    Answers up to BATCH_MAX_QUESTIONS questions in one call. Duplicate questions are answered once and
+    agent runs execute in parallel; `results` has one entry per question, in order, each with its own status.
+    """
+    if len(request.queries) > BATCH_MAX_QUESTIONS:
+        response.status_code = 413
+        return {
+            "status": "error",
+            "message": f"At most {BATCH_MAX_QUESTIONS} questions per batch."
+        }
+    try:
+        agent = _agent or await asyncio.to_thread(get_agent)
+        results = await agent.arun_batch(request.queries)
+        return {
+            "status": "success",
+            "results": results
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+@app.post("/ask/stream")
+async def ask_agent_stream(request: QueryRequest):
+    """
+    Streams the answer as server-sent events: `tool_start` / `tool_end` while tools run,
+    `token` events as the LLM generates, then a final `done` event with the full answer (or `error`).
+    """
+    async def event_stream():
+        try:
+            agent = _agent or await asyncio.to_thread(get_agent)
+            async for event in agent.astream(request.query):
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
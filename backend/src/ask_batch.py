@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# Add src directory to Python path to allow absolute imports from src
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from src.agent import registry
+from src.agent.agent import LegalAssistantAgent
+from src.agent.cache import normalize_query
+from src.config import BATCH_MAX_CONCURRENCY
+
+
+def read_questions(path: str, column: str = "question") -> list:
+    """Questions from a .csv (one per row, in `column`), a .jsonl (the "query" field) or a text file (one per line)."""
+    if path.endswith(".csv"):
+        import pandas as pd
+        return pd.read_csv(path)[column].fillna("").astype(str).tolist()
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line)["query"] for line in f if line.strip()]
+        return [line.strip() for line in f if line.strip()]
+
+
+def answer_questions(questions: list, max_concurrency: int = BATCH_MAX_CONCURRENCY) -> list:
+    registry.warm_up(background=False)
+    agent = LegalAssistantAgent()
+    return asyncio.run(agent.arun_batch(questions, max_concurrency=max_concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of legal questions offline with the agent.")
+    parser.add_argument("input", help="Questions: .txt (one per line), .csv or .jsonl")
+    parser.add_argument("-o", "--output", help="Write results as JSON lines here (default: stdout)")
+    parser.add_argument("--column", default="question", help="Question column of a CSV input")
+    parser.add_argument("--concurrency", type=int, default=BATCH_MAX_CONCURRENCY,
+                        help="Agent runs in flight at once")
+    args = parser.parse_args()
+
+    questions = read_questions(args.input, args.column)
+    distinct = len(set(map(normalize_query, questions)))
+    print(f"Answering {len(questions)} questions ({distinct} distinct)...", file=sys.stderr)
+    start_time = time.perf_counter()
+    results = answer_questions(questions, args.concurrency)
+    elapsed = time.perf_counter() - start_time
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for result in results:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if args.output:
+            output.close()
+
+    failed = sum(result["status"] != "success" for result in results)
+    print(f"Done in {elapsed:.1f}s: {len(results) - failed} answered, {failed} failed.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+# Add the backend directory to the Python path so `src` imports work when run as a script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)))
+
+from src.agent.registry import get_embedding_model
+from src.agent.router import QueryRouter, AGENT, DECLINE, FAST_PATH
+
+LABELED_QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "router_questions.jsonl")
+# Routes a labeled question may take; anything else is an error
+ALLOWED_ROUTES = {
+    "legal": {FAST_PATH, AGENT},
+    "time_sensitive": {AGENT},
+    "off_topic": {DECLINE, AGENT},
+}
+
+
+def load_labeled_questions(path: str = LABELED_QUESTIONS_PATH) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def calibrate_router(path: str = LABELED_QUESTIONS_PATH) -> dict:
+    """
+    Routes the labeled questions with the configured thresholds against the built index, with DECLINE allowed,
+    and reports the routes per label, every misrouted question and the signal ranges per label.
+    A legal or time-sensitive question that would be declined (or a time-sensitive one sent to the fast path)
+    is an error: ROUTER_DECLINE_ENABLED should only be switched on while this reports none.
+    """
+    questions = load_labeled_questions(path)
+    router = QueryRouter(decline_enabled=True)
+    embeddings = get_embedding_model().encode([item["question"] for item in questions])
+
+    routes = {label: {} for label in ALLOWED_ROUTES}
+    signals_by_label = {label: [] for label in ALLOWED_ROUTES}
+    errors = []
+    for item, embedding in zip(questions, embeddings):
+        decision = router.classify(item["question"], embedding)
+        label = item["label"]
+        routes[label][decision.route] = routes[label].get(decision.route, 0) + 1
+        signals = dict(decision.signals)
+        if "legal" in signals and "off_topic" in signals:
+            signals["margin"] = round(signals["legal"] - signals["off_topic"], 4)
+        signals_by_label[label].append(signals)
+        if decision.route not in ALLOWED_ROUTES[label]:
+            errors.append({"question": item["question"], "label": label, "route": decision.route,
+                           "reason": decision.reason, "signals": signals})
+
+    signal_ranges = {}
+    for label, rows in signals_by_label.items():
+        signal_ranges[label] = {}
+        for name in ("margin", "corpus_similarity", "lexical_coverage"):
+            values = [row[name] for row in rows if row.get(name) is not None]
+            if values:
+                signal_ranges[label][name] = {"min": round(float(np.min(values)), 4),
+                                              "max": round(float(np.max(values)), 4)}
+    return {
+        "questions": len(questions),
+        "thresholds": {"legal_margin": router.legal_margin, "off_topic_margin": router.off_topic_margin,
+                       "min_corpus_similarity": router.min_corpus_similarity,
+                       "min_lexical_coverage": router.min_lexical_coverage},
+        "routes": routes,
+        "signal_ranges": signal_ranges,
+        "errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the pre-router thresholds against labeled questions.")
+    parser.add_argument("--questions", default=LABELED_QUESTIONS_PATH, help="JSONL of {question, label}")
+    args = parser.parse_args()
+    report = calibrate_router(args.questions)
+    print(json.dumps(report, indent=2))
+    if report["errors"]:
+        print(f"{len(report['errors'])} labeled questions misrouted; keep ROUTER_DECLINE_ENABLED = False "
+              f"or adjust the thresholds.")
+        sys.exit(1)
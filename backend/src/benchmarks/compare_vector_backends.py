@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the backend directory to the Python path so `src` imports work when run as a script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)))
+
+from src.config import VECTOR_INDEX_DIR
+from src.data_processing.vector_index import QUANTIZATIONS, NumpyVectorStore, write_quantized_copies
+
+
+def _percentile_ms(samples: list, percentile: float) -> float:
+    return round(float(np.percentile(samples, percentile)) * 1000, 3)
+
+
+def _make_queries(vectors: np.ndarray, num_queries: int, noise: float, seed: int) -> np.ndarray:
+    """Stored vectors plus Gaussian noise: near-duplicates of real chunks, without needing the encoder."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(vectors.shape[0], size=min(num_queries, vectors.shape[0]), replace=False)
+    queries = np.asarray(vectors[rows], dtype=np.float32)
+    queries += rng.normal(scale=noise, size=queries.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def _exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> list:
+    scores = np.asarray(queries @ np.asarray(vectors, dtype=np.float32).T)
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def _run(name: str, search, queries: np.ndarray, truth: list, k: int) -> dict:
+    search(queries[0])  # warm up page cache / lazy init
+    latencies = []
+    recalls = []
+    for query, expected in zip(queries, truth):
+        start_time = time.perf_counter()
+        found = search(query)
+        latencies.append(time.perf_counter() - start_time)
+        recalls.append(len(expected & set(found)) / k)
+    return {
+        "backend": name,
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+        "p99_ms": _percentile_ms(latencies, 99),
+        "queries": len(latencies),
+    }
+
+
+def compare_vector_backends(num_queries: int = 200, k: int = 5, noise: float = 0.02, seed: int = 0,
+                            include_chroma: bool = True) -> list:
+    """
+    Measures recall@k against exact float32 search and per-query latency for the numpy backend
+    (float32, float16, int8) and, if requested, the ChromaDB collection.
+    The index is built with only the configured quantization, so the other compact copies are written first.
+    """
+    write_quantized_copies(VECTOR_INDEX_DIR, QUANTIZATIONS)
+    baseline = NumpyVectorStore(VECTOR_INDEX_DIR, quantization=None)
+    queries = _make_queries(baseline.vectors, num_queries, noise, seed)
+    truth = _exact_top_k(baseline.vectors, queries, k)
+    row_by_id = baseline.row_by_id
+
+    results = []
+    for quantization in QUANTIZATIONS:
+        store = baseline if quantization is None else NumpyVectorStore(VECTOR_INDEX_DIR, quantization=quantization)
+        results.append(_run(f"numpy-{quantization or 'float32'}",
+                            lambda query, store=store: store.search(query, k)[0].tolist(), queries, truth, k))
+
+    if include_chroma:
+        from src.agent.registry import get_collection
+
+        collection = get_collection()
+
+        def chroma_search(query):
+            ids = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])['ids'][0]
+            return [row_by_id[chunk_id] for chunk_id in ids if chunk_id in row_by_id]
+
+        results.append(_run("chroma", chroma_search, queries, truth, k))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare recall and latency of the vector search backends.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--no-chroma", action="store_true")
+    args = parser.parse_args()
+    print(json.dumps(compare_vector_backends(args.queries, args.k, args.noise, include_chroma=not args.no_chroma),
+                     indent=2))
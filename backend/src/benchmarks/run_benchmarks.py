@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add the backend directory to the Python path so `src` imports work when run as a script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)))
+
+# Nothing from src.config may be imported at module level: main() first points HAQOOQ_DATA_DIR and
+# HAQOOQ_LLM_API_BASE at a scratch directory and the stub LLM server, and config reads them on import.
+
+
+def _peak_rss_mb(who: int) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+def _process_peak_rss_mb() -> float:
+    """
+    High-water mark of the benchmark process's RSS so far. It never goes down, so a stage's value also covers
+    every earlier stage and is not that stage's own peak.
+    """
+    return _peak_rss_mb(resource.RUSAGE_SELF)
+
+
+def _worker_peak_rss_mb() -> float:
+    """
+    Largest peak RSS of any worker process (preprocessing or embedding pool) that has exited so far, which the
+    process peak does not include. Also a high-water mark across stages.
+    """
+    return _peak_rss_mb(resource.RUSAGE_CHILDREN)
+
+
+def _latency_summary(samples: list) -> dict:
+    if not samples:
+        return {}
+    milliseconds = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+        "p95_ms": round(float(np.percentile(milliseconds, 95)), 3),
+        "p99_ms": round(float(np.percentile(milliseconds, 99)), 3),
+        "mean_ms": round(float(milliseconds.mean()), 3),
+    }
+
+
+def bench_preprocessing(raw_path: str, num_workers: int) -> dict:
+    import pandas as pd
+    from src.config import PROCESSED_CHUNKS_PATH
+    from src.data_processing.preprocess import run_preprocessing
+
+    start_time = time.perf_counter()
+    run_preprocessing(raw_path, num_workers=num_workers)
+    elapsed = time.perf_counter() - start_time
+    documents = sum(len(chunk) for chunk in pd.read_csv(raw_path, chunksize=1000, usecols=["File Name"]))
+    chunks = len(pd.read_csv(PROCESSED_CHUNKS_PATH, usecols=["chunk_length"]))
+    return {
+        "seconds": round(elapsed, 3),
+        "documents": documents,
+        "chunks": chunks,
+        "documents_per_sec": round(documents / elapsed, 2),
+        "process_peak_rss_mb": _process_peak_rss_mb(),
+        "worker_peak_rss_mb": _worker_peak_rss_mb(),
+    }
+
+
+def bench_indexing(model) -> dict:
+    from src.config import PROCESSED_CHUNKS_PATH
+    from src.data_processing.embed_and_index import generate_embeddings_and_index
+    import pandas as pd
+
+    chunks = len(pd.read_csv(PROCESSED_CHUNKS_PATH, usecols=["chunk_length"]))
+    start_time = time.perf_counter()
+    generate_embeddings_and_index(PROCESSED_CHUNKS_PATH, rebuild=True, model=model)
+    full_seconds = time.perf_counter() - start_time
+
+    # A second run with nothing changed measures the incremental sync path
+    start_time = time.perf_counter()
+    generate_embeddings_and_index(PROCESSED_CHUNKS_PATH, model=model)
+    sync_seconds = time.perf_counter() - start_time
+    return {
+        "seconds": round(full_seconds, 3),
+        "chunks": chunks,
+        "chunks_per_sec": round(chunks / full_seconds, 2),
+        "noop_sync_seconds": round(sync_seconds, 3),
+        "process_peak_rss_mb": _process_peak_rss_mb(),
+        "worker_peak_rss_mb": _worker_peak_rss_mb(),
+    }
+
+
+def bench_retrieval(queries: list) -> dict:
+    from src.agent import cache
+    from src.agent.tools import retrieve_relevant_chunks, search_legal_documents
+
+    results = {}
+    for name, search in (("retrieve_relevant_chunks", retrieve_relevant_chunks),
+                         ("legal_document_search", search_legal_documents)):
+        cache.clear_all()
+        search(queries[0])  # load models/indexes outside the timed loop
+        cache.clear_all()
+        latencies = []
+        for query in queries:
+            start_time = time.perf_counter()
+            search(query, n_results=5)
+            latencies.append(time.perf_counter() - start_time)
+        results[name] = dict(_latency_summary(latencies), queries=len(queries),
+                             queries_per_sec=round(len(queries) / sum(latencies), 2))
+    results["process_peak_rss_mb"] = _process_peak_rss_mb()
+    return results
+
+
+async def _load_test(queries: list, concurrency: int) -> dict:
+    import httpx
+    from src.api import app, get_agent
+
+    await asyncio.to_thread(get_agent)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = {}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=300) as client:
+        async def one_request(query: str):
+            async with semaphore:
+                start_time = time.perf_counter()
+                response = await client.post("/ask/", json={"query": query})
+                latencies.append(time.perf_counter() - start_time)
+                status = response.json().get("status", str(response.status_code))
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(one_request(query) for query in queries))
+        elapsed = time.perf_counter() - start_time
+
+    return dict(_latency_summary(latencies), requests=len(queries), concurrency=concurrency,
+                seconds=round(elapsed, 3), requests_per_sec=round(len(queries) / elapsed, 2), statuses=statuses)
+
+
+def bench_serving(queries: list, concurrency: int) -> dict:
+    from src.agent import cache
+
+    cache.clear_all()
+    results = asyncio.run(_load_test(queries, concurrency))
+    results["process_peak_rss_mb"] = _process_peak_rss_mb()
+    return results
+
+
+def run_benchmarks(args, llm_server, backup_llm_server=None) -> dict:
+    from src.agent import registry
+    from src.benchmarks.stubs import HashingEncoder
+    from src.benchmarks.synthetic_corpus import generate_corpus, generate_queries
+    from src.config import DATA_DIR, RAW_DATA_PATH
+
+    model = None
+    if not args.real_model:
+        model = HashingEncoder()
+        registry.register_embedding_model(model)
+
+    generate_corpus(RAW_DATA_PATH, args.documents, args.sections, seed=args.seed)
+    queries = generate_queries(max(args.queries, args.requests), seed=args.seed + 1)
+
+    report = {
+        "config": {
+            "documents": args.documents,
+            "sections_per_document": args.sections,
+            "workers": args.workers,
+            "queries": args.queries,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "llm_latency_ms": args.llm_latency_ms,
+            "backup_llm_latency_ms": args.backup_llm_latency_ms,
+            "encoder": "configured model" if args.real_model else "hashing stub",
+            "data_dir": DATA_DIR,
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": {},
+    }
+    stages = report["stages"]
+    stages["preprocessing"] = bench_preprocessing(RAW_DATA_PATH, args.workers)
+    stages["indexing"] = bench_indexing(model)
+    stages["retrieval"] = bench_retrieval(queries[:args.queries])
+    if args.requests:
+        stages["serving"] = bench_serving(queries[:args.requests], args.concurrency)
+        stages["serving"]["llm_requests"] = llm_server.requests
+        if backup_llm_server is not None:
+            stages["serving"]["backup_llm_requests"] = backup_llm_server.requests
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline end-to-end benchmarks: preprocessing, indexing, retrieval and /ask/ serving.")
+    parser.add_argument("--documents", type=int, default=50, help="Synthetic law documents to generate")
+    parser.add_argument("--sections", type=int, default=40, help="Sections per synthetic document")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Preprocessing worker processes")
+    parser.add_argument("--queries", type=int, default=200, help="Retrieval queries to time")
+    parser.add_argument("--requests", type=int, default=200, help="/ask/ requests in the load test (0 skips it)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent /ask/ clients")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="Delay of each stub LLM response")
+    parser.add_argument("--backup-llm-latency-ms", type=float,
+                        help="Add a second stub LLM backend with this delay to exercise the backend pool")
+    parser.add_argument("--real-model", action="store_true",
+                        help="Use the configured embedding model (must already be in the local cache)")
+    parser.add_argument("--data-dir", help="Scratch data directory (default: a new temporary directory)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    from src.benchmarks.stubs import StubLLMServer
+
+    with contextlib.ExitStack() as stack:
+        llm_server = stack.enter_context(StubLLMServer(latency_ms=args.llm_latency_ms))
+        backup_llm_server = None
+        os.environ["HAQOOQ_DATA_DIR"] = args.data_dir or tempfile.mkdtemp(prefix="haqooq-bench-")
+        os.environ["HAQOOQ_LLM_API_BASE"] = llm_server.base_url
+        os.environ["HAQOOQ_LLM_API_MODEL"] = "stub"
+        if args.backup_llm_latency_ms is not None:
+            backup_llm_server = stack.enter_context(StubLLMServer(latency_ms=args.backup_llm_latency_ms))
+            os.environ["HAQOOQ_LLM_BACKENDS"] = json.dumps([
+                {"name": "stub", "type": "openai", "base_url": llm_server.base_url, "model": "stub"},
+                {"name": "stub-backup", "type": "openai", "base_url": backup_llm_server.base_url, "model": "stub"},
+            ])
+        os.environ.setdefault("GROQ_API_KEY", "stub")
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        report = run_benchmarks(args, llm_server, backup_llm_server)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
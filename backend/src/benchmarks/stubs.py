@@ -0,0 +1,136 @@
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class HashingEncoder:
+    """
+    Offline stand-in for the SentenceTransformer: hashes tokens into a fixed-size normalized vector.
+    Same encode() interface, no model download, deterministic across runs.
+    """
+
+    def __init__(self, dimension: int = 1024):
+        self.dimension = dimension
+        self.device = "cpu"
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in _TOKEN_PATTERN.findall(text.lower()):
+            digest = zlib.crc32(token.encode("utf-8"))
+            vector[digest % self.dimension] += 1.0 if digest & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, **_) -> np.ndarray:
+        if isinstance(sentences, str):
+            return self._encode_one(sentences)
+        return np.stack([self._encode_one(text) for text in sentences]) if sentences \
+            else np.empty((0, self.dimension), dtype=np.float32)
+
+
+class StubLLMServer:
+    """
+    Minimal OpenAI-compatible /chat/completions server, streaming and non-streaming.
+
+    For a new question it asks for one call of the first offered tool with the question as argument; once a
+    tool result is in the conversation it answers. Each response is delayed by `latency_ms` to stand in for
+    a remote model. Use as a context manager; `base_url` is what ChatOpenAI's openai_api_base should be.
+    """
+
+    def __init__(self, latency_ms: float = 200, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency_ms / 1000
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+                server.requests += 1
+                time.sleep(server.latency)
+                message, finish_reason = server._reply(body)
+                if body.get("stream"):
+                    self._send_stream(body, message, finish_reason)
+                else:
+                    self._send_json(body, message, finish_reason)
+
+            def _send_json(self, body, message, finish_reason):
+                payload = json.dumps({
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_stream(self, body, message, finish_reason):
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.end_headers()
+                if message.get("tool_calls"):
+                    deltas = [{"role": "assistant", "content": None,
+                               "tool_calls": [dict(call, index=i) for i, call in enumerate(message["tool_calls"])]}]
+                else:
+                    words = message["content"].split(" ")
+                    deltas = [{"role": "assistant", "content": ""}] + \
+                             [{"content": word + (" " if i < len(words) - 1 else "")} for i, word in enumerate(words)]
+                for i, delta in enumerate(deltas + [{}]):
+                    chunk = {
+                        "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": body.get("model", "stub"),
+                        "choices": [{"index": 0, "delta": delta,
+                                     "finish_reason": finish_reason if i == len(deltas) else None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @staticmethod
+    def _reply(body: dict):
+        messages = body.get("messages", [])
+        tools = body.get("tools") or []
+        if tools and not any(message.get("role") == "tool" for message in messages):
+            question = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "")
+            function = tools[0]["function"]
+            argument_names = list(function.get("parameters", {}).get("properties", {})) or ["__arg1"]
+            call = {"id": "call_stub", "type": "function",
+                    "function": {"name": function["name"], "arguments": json.dumps({argument_names[0]: question})}}
+            return {"role": "assistant", "content": None, "tool_calls": [call]}, "tool_calls"
+        context = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "tool"), "")
+        answer = f"Stub answer grounded in {len(context)} characters of context. Source: Legal Document Search"
+        return {"role": "assistant", "content": answer}, "stop"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
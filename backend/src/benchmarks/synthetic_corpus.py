@@ -0,0 +1,84 @@
+import csv
+import random
+
+# Vocabulary for generated provisions; close enough to statute text to exercise cleaning, sectioning and BM25
+SUBJECTS = ["the Commission", "the Federal Government", "a Provincial Government", "the Registrar", "any person",
+            "the Court", "the Authority", "an officer", "the Board", "a company", "the tenant", "the landlord"]
+VERBS = ["shall", "may", "shall not", "may, by notification,"]
+ACTIONS = ["exercise such powers as may be prescribed", "issue directions to any department",
+           "hold an inquiry into the matter", "impose a penalty not exceeding one million rupees",
+           "register the application within thirty days", "grant bail subject to conditions",
+           "dispose of the property in the prescribed manner", "appoint such officers as it considers necessary",
+           "refer the dispute to arbitration", "prepare and publish an annual report"]
+QUALIFIERS = ["in accordance with the provisions of this Ordinance", "subject to the rules made hereunder",
+              "notwithstanding anything contained in any other law for the time being in force",
+              "with the prior approval of the Federal Government", "after giving an opportunity of being heard",
+              "within the period specified in the notice"]
+TITLES = ["Short title, extent and commencement", "Definitions", "Establishment of the Commission",
+          "Functions and powers", "Appointment of officers", "Penalties", "Appeals", "Power to make rules",
+          "Repeal and savings", "Offences by companies", "Procedure for registration", "Indemnity"]
+LAW_KINDS = ["Ordinance", "Act", "Order", "Regulations"]
+LAW_SUBJECTS = ["Privatisation Commission", "Companies", "Rent Restriction", "Penal Code", "Banking Companies",
+                "Anti-Terrorism", "Income Tax", "Securities and Exchange", "Family Courts", "Arbitration"]
+
+
+def _sentence(rng: random.Random) -> str:
+    return f"{rng.choice(SUBJECTS).capitalize()} {rng.choice(VERBS)} {rng.choice(ACTIONS)} {rng.choice(QUALIFIERS)}."
+
+
+def generate_document(rng: random.Random, sections: int, sentences_per_section: int) -> str:
+    """One raw law document: page artifacts, a CONTENTS block, then PART/CHAPTER headings and numbered sections."""
+    lines = [f"Page 1 of {sections // 4 + 1}", "Updated till 01.01.2024", "CONTENTS"]
+    lines += [f"{i}. {rng.choice(TITLES)}" for i in range(1, min(sections, 10) + 1)]
+    for number in range(1, sections + 1):
+        if number % 12 == 1:
+            lines.append(f"PART {_roman(number // 12 + 1)}— {rng.choice(TITLES).upper()}")
+        if number % 6 == 1:
+            lines.append(f"CHAPTER {_roman(number // 6 + 1)}")
+        lines.append(f"{number}. {rng.choice(TITLES)}.— " + " ".join(
+            _sentence(rng) for _ in range(rng.randint(1, sentences_per_section))))
+        if number % 8 == 0:
+            lines.append(f"Page {number // 8 + 1} of {sections // 4 + 1}")
+    return "\n".join(lines)
+
+
+def _roman(number: int) -> str:
+    numerals = [(10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")]
+    result = ""
+    for value, numeral in numerals:
+        while number >= value:
+            result += numeral
+            number -= value
+    return result
+
+
+def generate_corpus(path: str, num_documents: int = 100, sections_per_document: int = 40,
+                    sentences_per_section: int = 12, seed: int = 0) -> list[str]:
+    """
+    Writes a CSV with the 'File Name' and 'Content' columns of pakistan_laws_raw.csv.
+    Returns the generated file names. The same arguments always produce the same corpus.
+    """
+    rng = random.Random(seed)
+    file_names = []
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["File Name", "Content"])
+        for i in range(num_documents):
+            file_name = f"The {rng.choice(LAW_SUBJECTS)} {rng.choice(LAW_KINDS)}, {1950 + i % 75} ({i}).pdf"
+            writer.writerow([file_name, generate_document(rng, sections_per_document, sentences_per_section)])
+            file_names.append(file_name)
+    return file_names
+
+
+def generate_queries(num_queries: int, seed: int = 1) -> list[str]:
+    """Legal-style questions over the synthetic vocabulary, a few citing a section number."""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(num_queries):
+        if i % 5 == 0:
+            queries.append(f"What does section {rng.randint(1, 40)} of the {rng.choice(LAW_SUBJECTS)} "
+                           f"{rng.choice(LAW_KINDS)} say? ({i})")
+        else:
+            queries.append(f"When {rng.choice(VERBS)} {rng.choice(SUBJECTS)} {rng.choice(ACTIONS)} "
+                           f"under the {rng.choice(LAW_SUBJECTS)} {rng.choice(LAW_KINDS)}? ({i})")
+    return queries
@@ -1,29 +1,146 @@
+import json
 import os
 
 # --- Project Paths ---
 # Assuming this file is in src/ and data/ is in the parent directory
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
-DATA_DIR = os.path.join(PROJECT_ROOT, "data")
+DATA_DIR = os.getenv("HAQOOQ_DATA_DIR", os.path.join(PROJECT_ROOT, "data"))  # Overridable, e.g. by benchmarks
 
 # Data file paths
 RAW_DATA_PATH = os.path.join(DATA_DIR, "pakistan_laws_raw.csv")
 SECTIONED_DATA_PATH = os.path.join(DATA_DIR, "pakistan_laws_sectioned.csv")  # Not explicitly saved, but good to have
 SEMANTIC_SECTIONS_PATH = os.path.join(DATA_DIR, "pakistan_laws_semantic_sections.csv")
 PROCESSED_CHUNKS_PATH = os.path.join(DATA_DIR, "pakistan_laws_chunks.csv")
-EMBEDDED_CHUNKS_PATH = os.path.join(DATA_DIR, "pakistan_laws_chunks_with_embeddings.csv")
+# Embedded chunks are stored as a binary matrix plus a Parquet metadata file; row i of one matches row i of the other
+EMBEDDED_CHUNKS_PATH = os.path.join(DATA_DIR, "pakistan_laws_chunks_with_embeddings.parquet")
+EMBEDDINGS_MATRIX_PATH = os.path.join(DATA_DIR, "pakistan_laws_chunk_embeddings.npy")
+EMBEDDINGS_DTYPE = "float32"  # "float16" halves the file size at a small precision cost
+PIPELINE_MANIFEST_DIR = os.path.join(DATA_DIR, "manifests")  # Per-stage input hashes and config of the build
 
 # ChromaDB path
 VECTOR_DB_DIR = os.path.join(DATA_DIR, "chroma_db")
 COLLECTION_NAME = "pakistan_laws_chunks_collection"
+INDEX_VERSION_PATH = os.path.join(VECTOR_DB_DIR, "index_version")  # Touched after every index sync
+LEXICAL_INDEX_PATH = os.path.join(VECTOR_DB_DIR, "lexical_index.npz")  # BM25 index built alongside ChromaDB
+VECTOR_INDEX_DIR = os.path.join(VECTOR_DB_DIR, "numpy_index")  # Memory-mapped local vector index
+DOCUMENT_INDEX_PATH = os.path.join(VECTOR_DB_DIR, "document_index.npz")  # Per-law centroids for routing
+
+# --- Vector Search Backend ---
+# "chroma" or "numpy" (memory-mapped brute-force search over VECTOR_INDEX_DIR, shared by pre-forked workers)
+VECTOR_BACKEND = os.getenv("HAQOOQ_VECTOR_BACKEND", "chroma")
+VECTOR_INDEX_QUANTIZATION = "int8"  # numpy backend only: None (float32), "float16" or "int8"
+VECTOR_INDEX_RESCORE_FACTOR = 10  # Quantized search rescores this many candidates per result at float32
 
 # --- Model Configuration ---
 EMBEDDING_MODEL_NAME = "BAAI/bge-large-en-v1.5"
+QUERY_ENCODER_BACKEND = "torch"  # "torch" (SentenceTransformer) or "onnx" (onnxruntime, CPU) for query encoding
+ONNX_MODEL_DIR = os.path.join(DATA_DIR, "onnx")  # Exported query encoders are cached here
+ONNX_QUANTIZE = True  # Also export a dynamically int8-quantized model and prefer it
+ONNX_MIN_COSINE_AGREEMENT = 0.99  # ONNX query vectors must match the original model at least this closely
 LLM_MODEL_NAME = "qwen3:1.7b"  # Or "qwen2:7b-instruct" if you download it later
 
+# OpenAI-compatible endpoint used by the agent; overridable so benchmarks can point it at a local stub server
+LLM_API_BASE = os.getenv("HAQOOQ_LLM_API_BASE", "https://api.groq.com/openai/v1")
+LLM_API_MODEL = os.getenv("HAQOOQ_LLM_API_MODEL", "openai/gpt-oss-20b")
+OLLAMA_BASE_URL = os.getenv("HAQOOQ_OLLAMA_BASE_URL")  # e.g. http://localhost:11434 to add LLM_MODEL_NAME as a fallback
+
+# --- LLM Backend Pool ---
+# Backends the agent's LLM calls are spread over. "openai" entries are OpenAI-compatible APIs, "ollama" a local
+# Ollama server. Fallback backends only take over on failover or hedging, never as the first choice.
+# HAQOOQ_LLM_BACKENDS (a JSON list of the same dicts) replaces the list, e.g. to point benchmarks at stub servers.
+LLM_BACKENDS = json.loads(os.getenv("HAQOOQ_LLM_BACKENDS", "null")) or [
+    {"name": "remote", "type": "openai", "base_url": LLM_API_BASE, "model": LLM_API_MODEL,
+     "api_key_env": "GROQ_API_KEY"},
+] + ([{"name": "ollama", "type": "ollama", "base_url": OLLAMA_BASE_URL, "model": LLM_MODEL_NAME, "fallback": True}]
+     if OLLAMA_BASE_URL else [])
+LLM_LOAD_BALANCING = "latency"  # "latency" (lowest recent latency x in-flight first) or "priority" (list order)
+LLM_HEDGING_ENABLED = True  # Send the request to a second backend too if the first has not answered in time
+LLM_HEDGE_DELAY_SECONDS = None  # Fixed hedge delay; None uses the first backend's recent p95 latency
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = 3.0  # Hedge delay while a backend has fewer than LLM_LATENCY_MIN_SAMPLES samples
+LLM_LATENCY_MIN_SAMPLES = 20
+LLM_MAX_ATTEMPTS = 3  # Backends tried per call (first choice, hedge and failovers together)
+LLM_CIRCUIT_FAILURE_THRESHOLD = 3  # Consecutive failures that open a backend's circuit
+LLM_CIRCUIT_RESET_SECONDS = 30  # After this long an open circuit lets one trial request through
+LLM_REQUEST_TIMEOUT_SECONDS = 60
+LLM_MAX_CONNECTIONS = 64  # Shared HTTP connection pool for the OpenAI-compatible backends
+LLM_MAX_KEEPALIVE_CONNECTIONS = 32
+
+# --- Serving ---
+WARMUP_ON_STARTUP = True  # Load models in a background thread at startup; False loads them on the first request
+MAX_CONCURRENT_AGENT_RUNS = 32  # Agent invocations allowed in flight at once on the async /ask/ path
+QUERY_BATCH_MAX_SIZE = 64  # Queries encoded together by the micro-batcher
+QUERY_BATCH_MAX_WAIT_MS = 5  # How long the micro-batcher waits for more queries after the first
+BATCH_MAX_QUESTIONS = 1000  # Largest question list accepted by /ask/batch
+BATCH_MAX_CONCURRENCY = 16  # Agent runs in flight at once for one batch (also capped by MAX_CONCURRENT_AGENT_RUNS)
+
+# --- Pre-forked Workers (src/serve.py) ---
+SERVE_HOST = os.getenv("HAQOOQ_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("HAQOOQ_PORT", "7860"))
+SERVE_WORKERS = int(os.getenv("HAQOOQ_WORKERS", "0"))  # Worker processes; 0 = one per core the process may use
+SERVE_TORCH_THREADS_PER_WORKER = None  # torch intra-op threads per worker; None splits the cores between workers
+SERVE_BACKLOG = 2048  # Listen backlog of the socket shared by the workers
+# Prometheus multiprocess mode: each worker writes its metrics here and /metrics aggregates them
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", os.path.join(DATA_DIR, "prometheus"))
+
+# --- Hybrid Retrieval ---
+LEXICAL_SEARCH_ENABLED = True  # Citation fast path + BM25/dense fusion in legal_document_search
+RRF_K = 60  # Reciprocal-rank-fusion constant
+HYBRID_CANDIDATES = 20  # Candidates taken from each of the dense and BM25 rankings before fusion
+DOCUMENT_ROUTING_ENABLED = True  # Dense search only within the laws whose centroids are closest to the query
+ROUTING_TOP_DOCUMENTS = 5  # Laws searched per routed query; too few results falls back to the full collection
+
+# --- Context assembly (legal_document_search output) ---
+SEARCH_RESULTS_PER_TOOL_CALL = 5  # Chunks retrieved per legal_document_search call
+CONTEXT_TOKEN_BUDGET = 1500  # Most tokens of retrieved text handed to the LLM per tool call
+CONTEXT_TOKENIZER = "o200k_base"  # tiktoken encoding used to measure the budget
+
+# --- Fast Path (pre-router in front of the tool-calling agent) ---
+FAST_PATH_ENABLED = True  # Clear legal questions: retrieval + one LLM call instead of the tool-calling agent
+ROUTER_LEGAL_MARGIN = 0.03  # Legal-vs-off-topic prototype similarity margin needed to take the fast path
+ROUTER_OFF_TOPIC_MARGIN = 0.05  # Margin the other way needed to decline
+ROUTER_MIN_CORPUS_SIMILARITY = 0.55  # Cosine to the nearest law centroid above which a query counts as in-corpus
+ROUTER_MIN_LEXICAL_COVERAGE = 0.6  # Or: share of the query's terms found in the BM25 vocabulary
+ROUTER_DECLINE_ENABLED = False  # Decline off-topic questions without the agent; enable only once calibrate_router passes
+
+# --- Web Search Tool ---
+WEB_SEARCH_BACKEND_URL = None  # None uses DuckDuckGo; a URL (e.g. a local stub server) is called as GET <url>?q=<query>
+WEB_SEARCH_TIMEOUT_SECONDS = 8  # Hard budget for one web_search call, including time queued behind other searches
+WEB_SEARCH_MAX_CONCURRENCY = 4
+WEB_SEARCH_CACHE_PATH = os.path.join(DATA_DIR, "web_search_cache.sqlite")
+WEB_SEARCH_CACHE_TTL_SECONDS = 6 * 60 * 60
+
+# --- Caching (for /ask/) ---
+# In-process LRU caches: under src.serve every worker keeps its own, so their hit rates drop with more workers
+CACHE_TTL_SECONDS = 60 * 60
+QUERY_EMBEDDING_CACHE_SIZE = 4096
+RETRIEVAL_CACHE_SIZE = 2048
+ANSWER_CACHE_SIZE = 1024
+ANSWER_CACHE_SIMILARITY_THRESHOLD = None  # e.g. 0.97 to also serve answers for near-identical questions
+INDEX_VERSION_CHECK_INTERVAL = 5  # Seconds between checks of INDEX_VERSION_PATH
+
+# --- Observability ---
+TRACE_LOGGING_ENABLED = True  # One JSON log line per agent run (timings, tokens, tool calls) on the haqooq.trace logger
+
 # --- Chunking Parameters ---
 CHUNK_SIZE = 1500
 CHUNK_OVERLAP = 150
 
+# --- Preprocessing ---
+PREPROCESS_NUM_WORKERS = os.cpu_count() or 1  # Worker processes for clean -> section -> split; 1 runs in-process
+PREPROCESS_READ_CHUNKSIZE = 200  # Raw documents read from the CSV (and held in memory) at a time
+PREPROCESS_TASK_CHUNKSIZE = 4  # Documents handed to a worker per task
+CHUNKING_READ_CHUNKSIZE = 20000  # Sections read at a time when re-chunking the sections CSV on its own
+CHUNKING_TASK_SECTIONS = 500  # Sections handed to a worker per task when re-chunking
+
+# --- Duplicate Chunks ---
+CHUNK_DEDUP_ENABLED = True  # Collapse chunks with identical normalized text into one listing all their laws
+
+# --- Embedding Engine ---
+EMBEDDING_BATCH_SIZE = 32  # Chunks encoded per model.encode call
+EMBEDDING_NUM_WORKERS = 1  # Worker processes, each with its own model; 1 encodes in-process
+EMBEDDING_MAX_IN_FLIGHT = 4  # Pending batches per worker, bounds peak memory
+CHROMA_ADD_BATCH_SIZE = 500
+
 # Ensure data directories exist
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(VECTOR_DB_DIR, exist_ok=True)
@@ -0,0 +1,110 @@
+import json
+import os
+import re
+
+import pandas as pd
+import xxhash
+from tqdm import tqdm
+
+from src.config import PROCESSED_CHUNKS_PATH, CHUNKING_READ_CHUNKSIZE, CHUNKING_TASK_SECTIONS
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+SOURCE_KEY_PREFIX = "in_source_"
+
+
+def normalize_text(text) -> str:
+    """Lowercased words of the text: chunks that differ only in case, spacing or punctuation normalize equal."""
+    return " ".join(WORD_PATTERN.findall(text.lower())) if isinstance(text, str) else ""
+
+
+def chunk_source_files(source_file, sources) -> list:
+    """Every law a chunk stands for: the JSON `sources` list of a collapsed chunk, else just its source_file."""
+    if isinstance(sources, str) and sources:
+        return json.loads(sources)
+    return [source_file if isinstance(source_file, str) else ""]
+
+
+def chunks_source_files(chunks_df) -> list:
+    """chunk_source_files for every row of a chunks DataFrame (which lacks `sources` if written before dedup)."""
+    sources = chunks_df['sources'] if 'sources' in chunks_df.columns else [""] * len(chunks_df)
+    return [chunk_source_files(source_file, row_sources)
+            for source_file, row_sources in zip(chunks_df['source_file'], sources)]
+
+
+def source_key(source_file: str) -> str:
+    """Boolean chunk metadata key marking a chunk as part of `source_file`, so Chroma can filter on every law
+    a collapsed chunk stands for (metadata values cannot be lists)."""
+    return SOURCE_KEY_PREFIX + xxhash.xxh64_hexdigest(source_file.encode("utf-8"))
+
+
+def text_hash(text) -> int:
+    """64-bit hash of the normalized text: chunks with equal hashes are collapsed into one."""
+    return xxhash.xxh3_64_intdigest(normalize_text(text).encode("utf-8"))
+
+
+# --- Hashes are computed in the preprocessing worker processes ---
+def chunk_text_hashes(texts: list) -> list:
+    return [text_hash(text) for text in texts]
+
+
+def _read_chunks(chunks_path: str, columns: list = None):
+    """The chunks CSV in pieces, every value read as a string so rewritten rows keep their exact text."""
+    try:
+        yield from pd.read_csv(chunks_path, chunksize=CHUNKING_READ_CHUNKSIZE, usecols=columns, dtype=str,
+                               keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return
+
+
+def deduplicate_chunks(chunks_path: str = PROCESSED_CHUNKS_PATH, pool=None) -> dict:
+    """
+    Collapses repeated chunks of the chunks CSV (e.g. the same provision in an amended and a re-issued law)
+    into the first occurrence, which gets a `sources` column: the JSON list of every source_file it stands for.
+    Only chunks whose normalized text is identical are collapsed, found by hash (computed on `pool` if given):
+    similar chunks that differ (an amended number or word) are kept, since either law's wording may be the
+    one asked about. The file is rewritten only if something was collapsed.
+    """
+    print(f"Removing duplicate chunks (identical normalized text) from {chunks_path}...")
+    first_row = {}  # text hash -> row of the first chunk with that text
+    canonical_of = {}  # row of a collapsed chunk -> row of the chunk kept in its place
+    sources = {}  # kept row -> distinct source files, its own first
+    row = 0
+    with tqdm(desc="Duplicate detection", unit="chunk") as progress:
+        for chunks_df in _read_chunks(chunks_path, ['source_file', 'chunk_content']):
+            texts = chunks_df['chunk_content'].tolist()
+            batches = [texts[i:i + CHUNKING_TASK_SECTIONS] for i in range(0, len(texts), CHUNKING_TASK_SECTIONS)]
+            hashes = pool.imap(chunk_text_hashes, batches) if pool else map(chunk_text_hashes, batches)
+            source_files = iter(chunks_df['source_file'].tolist())
+            for batch_hashes in hashes:
+                for chunk_hash in batch_hashes:
+                    source_file = next(source_files)
+                    canonical = first_row.setdefault(chunk_hash, row)
+                    if canonical == row:
+                        sources[row] = [source_file]
+                    else:
+                        canonical_of[row] = canonical
+                        if source_file not in sources[canonical]:
+                            sources[canonical].append(source_file)
+                    row += 1
+                progress.update(len(batch_hashes))
+
+    if not canonical_of:
+        print(f"No duplicates among {row} chunks.")
+        return {"chunks": row, "removed": 0}
+
+    tmp_path = f"{chunks_path}.tmp"
+    start = 0
+    for part, chunks_df in enumerate(_read_chunks(chunks_path)):
+        rows = range(start, start + len(chunks_df))
+        start += len(chunks_df)
+        keep = [r not in canonical_of for r in rows]
+        chunks_df = chunks_df[keep].assign(sources=[json.dumps(sources[r], ensure_ascii=False)
+                                                    if len(sources[r]) > 1 else ""
+                                                    for r, kept in zip(rows, keep) if kept])
+        chunks_df.to_csv(tmp_path, mode='w' if part == 0 else 'a', header=part == 0, index=False)
+    os.replace(tmp_path, chunks_path)
+
+    multi_source = sum(len(row_sources) > 1 for row_sources in sources.values())
+    print(f"Collapsed {len(canonical_of)} duplicate chunks: {row} -> {row - len(canonical_of)} chunks, "
+          f"{multi_source} of them shared by several laws.")
+    return {"chunks": row, "removed": len(canonical_of), "multi_source": multi_source}
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.config import DOCUMENT_INDEX_PATH
+from src.data_processing.dedup import chunks_source_files
+from src.data_processing.vector_index import normalize_rows
+
+
+def build_document_index(chunks_df: pd.DataFrame, embeddings: np.ndarray, path: str = DOCUMENT_INDEX_PATH):
+    """
+    Builds the document-level routing index: one centroid per source_file, the normalized mean of its
+    normalized chunk embeddings, saved with the source names and chunk counts as a single .npz.
+    A collapsed duplicate chunk counts towards every law in its `sources`.
+    """
+    vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    source_lists = chunks_source_files(chunks_df)
+    chunk_rows = np.asarray([row for row, names in enumerate(source_lists) for _ in names], dtype=np.int64)
+    source_codes, source_names = pd.factorize(pd.Series([name for names in source_lists for name in names],
+                                                        dtype=object), sort=True)
+    centroids = np.zeros((len(source_names), vectors.shape[1]), dtype=np.float32)
+    np.add.at(centroids, source_codes, vectors[chunk_rows])
+    chunk_counts = np.bincount(source_codes, minlength=len(source_names))
+
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, source_names=np.asarray(source_names, dtype=str), centroids=normalize_rows(centroids),
+             chunk_counts=chunk_counts.astype(np.int64))
+    os.replace(tmp_path, path)
+    print(f"Document routing index with {len(source_names)} laws saved to {path}")
+
+
+class DocumentIndex:
+    """Per-law centroid embeddings used to pick the few laws a question is most likely about."""
+
+    def __init__(self, arrays):
+        self.source_names = arrays['source_names']
+        self.centroids = arrays['centroids']
+        self.chunk_counts = arrays['chunk_counts']
+        self.num_sources = len(self.source_names)
+
+    @classmethod
+    def load(cls, path: str = DOCUMENT_INDEX_PATH):
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    def route(self, query_embedding, k: int) -> list[tuple[str, float]]:
+        """Top-k (source_file, cosine similarity) by similarity of the query to each law's centroid."""
+        if not self.num_sources or k <= 0:
+            return []
+        query_vector = normalize_rows(np.asarray(query_embedding, dtype=np.float32)[None, :])[0]
+        scores = self.centroids @ query_vector
+        k = min(k, self.num_sources)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(str(self.source_names[i]), float(scores[i])) for i in top]
@@ -1,20 +1,130 @@
+import time
+
+import numpy as np
 import pandas as pd
+import xxhash
 import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
-import torch
-import os
-import json
+from chromadb.utils import embedding_functions
 
 # Import constants from config.py
-from src.config import EMBEDDED_CHUNKS_PATH, VECTOR_DB_DIR, COLLECTION_NAME, EMBEDDING_MODEL_NAME, PROCESSED_CHUNKS_PATH
+from src.config import (VECTOR_DB_DIR, INDEX_VERSION_PATH, COLLECTION_NAME, EMBEDDING_MODEL_NAME,
+                        PROCESSED_CHUNKS_PATH, EMBEDDING_NUM_WORKERS, CHROMA_ADD_BATCH_SIZE)
+from src.data_processing.embedding_engine import get_device, load_embedding_model, iter_embedding_batches
+from src.data_processing.embedding_store import load_embedded_chunks, save_embedded_chunks
+from src.data_processing.lexical_index import build_lexical_index
+from src.data_processing.vector_index import build_vector_index
+from src.data_processing.document_index import build_document_index
+from src.data_processing.dedup import chunks_source_files, source_key
+
+# `sources` (every law a deduplicated chunk appears in) is absent from chunk files written before deduplication
+CHUNK_METADATA_COLUMNS = ['source_file', 'section_title', 'chunk_length', 'start_index_in_section', 'sources']
+
+
+def make_chunk_id(source_file: str, chunk_content: str, occurrence: int = 0) -> str:
+    """
+    Stable chunk ID derived from the chunk's source and content.
+    `occurrence` disambiguates identical chunks repeated within the same source file.
+    """
+    key = f"{source_file}\x1f{chunk_content}\x1f{occurrence}"
+    return xxhash.xxh3_128_hexdigest(key.encode("utf-8"))
+
+
+def assign_chunk_ids(chunks_df: pd.DataFrame) -> list[str]:
+    seen = {}
+    ids = []
+    for source_file, chunk_content in zip(chunks_df['source_file'].fillna("").astype(str),
+                                          chunks_df['chunk_content'].fillna("").astype(str)):
+        key = (source_file, chunk_content)
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        ids.append(make_chunk_id(source_file, chunk_content, occurrence))
+    return ids
+
+
+def chunk_metadatas(chunks_df: pd.DataFrame) -> list[dict]:
+    """ChromaDB metadata per chunk: CHUNK_METADATA_COLUMNS plus a True flag (source_key) for every law it is in."""
+    metadatas = chunks_df.reindex(columns=CHUNK_METADATA_COLUMNS).fillna("").to_dict(orient='records')
+    for metadata, source_files in zip(metadatas, chunks_source_files(chunks_df)):
+        metadata.update((source_key(source_file), True) for source_file in source_files)
+    return metadatas
+
+
+def _get_indexed_metadatas(collection) -> dict:
+    """Returns {chunk_id: metadata} for everything currently in the collection, read page by page."""
+    indexed = {}
+    offset = 0
+    while True:
+        page = collection.get(include=['metadatas'], limit=CHROMA_ADD_BATCH_SIZE, offset=offset)
+        if not page['ids']:
+            break
+        indexed.update(zip(page['ids'], page['metadatas']))
+        offset += len(page['ids'])
+    return indexed
+
+
+def _get_indexed_embeddings(collection, chunk_ids: list) -> np.ndarray:
+    """
+    Fetches stored embeddings for chunk_ids, returned in the same order.
+    Rows are taken from the memory-mapped embeddings artifact where possible and from ChromaDB otherwise.
+    """
+    vectors = {}
+    stored_df, stored_embeddings = load_embedded_chunks()
+    if stored_df is not None and 'chunk_id' in stored_df.columns:
+        stored_rows = dict(zip(stored_df['chunk_id'], range(len(stored_df))))
+        for chunk_id in chunk_ids:
+            row = stored_rows.get(chunk_id)
+            if row is not None:
+                vectors[chunk_id] = stored_embeddings[row]
+
+    missing_ids = [chunk_id for chunk_id in chunk_ids if chunk_id not in vectors]
+    for i in tqdm(range(0, len(missing_ids), CHROMA_ADD_BATCH_SIZE), desc="Loading stored embeddings"):
+        page = collection.get(ids=missing_ids[i:i + CHROMA_ADD_BATCH_SIZE], include=['embeddings'])
+        vectors.update(zip(page['ids'], page['embeddings']))
+    return np.asarray([vectors[chunk_id] for chunk_id in chunk_ids], dtype=np.float32)
+
 
-# Ensure tqdm works with pandas
-tqdm.pandas()
+def _add_to_collection(collection, ids, documents, metadatas, batch_indices, batch_vectors):
+    vectors = np.concatenate(batch_vectors)
+    collection.add(
+        ids=[ids[i] for i in batch_indices],
+        documents=[documents[i] for i in batch_indices],
+        metadatas=[metadatas[i] for i in batch_indices],
+        embeddings=vectors
+    )
 
 
-def generate_embeddings_and_index(input_chunks_path: str):
+def bump_index_version():
+    """Lets serving processes know that cached retrieval results are stale."""
+    with open(INDEX_VERSION_PATH, "w") as f:
+        f.write(f"{time.time()}\n")
+
+
+def build_search_indexes(chunks_df: pd.DataFrame, embeddings: np.ndarray):
+    """
+    Builds the indexes derived from the embedded chunks (which must carry their `chunk_id`s) and bumps
+    INDEX_VERSION_PATH so serving processes drop cached retrieval results.
+    """
+    ids = chunks_df['chunk_id'].tolist()
+    # BM25 index over the same chunks, for citation lookups and hybrid search
+    build_lexical_index(chunks_df, ids)
+    # Memory-mapped local vector index, used when VECTOR_BACKEND = "numpy"
+    build_vector_index(chunks_df, ids, embeddings)
+    # Per-law centroids, so queries can be routed to a few laws before the chunk search
+    build_document_index(chunks_df, embeddings)
+
+    bump_index_version()
+
+
+def generate_embeddings_and_index(input_chunks_path: str, rebuild: bool = False, model=None,
+                                  build_indexes: bool = True):
+    """
+    Syncs the ChromaDB collection with the chunks CSV.
+    Chunk IDs are content-addressed, so only new chunks are embedded, chunks whose metadata changed are
+    updated in place, and chunks no longer in the CSV are deleted. Pass rebuild=True to re-embed everything.
+    An already-loaded `model` is used in-process instead of loading EMBEDDING_MODEL_NAME.
+    build_indexes=False leaves the BM25, numpy and routing indexes to a separate build_search_indexes call.
+    """
     print(f"Starting embedding generation and indexing for {input_chunks_path}...")
 
     # Load the processed chunks
@@ -28,44 +138,25 @@ def generate_embeddings_and_index(input_chunks_path: str):
         print(f"An error occurred while loading the CSV: {e}")
         return
 
-    # Load the embedding model
-    model = SentenceTransformer("BAAI/bge-large-en-v1.5")
-    try:
-        model = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cuda' if torch.cuda.is_available() else 'cpu')
-        print(f"Embedding model '{EMBEDDING_MODEL_NAME}' loaded successfully on {model.device}.")
-    except Exception as e:
-        print(f"Error loading embedding model: {e}")
-        print("Please ensure you have an active internet connection to download the model.")
-        print("If using a GPU, ensure CUDA is properly installed and PyTorch is configured for it.")
-        print("Attempting to load a smaller fallback model: all-MiniLM-L6-v2")
-        EMBEDDING_MODEL_NAME_FALLBACK = "sentence-transformers/all-MiniLM-L6-v2"
-        try:
-            model = SentenceTransformer(EMBEDDING_MODEL_NAME_FALLBACK,
-                                        device='cuda' if torch.cuda.is_available() else 'cpu')
-            print(f"Loaded fallback model: {EMBEDDING_MODEL_NAME_FALLBACK}")
-        except Exception as e_fallback:
-            print(f"Failed to load fallback model: {e_fallback}. Cannot proceed with embeddings.")
-            return
-
-    # Generate embeddings
-    print(f"Generating embeddings for {len(chunks_df)} chunks...")
-    chunks_df['embedding'] = chunks_df['chunk_content'].progress_apply(lambda x: model.encode(x).tolist())
-    print("Embeddings generated successfully!")
-
-    # Save chunks with embeddings (optional, but good for debugging/reloading)
-    chunks_df.to_csv(EMBEDDED_CHUNKS_PATH, index=False)
-    print(f"Chunks with embeddings saved to {EMBEDDED_CHUNKS_PATH}")
+    # The embedding model is only loaded once we know there are new chunks to embed
+    device = get_device()
 
     # Initialize ChromaDB client
     print(f"Initializing ChromaDB client at: {VECTOR_DB_DIR}")
     client = chromadb.PersistentClient(path=VECTOR_DB_DIR)
+    if rebuild and COLLECTION_NAME in [c.name for c in client.list_collections()]:
+        print(f"Rebuild requested: deleting existing collection '{COLLECTION_NAME}'.")
+        client.delete_collection(COLLECTION_NAME)
 
     # Create or Get a Collection
     try:
         # Use the same embedding function that was used to generate embeddings
+        if model is not None:
+            # Reuse the caller's model rather than letting the embedding function load another copy
+            embedding_functions.SentenceTransformerEmbeddingFunction.models[EMBEDDING_MODEL_NAME] = model
         embedding_function_for_chroma = embedding_functions.SentenceTransformerEmbeddingFunction(
             model_name=EMBEDDING_MODEL_NAME,  # Use original model name for consistency
-            device=model.device  # Use the device the model loaded on
+            device=device
         )
         collection = client.get_or_create_collection(
             name=COLLECTION_NAME,
@@ -79,31 +170,86 @@ def generate_embeddings_and_index(input_chunks_path: str):
         return
 
     # Prepare Data for ChromaDB
-    ids = [f"chunk_{i}" for i in range(len(chunks_df))]
-    documents = chunks_df['chunk_content'].tolist()
-    metadatas = chunks_df[['source_file', 'section_title', 'chunk_length', 'start_index_in_section']].to_dict(
-        orient='records')
-    embeddings = chunks_df['embedding'].tolist()
-
-    # Add Embeddings to the Collection in batches
-    if collection.count() == len(ids):
-        print("All chunks already appear to be in the collection. Skipping add operation.")
+    ids = assign_chunk_ids(chunks_df)
+    documents = chunks_df['chunk_content'].fillna("").astype(str).tolist()
+    metadatas = chunk_metadatas(chunks_df)
+
+    # Diff the chunks against what is already indexed
+    indexed_metadatas = {} if rebuild else _get_indexed_metadatas(collection)
+    new_positions = [i for i, chunk_id in enumerate(ids) if chunk_id not in indexed_metadatas]
+    changed_positions = [i for i, chunk_id in enumerate(ids)
+                         if chunk_id in indexed_metadatas and indexed_metadatas[chunk_id] != metadatas[i]]
+    removed_ids = list(indexed_metadatas.keys() - set(ids))
+    print(f"Sync plan: {len(new_positions)} new, {len(changed_positions)} changed, "
+          f"{len(removed_ids)} removed, {len(ids) - len(new_positions) - len(changed_positions)} unchanged chunks.")
+
+    # Reuse the stored embeddings of chunks that are already indexed
+    embeddings = None
+    kept_positions = [i for i, chunk_id in enumerate(ids) if chunk_id in indexed_metadatas]
+    if kept_positions:
+        kept_embeddings = _get_indexed_embeddings(collection, [ids[i] for i in kept_positions])
+        embeddings = np.empty((len(ids), kept_embeddings.shape[1]), dtype=np.float32)
+        embeddings[kept_positions] = kept_embeddings
+
+    # Generate embeddings for new chunks only, streaming each finished batch into ChromaDB
+    if new_positions:
+        print(f"Generating embeddings for {len(new_positions)} new chunks...")
+        if model is None and EMBEDDING_NUM_WORKERS <= 1:
+            model = load_embedding_model(EMBEDDING_MODEL_NAME, device)
+            if model is None:
+                return
+        new_documents = [documents[i] for i in new_positions]
+        pending_positions = []
+        pending_vectors = []
+        num_workers = 1 if model is not None else EMBEDDING_NUM_WORKERS
+        for batch_indices, batch_vectors in iter_embedding_batches(new_documents, model=model, device=device,
+                                                                   num_workers=num_workers):
+            if embeddings is None:
+                embeddings = np.empty((len(ids), batch_vectors.shape[1]), dtype=np.float32)
+            batch_positions = [new_positions[i] for i in batch_indices]
+            embeddings[batch_positions] = batch_vectors
+            pending_positions.extend(batch_positions)
+            pending_vectors.append(batch_vectors)
+            if len(pending_positions) >= CHROMA_ADD_BATCH_SIZE:
+                _add_to_collection(collection, ids, documents, metadatas, pending_positions, pending_vectors)
+                pending_positions, pending_vectors = [], []
+        if pending_positions:
+            _add_to_collection(collection, ids, documents, metadatas, pending_positions, pending_vectors)
+        print(f"{len(new_positions)} new chunks embedded and added to ChromaDB!")
     else:
-        print(f"Adding {len(ids)} chunks to the ChromaDB collection. This might take a moment...")
-        BATCH_SIZE = 500
-        for i in tqdm(range(0, len(ids), BATCH_SIZE), desc="Adding chunks to ChromaDB"):
-            batch_ids = ids[i:i + BATCH_SIZE]
-            batch_documents = documents[i:i + BATCH_SIZE]
-            batch_metadatas = metadatas[i:i + BATCH_SIZE]
-            batch_embeddings = embeddings[i:i + BATCH_SIZE]
-
-            collection.add(
-                ids=batch_ids,
-                documents=batch_documents,
-                metadatas=batch_metadatas,
-                embeddings=batch_embeddings
+        print("No new chunks to embed.")
+
+    # Deletes and metadata updates only run once the new chunks are in, so a failed embedding run never
+    # leaves the collection with chunks removed but their replacements missing
+    if removed_ids:
+        for i in tqdm(range(0, len(removed_ids), CHROMA_ADD_BATCH_SIZE), desc="Deleting removed chunks"):
+            collection.delete(ids=removed_ids[i:i + CHROMA_ADD_BATCH_SIZE])
+    if changed_positions:
+        # Same content under the same source, so the stored embedding is still valid
+        for i in tqdm(range(0, len(changed_positions), CHROMA_ADD_BATCH_SIZE), desc="Updating changed chunks"):
+            batch_positions = changed_positions[i:i + CHROMA_ADD_BATCH_SIZE]
+            collection.update(
+                ids=[ids[p] for p in batch_positions],
+                # Updates merge into the stored metadata; None deletes the flags of laws a chunk no longer has
+                metadatas=[{**dict.fromkeys(indexed_metadatas[ids[p]]), **metadatas[p]} for p in batch_positions]
             )
-        print("All chunks successfully added to ChromaDB!")
+
+    collection_changed = bool(new_positions or changed_positions or removed_ids)
+
+    if embeddings is None:
+        print("No embeddings were generated.")
+        if collection_changed:
+            bump_index_version()
+        return
+
+    # Save chunks with embeddings (binary matrix + Parquet metadata, memory-mapped on reload)
+    chunks_df['chunk_id'] = ids
+    save_embedded_chunks(chunks_df, embeddings)
+
+    if build_indexes:
+        build_search_indexes(chunks_df, embeddings)
+    elif collection_changed:
+        bump_index_version()
 
     print(f"Final count in ChromaDB collection '{COLLECTION_NAME}': {collection.count()} chunks.")
     print("Embedding generation and indexing complete.")
@@ -112,5 +258,6 @@ def generate_embeddings_and_index(input_chunks_path: str):
 if __name__ == "__main__":
     # This part will run only when embed_and_index.py is executed directly
     # Ensure 'pakistan_laws_chunks.csv' is generated by preprocess.py
+    import sys
     print("Running embedding generation and indexing script...")
-    generate_embeddings_and_index(PROCESSED_CHUNKS_PATH)
+    generate_embeddings_and_index(PROCESSED_CHUNKS_PATH, rebuild="--rebuild" in sys.argv)
@@ -0,0 +1,144 @@
+import os
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from tqdm import tqdm
+
+from src.config import (EMBEDDING_MODEL_NAME, EMBEDDING_BATCH_SIZE, EMBEDDING_NUM_WORKERS,
+                        EMBEDDING_MAX_IN_FLIGHT)
+
+EMBEDDING_MODEL_NAME_FALLBACK = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def get_device() -> str:
+    import torch
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+def load_embedding_model(model_name: str = EMBEDDING_MODEL_NAME, device: str = None):
+    """
+    Loads a SentenceTransformer, falling back to a small model if the configured one cannot be loaded.
+    Returns None if neither model can be loaded.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    device = device or get_device()
+    try:
+        model = SentenceTransformer(model_name, device=device)
+        print(f"Embedding model '{model_name}' loaded successfully on {model.device}.")
+        return model
+    except Exception as e:
+        print(f"Error loading embedding model: {e}")
+        print("Please ensure you have an active internet connection to download the model.")
+        print("If using a GPU, ensure CUDA is properly installed and PyTorch is configured for it.")
+        print(f"Attempting to load a smaller fallback model: {EMBEDDING_MODEL_NAME_FALLBACK}")
+    try:
+        model = SentenceTransformer(EMBEDDING_MODEL_NAME_FALLBACK, device=device)
+        print(f"Loaded fallback model: {EMBEDDING_MODEL_NAME_FALLBACK}")
+        return model
+    except Exception as e_fallback:
+        print(f"Failed to load fallback model: {e_fallback}. Cannot proceed with embeddings.")
+        return None
+
+
+def make_length_sorted_batches(texts: list, batch_size: int):
+    """
+    Yields (indices, texts) batches with the longest texts first.
+    Grouping texts of similar length keeps padding inside each batch to a minimum.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    for start in range(0, len(order), batch_size):
+        batch_indices = order[start:start + batch_size]
+        yield batch_indices, [texts[i] for i in batch_indices]
+
+
+def _encode(model, batch_texts: list) -> np.ndarray:
+    vectors = model.encode(batch_texts, batch_size=len(batch_texts), convert_to_numpy=True,
+                           show_progress_bar=False)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+# --- Worker process state ---
+# Each worker loads its own copy of the model once, in the pool initializer.
+_worker_model = None
+
+
+def _init_worker(model_name: str, device: str, torch_threads: int):
+    global _worker_model
+    import torch
+    torch.set_num_threads(torch_threads)
+    _worker_model = load_embedding_model(model_name, device)
+    if _worker_model is None:
+        raise RuntimeError(f"Worker {os.getpid()} could not load an embedding model.")
+
+
+def _encode_in_worker(batch_indices: list, batch_texts: list):
+    return batch_indices, _encode(_worker_model, batch_texts)
+
+
+def _iter_in_process(batches, model):
+    for batch_indices, batch_texts in batches:
+        yield batch_indices, _encode(model, batch_texts)
+
+
+def _iter_with_pool(batches, model_name, device, num_workers, max_in_flight):
+    torch_threads = max(1, (os.cpu_count() or 1) // num_workers)
+    # spawn, not fork: forking a process that has initialised torch can deadlock
+    context = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_init_worker,
+                             initargs=(model_name, device, torch_threads)) as executor:
+        pending = set()
+        for batch_indices, batch_texts in batches:
+            # Keep a bounded number of batches queued so results never pile up in memory
+            if len(pending) >= num_workers * max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(_encode_in_worker, batch_indices, batch_texts))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def iter_embedding_batches(texts: list, model=None, model_name: str = EMBEDDING_MODEL_NAME,
+                           batch_size: int = EMBEDDING_BATCH_SIZE, num_workers: int = EMBEDDING_NUM_WORKERS,
+                           max_in_flight: int = EMBEDDING_MAX_IN_FLIGHT, device: str = None):
+    """
+    Encodes texts in length-sorted batches and yields (indices, float32 embeddings) as each batch finishes.
+    Indices refer to positions in `texts`; batches may arrive in any order.
+
+    With num_workers <= 1 the batches are encoded in-process with `model` (loaded on demand if not given).
+    Otherwise a pool of worker processes is started, each holding its own SentenceTransformer.
+    """
+    if not texts:
+        return
+    device = device or get_device()
+    batches = make_length_sorted_batches(texts, batch_size)
+
+    if num_workers <= 1:
+        if model is None:
+            model = load_embedding_model(model_name, device)
+            if model is None:
+                return
+        stream = _iter_in_process(batches, model)
+        print(f"Encoding {len(texts)} chunks in batches of {batch_size} on {device}...")
+    else:
+        stream = _iter_with_pool(batches, model_name, device, num_workers, max_in_flight)
+        print(f"Encoding {len(texts)} chunks in batches of {batch_size} across {num_workers} worker processes...")
+
+    start_time = time.perf_counter()
+    encoded = 0
+    with tqdm(total=len(texts), desc="Generating embeddings", unit="chunk") as progress:
+        for batch_indices, vectors in stream:
+            encoded += len(batch_indices)
+            progress.update(len(batch_indices))
+            elapsed = time.perf_counter() - start_time
+            progress.set_postfix(chunks_per_sec=f"{encoded / elapsed:.1f}" if elapsed else "-")
+            yield batch_indices, vectors
+
+    elapsed = time.perf_counter() - start_time
+    rate = encoded / elapsed if elapsed else float("inf")
+    print(f"Encoded {encoded} chunks in {elapsed:.1f}s ({rate:.1f} chunks/sec).")
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.config import EMBEDDED_CHUNKS_PATH, EMBEDDINGS_MATRIX_PATH, EMBEDDINGS_DTYPE
+
+
+def save_embedded_chunks(chunks_df: pd.DataFrame, embeddings: np.ndarray, dtype: str = EMBEDDINGS_DTYPE,
+                         metadata_path: str = EMBEDDED_CHUNKS_PATH, matrix_path: str = EMBEDDINGS_MATRIX_PATH):
+    """
+    Writes the embedding matrix as a .npy file and the chunk columns as Parquet.
+    Both files are written to temporaries first so readers never see a half-written pair.
+    """
+    if len(chunks_df) != len(embeddings):
+        raise ValueError(f"Got {len(chunks_df)} chunks but {len(embeddings)} embeddings.")
+
+    matrix_tmp = f"{matrix_path}.tmp"
+    with open(matrix_tmp, "wb") as f:
+        np.save(f, np.ascontiguousarray(embeddings, dtype=np.dtype(dtype)))
+    metadata_tmp = f"{metadata_path}.tmp"
+    chunks_df.drop(columns=['embedding'], errors='ignore').reset_index(drop=True).to_parquet(
+        metadata_tmp, engine="pyarrow", index=False)
+
+    os.replace(matrix_tmp, matrix_path)
+    os.replace(metadata_tmp, metadata_path)
+    size_mb = os.path.getsize(matrix_path) / (1024 * 1024)
+    print(f"Saved {embeddings.shape[0]} x {embeddings.shape[1]} {dtype} embeddings ({size_mb:.1f} MB) to {matrix_path}")
+    print(f"Chunk metadata saved to {metadata_path}")
+
+
+def load_embedding_matrix(matrix_path: str = EMBEDDINGS_MATRIX_PATH, mmap: bool = True) -> np.ndarray:
+    """Opens the embedding matrix; with mmap=True rows are paged in from disk on access, nothing is copied."""
+    return np.load(matrix_path, mmap_mode='r' if mmap else None)
+
+
+def load_embedded_chunks(metadata_path: str = EMBEDDED_CHUNKS_PATH, matrix_path: str = EMBEDDINGS_MATRIX_PATH,
+                         mmap: bool = True):
+    """
+    Returns (chunks_df, embeddings) where embeddings[i] belongs to chunks_df.iloc[i].
+    Returns (None, None) if the artifacts have not been generated yet.
+    """
+    if not (os.path.exists(metadata_path) and os.path.exists(matrix_path)):
+        return None, None
+    chunks_df = pd.read_parquet(metadata_path, engine="pyarrow")
+    embeddings = load_embedding_matrix(matrix_path, mmap=mmap)
+    if len(chunks_df) != embeddings.shape[0]:
+        print(f"Warning: {metadata_path} and {matrix_path} are out of sync; ignoring stored embeddings.")
+        return None, None
+    return chunks_df, embeddings
@@ -0,0 +1,293 @@
+import os
+import re
+
+import numpy as np
+
+from src.config import LEXICAL_INDEX_PATH
+from src.data_processing.dedup import chunks_source_files
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+MAX_TOKEN_LENGTH = 32
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or shall that the this to was were which will with"
+    .split()
+)
+PROVISION_NUMBER = r"\d+[a-z]?(?:-[a-z])?"
+# "section 302 PPC", "s. 302", "ss. 302 and 34", "Article 25", "Articles 25 and 26", "art. 25-A". A bare "s" needs
+# its dot and no apostrophe before it, so "Pakistan's 2024" is not a citation.
+CITATION_PATTERN = re.compile(
+    rf"(?:\b(?:sections?|secs?\.?|articles?|arts?\.?)|(?<![\w'’])ss?\.)\s*"
+    rf"({PROVISION_NUMBER}(?:\s*(?:,|&|\band\b|\bor\b)\s*{PROVISION_NUMBER})*)\b",
+    re.IGNORECASE)
+CITED_NUMBER_PATTERN = re.compile(r"(\d+[a-z]?)(?:-([a-z]))?", re.IGNORECASE)
+SECTION_NUMBER_PATTERN = re.compile(r"^(\d+[A-Z]?)(?:-([A-Z]))?\.", re.IGNORECASE)
+# A provision heading inside cleaned text (whitespace is collapsed, so headings are not on lines of their own):
+# "302. Punishment of qatl-i-amd", "25A. Right to education", "489-F. Dishonestly issuing a cheque"
+PROVISION_HEADING_PATTERN = re.compile(r"(?<![\w.,(/-])(\d{1,3}[A-Z]?)(?:-([A-Z]))?\.\s+(?=[A-Z])")
+# Words before "<number>." that make it a reference to a provision rather than its heading
+REFERENCE_WORDS = frozenset(
+    "section sections sec article articles art clause clauses sub-section sub-sections rule rules paragraph "
+    "chapter part schedule no rs s ss of and or to under in with".split()
+)
+ACRONYM_WORD_PATTERN = re.compile(r"[A-Za-z]+")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 2  # Section title tokens are counted this many times
+
+
+def tokenize(text) -> list[str]:
+    if not isinstance(text, str):
+        return []
+    return [token for token in TOKEN_PATTERN.findall(text.lower())
+            if token not in STOPWORDS and len(token) <= MAX_TOKEN_LENGTH]
+
+
+def source_acronym(source_file) -> str:
+    """'Pakistan Penal Code.pdf' -> 'ppc', so queries can cite a law by its usual abbreviation."""
+    if not isinstance(source_file, str):
+        return ""
+    name = os.path.splitext(os.path.basename(source_file))[0]
+    words = [word for word in ACRONYM_WORD_PATTERN.findall(name) if word.lower() not in STOPWORDS]
+    return "".join(word[0] for word in words).lower() if len(words) > 1 else ""
+
+
+def parse_section_number(section_title) -> str:
+    """Leading provision number of a section title ('302. Punishment of qatl-i-amd' -> '302'), or ''."""
+    if not isinstance(section_title, str):
+        return ""
+    match = SECTION_NUMBER_PATTERN.match(section_title.strip())
+    if not match:
+        return ""
+    return (match.group(1) + (f"-{match.group(2)}" if match.group(2) else "")).lower()
+
+
+def parse_citations(query: str) -> list[str]:
+    """
+    Provision numbers cited in a query, e.g. 'section 302 PPC' -> ['302'], 'Article 25-A' -> ['25-a'],
+    'Articles 25 and 26' -> ['25', '26'].
+    """
+    return [(number + (f"-{suffix}" if suffix else "")).lower()
+            for numbers in CITATION_PATTERN.findall(query)
+            for number, suffix in CITED_NUMBER_PATTERN.findall(numbers)]
+
+
+def parse_provision_headings(text) -> list[str]:
+    """Numbers of the provisions whose headings occur in a chunk's text, in order ('302. Punishment...' -> '302')."""
+    if not isinstance(text, str):
+        return []
+    numbers = []
+    for match in PROVISION_HEADING_PATTERN.finditer(text):
+        preceding = text[max(0, match.start() - 20):match.start()].split()
+        if preceding and preceding[-1].lower().strip(".,;:()") in REFERENCE_WORDS:
+            continue
+        numbers.append((match.group(1) + (f"-{match.group(2)}" if match.group(2) else "")).lower())
+    return numbers
+
+
+def chunk_provisions(chunks_df) -> list[list[str]]:
+    """
+    Provision numbers each chunk belongs to: the provision in force where the chunk starts (carried over from
+    the previous chunk of the same section unless the chunk opens on a heading) plus every heading inside it. Falls back on the section
+    title's number when sectioning produced one. chunks_df must be in document order.
+    """
+    current = {}
+    provisions = []
+    for chunk_content, section_title, source_file in zip(
+            chunks_df['chunk_content'], chunks_df['section_title'], chunks_df['source_file']):
+        key = (source_file, section_title)
+        headings = parse_provision_headings(chunk_content)
+        # A chunk opening on a heading starts a new provision rather than continuing the previous one
+        carried = None if isinstance(chunk_content, str) and PROVISION_HEADING_PATTERN.match(chunk_content.lstrip()) \
+            else current.get(key)
+        numbers = [number for number in (parse_section_number(section_title), carried) if number]
+        numbers += [number for number in headings if number not in numbers]
+        if headings:
+            current[key] = headings[-1]
+        provisions.append(numbers)
+    return provisions
+
+
+def _document_tokens(chunk_content, section_title, source_file) -> list[str]:
+    tokens = tokenize(chunk_content) + tokenize(section_title) * TITLE_WEIGHT + tokenize(source_file)
+    acronym = source_acronym(source_file)
+    if acronym:
+        tokens.append(acronym)
+    return tokens
+
+
+def build_lexical_index(chunks_df, chunk_ids: list, path: str = LEXICAL_INDEX_PATH):
+    """
+    Builds a BM25 inverted index over chunk_content, section_title and source_file and saves it as an
+    uncompressed .npz of flat arrays (CSR postings), so loading is a handful of array reads.
+    """
+    postings = {}
+    doc_lengths = np.zeros(len(chunk_ids), dtype=np.int32)
+    for doc, (chunk_content, section_title, source_file) in enumerate(zip(
+            chunks_df['chunk_content'], chunks_df['section_title'], chunks_df['source_file'])):
+        counts = {}
+        for token in _document_tokens(chunk_content, section_title, source_file):
+            counts[token] = counts.get(token, 0) + 1
+        doc_lengths[doc] = sum(counts.values())
+        for token, count in counts.items():
+            postings.setdefault(token, []).append((doc, count))
+
+    vocabulary = sorted(postings)
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    for i, token in enumerate(vocabulary):
+        offsets[i + 1] = offsets[i] + len(postings[token])
+    posting_docs = np.empty(offsets[-1], dtype=np.int32)
+    posting_freqs = np.empty(offsets[-1], dtype=np.uint16)
+    for i, token in enumerate(vocabulary):
+        entries = np.asarray(postings[token], dtype=np.int64)
+        posting_docs[offsets[i]:offsets[i + 1]] = entries[:, 0]
+        posting_freqs[offsets[i]:offsets[i + 1]] = np.minimum(entries[:, 1], np.iinfo(np.uint16).max)
+
+    source_lists = chunks_source_files(chunks_df)
+    source_names = sorted({name for names in source_lists for name in names})
+    source_index = {name: i for i, name in enumerate(source_names)}
+    provisions = chunk_provisions(chunks_df)
+
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        vocabulary=np.asarray(vocabulary, dtype=str),
+        offsets=offsets,
+        posting_docs=posting_docs,
+        posting_freqs=posting_freqs,
+        doc_lengths=doc_lengths,
+        chunk_ids=np.asarray(chunk_ids, dtype=str),
+        # Flat (chunk, provision number) pairs: a chunk can belong to several provisions
+        provision_docs=np.asarray([doc for doc, numbers in enumerate(provisions) for _ in numbers], dtype=np.int32),
+        provision_numbers=np.asarray([number for numbers in provisions for number in numbers], dtype=str),
+        # Flat (chunk, law) pairs: a collapsed duplicate chunk belongs to every law in its `sources`
+        source_docs=np.asarray([doc for doc, names in enumerate(source_lists) for _ in names], dtype=np.int32),
+        source_codes=np.asarray([source_index[name] for names in source_lists for name in names], dtype=np.int32),
+        source_names=np.asarray(source_names, dtype=str),
+        source_acronyms=np.asarray([source_acronym(name) for name in source_names], dtype=str),
+    )
+    os.replace(tmp_path, path)
+    print(f"Lexical index with {len(vocabulary)} terms over {len(chunk_ids)} chunks saved to {path}")
+
+
+class LexicalIndex:
+    """Read-only BM25 index loaded from the arrays written by build_lexical_index."""
+
+    def __init__(self, arrays):
+        self.vocabulary = arrays['vocabulary']
+        self.offsets = arrays['offsets']
+        self.posting_docs = arrays['posting_docs']
+        self.posting_freqs = arrays['posting_freqs']
+        self.doc_lengths = arrays['doc_lengths']
+        self.chunk_ids = arrays['chunk_ids']
+        self.provision_docs = arrays['provision_docs']
+        self.provision_numbers = arrays['provision_numbers']
+        self.source_docs = arrays['source_docs']
+        self.source_codes = arrays['source_codes']
+        self.source_names = arrays['source_names']
+        self.source_acronyms = arrays['source_acronyms']
+        # Words of each law's file name, matched against every citation query
+        self.source_name_tokens = [set(tokenize(os.path.splitext(os.path.basename(str(name)))[0]))
+                                   for name in self.source_names]
+        self.num_docs = len(self.doc_lengths)
+        self.average_length = float(self.doc_lengths.mean()) if self.num_docs else 1.0
+
+    @classmethod
+    def load(cls, path: str = LEXICAL_INDEX_PATH):
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    def _postings(self, token: str):
+        i = int(np.searchsorted(self.vocabulary, token))
+        if i >= len(self.vocabulary) or self.vocabulary[i] != token:
+            return None, None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.posting_docs[start:end], self.posting_freqs[start:end]
+
+    def provision_mask(self, numbers: list) -> np.ndarray:
+        """Boolean mask of the chunks belonging to any of the provision numbers."""
+        mask = np.zeros(self.num_docs, dtype=bool)
+        mask[self.provision_docs[np.isin(self.provision_numbers, numbers)]] = True
+        return mask
+
+    def _source_code_mask(self, codes) -> np.ndarray:
+        mask = np.zeros(self.num_docs, dtype=bool)
+        mask[self.source_docs[np.isin(self.source_codes, codes)]] = True
+        return mask
+
+    def source_mask(self, source_files: list) -> np.ndarray:
+        """Boolean mask of the chunks belonging to any of source_files."""
+        return self._source_code_mask(np.flatnonzero(np.isin(self.source_names, list(source_files))))
+
+    def coverage(self, query: str) -> float:
+        """Share of the query's (non-stopword) terms that occur anywhere in the indexed chunks."""
+        tokens = set(tokenize(query))
+        if not tokens:
+            return 0.0
+        return sum(self._postings(token)[0] is not None for token in tokens) / len(tokens)
+
+    def search(self, query: str, k: int = 10, source_files: list = None) -> list[tuple[str, float]]:
+        """Top-k (chunk_id, bm25_score) for the query, optionally only among chunks of source_files."""
+        if not self.num_docs:
+            return []
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for token in set(tokenize(query)):
+            docs, freqs = self._postings(token)
+            if docs is None:
+                continue
+            idf = np.log(1 + (self.num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            tf = freqs.astype(np.float32)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / self.average_length)
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        scores[scores <= 0] = -np.inf
+        if source_files:
+            scores[~self.source_mask(source_files)] = -np.inf
+        return self._top_k(scores, k)
+
+    def lookup_citations(self, query: str, k: int = 10, source_files: list = None) -> list[tuple[str, float]]:
+        """
+        Exact-match fast path for queries that cite a provision ('section 302 PPC', 'Article 25').
+        Returns chunks of the cited provision(s) (within source_files, if given), ranked by how many query terms
+        they contain. If the query names or abbreviates laws, only those laws count: a named law without the cited
+        provision gives [] rather than that provision of some other law. Returns [] when nothing matches.
+        """
+        numbers = parse_citations(query)
+        if not numbers:
+            return []
+        mask = self.provision_mask(numbers)
+        if source_files:
+            mask &= self.source_mask(source_files)
+        query_tokens = set(tokenize(query))
+        cited_sources = self._cited_sources(query_tokens)
+        if cited_sources:
+            mask &= self._source_code_mask(cited_sources)
+        if not mask.any():
+            return []
+
+        # Within the cited section(s), rank chunks by how many query terms they contain
+        overlap = np.zeros(self.num_docs, dtype=np.float32)
+        for token in query_tokens:
+            docs, _ = self._postings(token)
+            if docs is not None:
+                overlap[docs] += 1
+        scores = np.where(mask, 1.0 + overlap, -np.inf).astype(np.float32)
+        return self._top_k(scores, k)
+
+    def _cited_sources(self, query_tokens: set) -> list[int]:
+        """Sources named in the query, either by abbreviation ('ppc') or by every word of their name."""
+        cited = []
+        for i, (name_tokens, acronym) in enumerate(zip(self.source_name_tokens, self.source_acronyms)):
+            if (acronym and acronym in query_tokens) or (name_tokens and query_tokens.issuperset(name_tokens)):
+                cited.append(i)
+        return cited
+
+    def _top_k(self, scores: np.ndarray, k: int) -> list[tuple[str, float]]:
+        """Top-k (chunk_id, score) pairs, skipping documents scored -inf."""
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(str(self.chunk_ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
@@ -0,0 +1,212 @@
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+import xxhash
+
+from src.config import (DATA_DIR, PIPELINE_MANIFEST_DIR, RAW_DATA_PATH, SEMANTIC_SECTIONS_PATH, PROCESSED_CHUNKS_PATH,
+                        EMBEDDED_CHUNKS_PATH, EMBEDDINGS_MATRIX_PATH, EMBEDDINGS_DTYPE, VECTOR_DB_DIR,
+                        LEXICAL_INDEX_PATH, VECTOR_INDEX_DIR, DOCUMENT_INDEX_PATH, INDEX_VERSION_PATH, CHUNK_SIZE,
+                        CHUNK_OVERLAP, EMBEDDING_MODEL_NAME, CHUNK_DEDUP_ENABLED, VECTOR_INDEX_QUANTIZATION)
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+@dataclass
+class Stage:
+    """
+    One memoized step of the build. `run(previous_manifest, forced)` must (re)create `outputs` from `inputs`;
+    `config` holds the settings the outputs depend on. Bump `version` when a code change alters the outputs.
+    `markers` are outputs that only have to exist (directories, or files other processes touch).
+    """
+    name: str
+    inputs: list
+    outputs: list
+    run: Callable
+    config: dict = field(default_factory=dict)
+    markers: list = field(default_factory=list)
+    version: int = 1
+
+
+def _relative(path: str) -> str:
+    return os.path.relpath(path, DATA_DIR)
+
+
+def _same_content(a: dict, b: dict) -> bool:
+    return a is not None and b is not None and a.get("xxh3") == b.get("xxh3")
+
+
+class Pipeline:
+    """
+    Runs stages in order, skipping the ones whose manifest shows the same stage version, config and input
+    hashes as now and whose outputs are unchanged. Stages are listed upstream first; a stage depends on
+    whichever earlier stages produce its inputs, so a re-run upstream makes it stale only if the bytes changed.
+    """
+
+    def __init__(self, stages: list, manifest_dir: str = PIPELINE_MANIFEST_DIR):
+        self.stages = stages
+        self.manifest_dir = manifest_dir
+        # Fingerprints by relative path; an entry is reused while the file's size and mtime are unchanged
+        self._fingerprints = {}
+
+    def _manifest_path(self, stage: Stage) -> str:
+        return os.path.join(self.manifest_dir, f"{stage.name}.json")
+
+    def load_manifest(self, stage: Stage):
+        try:
+            with open(self._manifest_path(stage)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save_manifest(self, stage: Stage, manifest: dict):
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        path = self._manifest_path(stage)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def fingerprint(self, path: str, recorded: dict = None):
+        """xxh3 hash, size and mtime of a file, or None if it does not exist. Hashes only new or changed files."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = _relative(path)
+        for known in (self._fingerprints.get(key), recorded):
+            if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+                self._fingerprints[key] = known
+                return known
+        digest = xxhash.xxh3_128()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+        self._fingerprints[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "xxh3": digest.hexdigest()}
+        return self._fingerprints[key]
+
+    def stale_reasons(self, stage: Stage, manifest: dict) -> list:
+        """Why `stage` has to run; an empty list means its outputs are up to date."""
+        if manifest is None:
+            return ["no manifest"]
+        reasons = []
+        if manifest.get("version") != stage.version:
+            reasons.append(f"stage version {manifest.get('version')} -> {stage.version}")
+        recorded_config = manifest.get("config", {})
+        for name in sorted(stage.config.keys() | recorded_config.keys()):
+            if recorded_config.get(name) != stage.config.get(name):
+                reasons.append(f"{name} {recorded_config.get(name)!r} -> {stage.config.get(name)!r}")
+        for path in stage.inputs:
+            recorded = manifest.get("inputs", {}).get(_relative(path))
+            current = self.fingerprint(path, recorded)
+            # A missing input cannot be checked; the existing outputs are kept if nothing else is stale
+            if current is not None and not _same_content(current, recorded):
+                reasons.append(f"{os.path.basename(path)} changed")
+        for path in stage.outputs:
+            recorded = manifest.get("outputs", {}).get(_relative(path))
+            current = self.fingerprint(path, recorded)
+            if current is None:
+                reasons.append(f"{os.path.basename(path)} missing")
+            elif not _same_content(current, recorded):
+                reasons.append(f"{os.path.basename(path)} modified")
+        reasons.extend(f"{os.path.basename(path)} missing" for path in stage.markers if not os.path.exists(path))
+        return reasons
+
+    def status(self) -> dict:
+        """{stage name: stale reasons} without running anything."""
+        return {stage.name: self.stale_reasons(stage, self.load_manifest(stage)) for stage in self.stages}
+
+    def run(self, force=()) -> dict:
+        """
+        Brings every stage up to date. `force` names stages to re-run regardless (True forces all).
+        Returns {stage name: "up to date" or the seconds it took}.
+        """
+        results = {}
+        for stage in self.stages:
+            manifest = self.load_manifest(stage)
+            reasons = self.stale_reasons(stage, manifest)
+            forced = force is True or stage.name in force
+            if forced:
+                reasons.insert(0, "forced")
+            if not reasons:
+                print(f"[pipeline] {stage.name}: up to date")
+                results[stage.name] = "up to date"
+                continue
+
+            missing_inputs = [path for path in stage.inputs if not os.path.exists(path)]
+            if missing_inputs:
+                raise FileNotFoundError(f"Stage '{stage.name}' must run ({'; '.join(reasons)}) "
+                                        f"but its inputs are missing: {', '.join(missing_inputs)}")
+            print(f"\n[pipeline] {stage.name}: running ({'; '.join(reasons)})")
+            # Input hashes are taken before the run, so an input edited mid-run makes the stage stale next time
+            inputs = {_relative(path): self.fingerprint(path) for path in stage.inputs}
+            start_time = time.perf_counter()
+            stage.run(manifest, forced)
+            elapsed = time.perf_counter() - start_time
+
+            missing_outputs = [path for path in stage.outputs + stage.markers if not os.path.exists(path)]
+            if missing_outputs:
+                raise RuntimeError(f"Stage '{stage.name}' did not produce {', '.join(missing_outputs)}")
+            self._save_manifest(stage, {
+                "stage": stage.name,
+                "version": stage.version,
+                "config": stage.config,
+                "inputs": inputs,
+                "outputs": {_relative(path): self.fingerprint(path) for path in stage.outputs},
+                "completed_at": time.time(),
+                "seconds": round(elapsed, 3),
+            })
+            print(f"[pipeline] {stage.name}: done in {elapsed:.1f}s")
+            results[stage.name] = round(elapsed, 3)
+        return results
+
+
+# --- Stage implementations ---
+def _run_sections(manifest, forced):
+    from src.data_processing.preprocess import run_preprocessing
+    run_preprocessing(RAW_DATA_PATH, write_chunks=False)
+
+
+def _run_chunks(manifest, forced):
+    from src.data_processing.preprocess import run_chunking
+    run_chunking(SEMANTIC_SECTIONS_PATH)
+
+
+def _run_embeddings(manifest, forced):
+    from src.data_processing.embed_and_index import generate_embeddings_and_index
+    # Chunk IDs only hash the content, so vectors from another model would be kept by an incremental sync
+    previous_model = (manifest or {}).get("config", {}).get("EMBEDDING_MODEL_NAME")
+    rebuild = forced or (previous_model is not None and previous_model != EMBEDDING_MODEL_NAME)
+    generate_embeddings_and_index(PROCESSED_CHUNKS_PATH, rebuild=rebuild, build_indexes=False)
+
+
+def _run_index(manifest, forced):
+    from src.data_processing.embed_and_index import build_search_indexes
+    from src.data_processing.embedding_store import load_embedded_chunks
+    chunks_df, embeddings = load_embedded_chunks()
+    if chunks_df is None:
+        raise RuntimeError("No embedded chunks to index.")
+    build_search_indexes(chunks_df, embeddings)
+
+
+def build_pipeline() -> Pipeline:
+    """raw CSV -> sections -> chunks (duplicates collapsed) -> embeddings (+ ChromaDB) -> BM25, numpy and
+    routing indexes."""
+    return Pipeline([
+        Stage("sections", inputs=[RAW_DATA_PATH], outputs=[SEMANTIC_SECTIONS_PATH], run=_run_sections),
+        Stage("chunks", inputs=[SEMANTIC_SECTIONS_PATH], outputs=[PROCESSED_CHUNKS_PATH], run=_run_chunks,
+              config={"CHUNK_SIZE": CHUNK_SIZE, "CHUNK_OVERLAP": CHUNK_OVERLAP,
+                      "CHUNK_DEDUP_ENABLED": CHUNK_DEDUP_ENABLED}),
+        Stage("embeddings", inputs=[PROCESSED_CHUNKS_PATH], outputs=[EMBEDDED_CHUNKS_PATH, EMBEDDINGS_MATRIX_PATH],
+              run=_run_embeddings, config={"EMBEDDING_MODEL_NAME": EMBEDDING_MODEL_NAME,
+                                           "EMBEDDINGS_DTYPE": EMBEDDINGS_DTYPE},
+              # ChromaDB rewrites its own files, so the collection is only checked for presence
+              markers=[os.path.join(VECTOR_DB_DIR, "chroma.sqlite3")]),
+        Stage("index", inputs=[EMBEDDED_CHUNKS_PATH, EMBEDDINGS_MATRIX_PATH], outputs=[], run=_run_index,
+              # The numpy index only holds the compact copy of the configured quantization
+              config={"VECTOR_INDEX_QUANTIZATION": VECTOR_INDEX_QUANTIZATION},
+              markers=[LEXICAL_INDEX_PATH, DOCUMENT_INDEX_PATH, INDEX_VERSION_PATH,
+                       os.path.join(VECTOR_INDEX_DIR, "chunks.parquet")]),
+    ])
@@ -1,13 +1,27 @@
 import pandas as pd
 import re
 import os
+from functools import partial
+from multiprocessing import Pool
 from tqdm import tqdm
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-from src.config import RAW_DATA_PATH, SEMANTIC_SECTIONS_PATH, PROCESSED_CHUNKS_PATH, CHUNK_SIZE, CHUNK_OVERLAP
+from src.config import (RAW_DATA_PATH, SEMANTIC_SECTIONS_PATH, PROCESSED_CHUNKS_PATH, CHUNK_SIZE, CHUNK_OVERLAP,
+                        PREPROCESS_NUM_WORKERS, PREPROCESS_READ_CHUNKSIZE, PREPROCESS_TASK_CHUNKSIZE,
+                        CHUNKING_READ_CHUNKSIZE, CHUNKING_TASK_SECTIONS, CHUNK_DEDUP_ENABLED)
+from src.data_processing.dedup import deduplicate_chunks
 
-# Ensure tqdm works with pandas
-tqdm.pandas()
+# Patterns are compiled once at import time rather than on every call
+PAGE_NUMBER_PATTERN = re.compile(r"(?i)Page \d+ of \d+")
+UPDATED_TILL_PATTERN = re.compile(r"(?i)Updated till \d{1,2}\.\d{1,2}\.\d{4}")
+CONTENTS_PATTERN = re.compile(r'(?i)\bCONTENTS\b.*?(?=(PART|CHAPTER|\d+\.?\s+[A-Z]))', flags=re.DOTALL)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+SECTION_HEADER_PATTERN = re.compile(
+    r"^(PART\s+[IVXLCDM]+\.?—?.*?$|"  # Matches PART headings
+    r"^CHAPTER\s+[IVXLCDM]+\.?—?.*?$|"  # Matches CHAPTER headings
+    r"^\d+\.\s+[A-Z].*?$) ",  # Matches numbered sections/articles (e.g., "1. Short title...")
+    re.MULTILINE | re.IGNORECASE
+)
 
 
 def clean_text(text: str) -> str:
@@ -24,14 +38,14 @@ def clean_text(text: str) -> str:
     text = text.replace("\xa0", " ").replace("­", "")  # remove non-breaking spaces and soft hyphens
 
     # Remove common page artifacts
-    text = re.sub(r"(?i)Page \d+ of \d+", " ", text)
-    text = re.sub(r"(?i)Updated till \d{1,2}\.\d{1,2}\.\d{4}", " ", text)
+    text = PAGE_NUMBER_PATTERN.sub(" ", text)
+    text = UPDATED_TILL_PATTERN.sub(" ", text)
 
     # Remove 'CONTENTS' section (basic version)
-    text = re.sub(r'(?i)\bCONTENTS\b.*?(?=(PART|CHAPTER|\d+\.?\s+[A-Z]))', '', text, flags=re.DOTALL)
+    text = CONTENTS_PATTERN.sub('', text)
 
     # Collapse multiple whitespaces and newlines
-    text = re.sub(r'\s+', ' ', text)
+    text = WHITESPACE_PATTERN.sub(' ', text)
     return text.strip()
 
 def extract_semantic_sections(text: str, file_name: str) -> list[dict]:
@@ -40,13 +54,7 @@ def extract_semantic_sections(text: str, file_name: str) -> list[dict]:
     It attempts to capture the section heading and the content belonging to it.
     """
     sections_list = []
-    section_header_pattern = re.compile(
-        r"^(PART\s+[IVXLCDM]+\.?—?.*?$|"  # Matches PART headings
-        r"^CHAPTER\s+[IVXLCDM]+\.?—?.*?$|"  # Matches CHAPTER headings
-        r"^\d+\.\s+[A-Z].*?$) ",  # Matches numbered sections/articles (e.g., "1. Short title...")
-        re.MULTILINE | re.IGNORECASE
-    )
-    split_content = section_header_pattern.split(text)
+    split_content = SECTION_HEADER_PATTERN.split(text)
     preamble_content = split_content[0].strip()
     if preamble_content:
         sections_list.append({
@@ -78,71 +86,179 @@ def extract_semantic_sections(text: str, file_name: str) -> list[dict]:
     return sections_list
 
 
-def run_preprocessing(input_csv_path: str):
+# --- Per-document pipeline (runs inside worker processes) ---
+_text_splitter = None
+
+
+def _get_text_splitter() -> RecursiveCharacterTextSplitter:
+    global _text_splitter
+    if _text_splitter is None:
+        _text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            length_function=len,
+            add_start_index=True,
+            separators=["\n\n\n", "\n\n", "\n", " ", ""]
+        )
+    return _text_splitter
+
+
+def split_sections_into_chunks(sections: list[dict]) -> list[dict]:
+    """
+    Splits semantic sections into chunks. `original_chunk_index` is left for the caller to assign,
+    since it is a running index over the whole corpus.
+    """
+    text_splitter = _get_text_splitter()
+    chunks = []
+    for section in sections:
+        section_content = section['section_content']
+        if not section_content.strip():
+            continue
+        docs = text_splitter.create_documents(
+            texts=[section_content],
+            metadatas=[{"source_file": section['source_file'], "section_title": section['section_title']}]
+        )
+        for doc in docs:
+            chunks.append({
+                "source_file": doc.metadata["source_file"],
+                "section_title": doc.metadata["section_title"],
+                "chunk_content": doc.page_content,
+                "chunk_length": len(doc.page_content),
+                "start_index_in_section": doc.metadata["start_index"],
+            })
+    return chunks
+
+
+def process_document(document: tuple, split: bool = True) -> tuple[list[dict], list[dict]]:
+    """Runs clean -> section -> split for one (file_name, content) document; split=False stops after sectioning."""
+    file_name, content = document
+    cleaned_content = clean_text(content)
+    if not cleaned_content.strip():
+        return [], []
+    sections = extract_semantic_sections(cleaned_content, file_name)
+    return sections, split_sections_into_chunks(sections) if split else []
+
+
+def _append_csv(records: list[dict], path: str, write_header: bool) -> bool:
+    """Appends records to path, returns True once something has been written."""
+    if not records:
+        return not write_header
+    pd.DataFrame(records).to_csv(path, mode='w' if write_header else 'a', header=write_header, index=False)
+    return True
+
+
+def run_preprocessing(input_csv_path: str, num_workers: int = PREPROCESS_NUM_WORKERS,
+                      read_chunksize: int = PREPROCESS_READ_CHUNKSIZE, write_chunks: bool = True):
+    """
+    Streams the raw CSV in chunks of `read_chunksize` documents and fans the per-document
+    clean -> section -> split work out over `num_workers` processes (in-process if <= 1).
+    Sections and chunks are appended to their output files as each read chunk finishes, in input order,
+    so only one read chunk of documents is held in memory at a time.
+    With write_chunks=False only the sections file is written; run_chunking splits it later.
+    """
     print(f"Starting data preprocessing from {input_csv_path}...")
 
-    # Load raw data
-    laws_df = pd.read_csv(input_csv_path)
-    print(f"Loaded {len(laws_df)} raw documents.")
-
-    # Apply cleaning
-    if not laws_df.empty:
-        laws_df['Cleaned_Content'] = laws_df['Content'].progress_apply(clean_text)
-        print("Text cleaning complete.")
-
-    # Extract semantic sections
-    all_semantic_sections = []
-    if not laws_df.empty:
-        for index, row in tqdm(laws_df.iterrows(), total=len(laws_df), desc="Extracting semantic sections"):
-            file_name = row['File Name']
-            cleaned_content = row['Cleaned_Content']
-            if not cleaned_content.strip():
-                continue
-            extracted_sections = extract_semantic_sections(cleaned_content, file_name)
-            all_semantic_sections.extend(extracted_sections)
-    semantic_sections_df = pd.DataFrame(all_semantic_sections)
-    print(f"Generated {len(semantic_sections_df)} semantic sections.")
-    semantic_sections_df.to_csv(SEMANTIC_SECTIONS_PATH, index=False)
+    pool = Pool(processes=num_workers) if num_workers > 1 else None
+    if pool:
+        print(f"Processing documents across {num_workers} worker processes.")
+
+    total_documents = 0
+    total_sections = 0
+    total_chunks = 0
+    sections_written = False
+    chunks_written = False
+    try:
+        with tqdm(desc="Preprocessing documents", unit="doc") as progress:
+            for laws_df in pd.read_csv(input_csv_path, chunksize=read_chunksize):
+                total_documents += len(laws_df)
+                documents = zip(laws_df['File Name'].tolist(), laws_df['Content'].tolist())
+                read_chunk_sections = []
+                read_chunk_chunks = []
+                # imap keeps results in input order, so the output matches a sequential run exactly
+                process = partial(process_document, split=write_chunks)
+                results = pool.imap(process, documents, chunksize=PREPROCESS_TASK_CHUNKSIZE) \
+                    if pool else map(process, documents)
+                for sections, chunks in results:
+                    read_chunk_sections.extend(sections)
+                    for chunk in chunks:
+                        chunk["original_chunk_index"] = total_chunks + len(read_chunk_chunks)
+                        read_chunk_chunks.append(chunk)
+                    progress.update(1)
+                sections_written = _append_csv(read_chunk_sections, SEMANTIC_SECTIONS_PATH, not sections_written)
+                chunks_written = _append_csv(read_chunk_chunks, PROCESSED_CHUNKS_PATH, not chunks_written)
+                total_sections += len(read_chunk_sections)
+                total_chunks += len(read_chunk_chunks)
+        if write_chunks and total_chunks and CHUNK_DEDUP_ENABLED:
+            # Across the whole corpus, so it runs once every chunk has been written
+            deduplicate_chunks(PROCESSED_CHUNKS_PATH, pool)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    # Keep the previous behaviour of always producing both files, even when empty
+    if not sections_written:
+        pd.DataFrame().to_csv(SEMANTIC_SECTIONS_PATH, index=False)
+    if write_chunks and not chunks_written:
+        pd.DataFrame().to_csv(PROCESSED_CHUNKS_PATH, index=False)
+
+    print(f"Loaded {total_documents} raw documents.")
+    print(f"Generated {total_sections} semantic sections.")
     print(f"Semantic sections saved to {SEMANTIC_SECTIONS_PATH}")
+    if write_chunks:
+        print(f"Generated {total_chunks} total chunks from semantic sections.")
+        print(f"Processed chunks saved to {PROCESSED_CHUNKS_PATH}")
+    print("Data preprocessing complete.")
+
+
+def _read_sections(sections_csv_path: str, read_chunksize: int):
+    """Yields the sections CSV as lists of section dicts, all values read as strings."""
+    try:
+        reader = pd.read_csv(sections_csv_path, chunksize=read_chunksize, dtype=str, keep_default_na=False)
+        for sections_df in reader:
+            yield sections_df.to_dict(orient='records')
+    except pd.errors.EmptyDataError:
+        return
 
-    # Initial chunking strategy
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        length_function=len,
-        add_start_index=True,
-        separators=["\n\n\n", "\n\n", "\n", " ", ""]
-    )
-
-    all_chunks = []
-    if not semantic_sections_df.empty:
-        for index, row in tqdm(semantic_sections_df.iterrows(), total=len(semantic_sections_df),
-                               desc="Splitting sections into chunks"):
-            source_file = row['source_file']
-            section_title = row['section_title']
-            section_content = row['section_content']
-            if not section_content.strip():
-                continue
-            docs = text_splitter.create_documents(
-                texts=[section_content],
-                metadatas=[{"source_file": source_file, "section_title": section_title}]
-            )
-            for doc in docs:
-                chunk_data = {
-                    "source_file": doc.metadata["source_file"],
-                    "section_title": doc.metadata["section_title"],
-                    "chunk_content": doc.page_content,
-                    "chunk_length": len(doc.page_content),
-                    "start_index_in_section": doc.metadata["start_index"],
-                    "original_chunk_index": len(all_chunks)
-                }
-                all_chunks.append(chunk_data)
-
-    chunks_df = pd.DataFrame(all_chunks)
-    print(f"Generated {len(chunks_df)} total chunks from semantic sections.")
-    chunks_df.to_csv(PROCESSED_CHUNKS_PATH, index=False)
+
+def run_chunking(sections_csv_path: str = SEMANTIC_SECTIONS_PATH, num_workers: int = PREPROCESS_NUM_WORKERS,
+                 read_chunksize: int = CHUNKING_READ_CHUNKSIZE):
+    """
+    Splits an existing sections CSV into the chunks CSV, without re-cleaning the raw documents. Gives the same
+    chunks as run_preprocessing (duplicates collapsed the same way), so a CHUNK_SIZE / CHUNK_OVERLAP change
+    only costs this step.
+    """
+    print(f"Splitting semantic sections from {sections_csv_path} into chunks...")
+    pool = Pool(processes=num_workers) if num_workers > 1 else None
+
+    total_chunks = 0
+    chunks_written = False
+    try:
+        with tqdm(desc="Chunking sections", unit="section") as progress:
+            for sections in _read_sections(sections_csv_path, read_chunksize):
+                batches = [sections[i:i + CHUNKING_TASK_SECTIONS]
+                           for i in range(0, len(sections), CHUNKING_TASK_SECTIONS)]
+                results = pool.imap(split_sections_into_chunks, batches) if pool \
+                    else map(split_sections_into_chunks, batches)
+                read_chunk_chunks = []
+                for batch, chunks in zip(batches, results):
+                    for chunk in chunks:
+                        chunk["original_chunk_index"] = total_chunks + len(read_chunk_chunks)
+                        read_chunk_chunks.append(chunk)
+                    progress.update(len(batch))
+                chunks_written = _append_csv(read_chunk_chunks, PROCESSED_CHUNKS_PATH, not chunks_written)
+                total_chunks += len(read_chunk_chunks)
+        if total_chunks and CHUNK_DEDUP_ENABLED:
+            deduplicate_chunks(PROCESSED_CHUNKS_PATH, pool)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    if not chunks_written:
+        pd.DataFrame().to_csv(PROCESSED_CHUNKS_PATH, index=False)
+    print(f"Generated {total_chunks} total chunks from semantic sections.")
     print(f"Processed chunks saved to {PROCESSED_CHUNKS_PATH}")
-    print("Data preprocessing complete.")
 
 if __name__ == "__main__":
     # This part will run only when preprocess.py is executed directly
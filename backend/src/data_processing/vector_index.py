@@ -0,0 +1,246 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.config import VECTOR_INDEX_DIR, VECTOR_INDEX_QUANTIZATION, VECTOR_INDEX_RESCORE_FACTOR
+from src.data_processing.dedup import SOURCE_KEY_PREFIX, chunks_source_files, source_key
+
+METADATA_COLUMNS = ['source_file', 'section_title', 'chunk_length', 'start_index_in_section', 'sources']
+QUANTIZATIONS = (None, "float16", "int8")
+QUANTIZED_FILES = {"float16": ("vectors_f16.npy",), "int8": ("vectors_i8.npy", "scales_i8.npy")}
+SEARCH_BLOCK_ROWS = 65536  # Rows scored per matmul, so quantized blocks are upcast a slice at a time
+
+
+def _path(index_dir: str, name: str) -> str:
+    return os.path.join(index_dir, name)
+
+
+def _save_npy(path: str, array: np.ndarray):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def quantize_int8(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization: row ~= quantized * scale."""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def _write_quantized(index_dir: str, vectors: np.ndarray, quantization: str):
+    if quantization == "float16":
+        _save_npy(_path(index_dir, "vectors_f16.npy"), vectors.astype(np.float16))
+    elif quantization == "int8":
+        quantized, scales = quantize_int8(vectors)
+        _save_npy(_path(index_dir, "vectors_i8.npy"), quantized)
+        _save_npy(_path(index_dir, "scales_i8.npy"), scales)
+    elif quantization is not None:
+        raise ValueError(f"Unknown vector index quantization: {quantization!r}")
+
+
+def write_quantized_copies(index_dir: str = VECTOR_INDEX_DIR, quantizations=QUANTIZATIONS):
+    """Adds compact copies of an existing index's float32 rows, e.g. to compare every quantization."""
+    vectors = np.load(_path(index_dir, "vectors_f32.npy"), mmap_mode='r')
+    for quantization in quantizations:
+        _write_quantized(index_dir, np.asarray(vectors), quantization)
+
+
+def build_vector_index(chunks_df: pd.DataFrame, chunk_ids: list, embeddings: np.ndarray,
+                       index_dir: str = VECTOR_INDEX_DIR, quantization: str = VECTOR_INDEX_QUANTIZATION):
+    """
+    Writes the local vector index: L2-normalized float32 vectors (searched directly, or used to rescore) plus
+    the compact copy for `quantization`, and the chunk documents/metadata as Parquet. Every file is
+    memory-mapped by NumpyVectorStore. Copies of other quantizations left by earlier builds are removed.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    _save_npy(_path(index_dir, "vectors_f32.npy"), vectors)
+    _write_quantized(index_dir, vectors, quantization)
+    for name in (name for other, names in QUANTIZED_FILES.items() if other != quantization for name in names):
+        if os.path.exists(_path(index_dir, name)):
+            os.remove(_path(index_dir, name))
+
+    chunks = chunks_df.reindex(columns=['chunk_content'] + METADATA_COLUMNS).fillna("")
+    chunks.insert(0, 'chunk_id', chunk_ids)
+    tmp_path = _path(index_dir, "chunks.parquet.tmp")
+    chunks.reset_index(drop=True).to_parquet(tmp_path, engine="pyarrow", index=False)
+    os.replace(tmp_path, _path(index_dir, "chunks.parquet"))
+    print(f"Local vector index with {len(chunk_ids)} vectors saved to {index_dir}")
+
+
+class NumpyVectorStore:
+    """
+    Brute-force vector search over a memory-mapped matrix of normalized embeddings.
+
+    query() and get() accept and return the same shapes as the ChromaDB collection methods used by the
+    agent tools, so either can sit behind retrieve_relevant_chunks. Distances are squared L2 between unit
+    vectors (2 - 2 * cosine), which matches Chroma's default "l2" space for normalized embeddings.
+
+    With quantization="int8" or "float16", candidates are scored on the compact matrix and the best
+    `rescore_factor * n_results` are rescored against the float32 rows.
+    """
+
+    def __init__(self, index_dir: str = VECTOR_INDEX_DIR, quantization: str = VECTOR_INDEX_QUANTIZATION,
+                 rescore_factor: int = VECTOR_INDEX_RESCORE_FACTOR):
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.vectors = np.load(_path(index_dir, "vectors_f32.npy"), mmap_mode='r')
+        self.compact_vectors = None
+        self.scales = None
+        if quantization == "int8":
+            self.compact_vectors = np.load(_path(index_dir, "vectors_i8.npy"), mmap_mode='r')
+            self.scales = np.load(_path(index_dir, "scales_i8.npy"))
+        elif quantization == "float16":
+            self.compact_vectors = np.load(_path(index_dir, "vectors_f16.npy"), mmap_mode='r')
+        elif quantization is not None:
+            raise ValueError(f"Unknown vector index quantization: {quantization!r}")
+
+        chunks = pd.read_parquet(_path(index_dir, "chunks.parquet"), engine="pyarrow")
+        self.ids = chunks['chunk_id'].tolist()
+        self.documents = chunks['chunk_content'].tolist()
+        metadata = chunks.reindex(columns=METADATA_COLUMNS).fillna("")
+        self.metadatas = metadata.to_dict(orient='records')
+        # `where` filters are evaluated as numpy masks over these columns rather than row by row
+        self.columns = {name: metadata[name].to_numpy() for name in METADATA_COLUMNS}
+        self.row_by_id = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        # Source filters (document routing) select rows from this map instead of scanning every metadata dict.
+        # It is keyed like the Chroma metadata flags build_where filters on, one per law a chunk stands for.
+        rows_by_source = {}
+        for row, names in enumerate(chunks_source_files(chunks)):
+            for name in names:
+                rows_by_source.setdefault(source_key(name), []).append(row)
+        self.rows_by_source = {key: np.asarray(rows, dtype=np.int64) for key, rows in rows_by_source.items()}
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _scores(self, matrix: np.ndarray, query_vector: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        if rows is not None:
+            return np.asarray(matrix[rows], dtype=np.float32) @ query_vector
+        scores = np.empty(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], SEARCH_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + SEARCH_BLOCK_ROWS] = block @ query_vector
+        return scores
+
+    def _source_rows(self, keys: list) -> np.ndarray:
+        selected = [self.rows_by_source[key] for key in keys if key in self.rows_by_source]
+        return np.unique(np.concatenate(selected)) if selected else np.empty(0, dtype=np.int64)
+
+    def _candidate_rows(self, where) -> np.ndarray:
+        if not where:
+            return None
+        clauses = where.get("$and", []) + [{key: value} for key, value in where.items() if key != "$and"]
+        rows = None
+        other_clauses = []
+        for clause in clauses:
+            keys = _source_keys(clause)
+            if keys is None:
+                other_clauses.append(clause)
+            else:
+                source_rows = self._source_rows(keys)
+                rows = source_rows if rows is None else np.intersect1d(rows, source_rows)
+        if not other_clauses:
+            return rows
+        mask = self._where_mask({"$and": other_clauses}, rows)
+        return np.flatnonzero(mask) if rows is None else rows[mask]
+
+    def _column(self, key: str, rows: np.ndarray = None) -> np.ndarray:
+        column = self.columns.get(key)
+        if column is None:  # Like metadata.get(key) on a missing key
+            return np.full(self.count() if rows is None else len(rows), None, dtype=object)
+        return column if rows is None else column[rows]
+
+    def _where_mask(self, where: dict, rows: np.ndarray = None) -> np.ndarray:
+        """Boolean mask (over `rows`, or all rows) of a subset of Chroma's `where` syntax:
+        {"field": value}, {"field": {"$eq"|"$ne"|"$in"|"$nin": ...}}, {"$and"|"$or": [...]}."""
+        mask = np.ones(self.count() if rows is None else len(rows), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause, rows)
+            elif key == "$or":
+                any_mask = np.zeros_like(mask)
+                for clause in condition:
+                    any_mask |= self._where_mask(clause, rows)
+                mask &= any_mask
+            elif isinstance(condition, dict):
+                column = self._column(key, rows)
+                for operator, operand in condition.items():
+                    if operator == "$eq":
+                        mask &= column == operand
+                    elif operator == "$ne":
+                        mask &= column != operand
+                    elif operator == "$in":
+                        mask &= np.isin(column, list(operand))
+                    elif operator == "$nin":
+                        mask &= ~np.isin(column, list(operand))
+            else:
+                mask &= self._column(key, rows) == condition
+        return mask
+
+    def search(self, query_embedding, n_results: int, where: dict = None) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (rows, cosine_scores) of the top n_results, best first."""
+        query_vector = normalize_rows(np.asarray(query_embedding, dtype=np.float32)[None, :])[0]
+        rows = self._candidate_rows(where)
+        total = self.count() if rows is None else len(rows)
+        if total == 0 or n_results <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if self.compact_vectors is None:
+            scores = self._scores(self.vectors, query_vector, rows)
+            top = np.argpartition(-scores, min(total, n_results) - 1)[:n_results]
+            candidate_rows = top if rows is None else rows[top]
+            candidate_scores = scores[top]
+        else:
+            scores = self._scores(self.compact_vectors, query_vector, rows)
+            if self.scales is not None:
+                scores *= self.scales if rows is None else self.scales[rows]
+            candidate_count = min(total, n_results * self.rescore_factor)
+            top = np.argpartition(-scores, candidate_count - 1)[:candidate_count]
+            # Rescore the shortlist at full precision, reading the rows in file order
+            candidate_rows = np.sort(top if rows is None else rows[top])
+            candidate_scores = self._scores(self.vectors, query_vector, candidate_rows)
+        order = np.argsort(-candidate_scores, kind="stable")[:n_results]
+        return candidate_rows[order], candidate_scores[order]
+
+    def query(self, query_embeddings: list, n_results: int = 5, where: dict = None, include=None) -> dict:
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for query_embedding in query_embeddings:
+            rows, scores = self.search(query_embedding, n_results, where)
+            results['ids'].append([self.ids[row] for row in rows])
+            results['documents'].append([self.documents[row] for row in rows])
+            results['metadatas'].append([self.metadatas[row] for row in rows])
+            results['distances'].append([float(2 - 2 * score) for score in scores])
+        return results
+
+    def get(self, ids: list = None, include=None, **_) -> dict:
+        rows = [self.row_by_id[chunk_id] for chunk_id in (ids or []) if chunk_id in self.row_by_id]
+        return {
+            'ids': [self.ids[row] for row in rows],
+            'documents': [self.documents[row] for row in rows],
+            'metadatas': [self.metadatas[row] for row in rows],
+        }
+
+
+def _source_keys(clause: dict):
+    """Source flags selected by a build_where source clause ({flag: True} or an $or of those), else None."""
+    if len(clause) != 1:
+        return None
+    (key, condition), = clause.items()
+    if key == "$or":
+        keys = [_source_keys(option) for option in condition]
+        return None if any(option_keys is None for option_keys in keys) else [k for ks in keys for k in ks]
+    if key.startswith(SOURCE_KEY_PREFIX) and condition in (True, {"$eq": True}):
+        return [key]
+    return None
@@ -1,51 +1,69 @@
+import argparse
 import os
 import sys
+import time
 
 # Add src directory to Python path to allow absolute imports from src
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
 
-from src.data_processing.preprocess import run_preprocessing
-from src.data_processing.embed_and_index import generate_embeddings_and_index
-from src.agent.agent import initialize_agent_executor
-from src.config import RAW_DATA_PATH, PROCESSED_CHUNKS_PATH, EMBEDDED_CHUNKS_PATH
+from src.data_processing.pipeline import build_pipeline
 
 
-def run_full_pipeline():
+def run_full_pipeline(force=(), interactive: bool = True):
     print("--- Starting Full Project Pipeline ---")
 
-    # Step 1: Data Preprocessing
-    print("\nPhase 1: Running Data Preprocessing...")
-    run_preprocessing(RAW_DATA_PATH)
+    # Phases 1-2: sections -> chunks -> embeddings -> indexes; stages whose inputs and config are unchanged are skipped
+    print("\nPhases 1-2: Bringing data preprocessing, embeddings and indexes up to date...")
+    start_time = time.perf_counter()
+    results = build_pipeline().run(force=force)
+    rebuilt = [name for name, result in results.items() if result != "up to date"]
+    print(f"\nPipeline up to date in {time.perf_counter() - start_time:.1f}s "
+          f"(re-ran: {', '.join(rebuilt) if rebuilt else 'nothing'}).")
 
-    # Step 2: Embedding Generation and Indexing
-    print("\nPhase 2: Running Embedding Generation and Indexing...")
-    # Ensure the ChromaDB directory exists and is writable
-    generate_embeddings_and_index(PROCESSED_CHUNKS_PATH)
+    if not interactive:
+        return
 
     # Step 3: Initialize and Test Agent
     print("\nPhase 3: Initializing and Testing LLM Agent...")
-    agent_executor = initialize_agent_executor()
-
-    if agent_executor:
-        print("\n--- Agent Ready for Interaction ---")
-        while True:
-            user_question = input("\nEnter your legal question (or 'exit' to quit): ")
-            if user_question.lower() == 'exit':
-                break
-
-            print(f"\nAgent processing question: '{user_question}'")
-            try:
-                response = agent_executor.invoke({"question": user_question})
-                print("\nAgent's Answer:")
-                print(response["output"])
-            except Exception as e:
-                print(f"\nAn error occurred during agent execution: {e}")
-                print("Please check the logs above for more details.")
-    else:
-        print("\nAgent could not be initialized. Please check previous error messages.")
+    try:
+        from src.agent.agent import LegalAssistantAgent
+        agent = LegalAssistantAgent()
+    except Exception as e:
+        print(f"\nAgent could not be initialized: {e}")
+        return
+
+    print("\n--- Agent Ready for Interaction ---")
+    while True:
+        user_question = input("\nEnter your legal question (or 'exit' to quit): ")
+        if user_question.lower() == 'exit':
+            break
+
+        print(f"\nAgent processing question: '{user_question}'")
+        try:
+            answer = agent.run(user_question)
+            print("\nAgent's Answer:")
+            print(answer)
+        except Exception as e:
+            print(f"\nAn error occurred during agent execution: {e}")
+            print("Please check the logs above for more details.")
 
     print("\n--- Full Project Pipeline Finished ---")
 
 
 if __name__ == "__main__":
-    run_full_pipeline()
+    parser = argparse.ArgumentParser(
+        description="Build the data pipeline (only stale stages), then chat with the agent.")
+    parser.add_argument("--force", nargs="*", metavar="STAGE",
+                        help="Re-run these stages (sections, chunks, embeddings, index) even if up to date; "
+                             "no names re-runs all of them")
+    parser.add_argument("--status", action="store_true", help="Show which stages are stale and why, then exit")
+    parser.add_argument("--build-only", action="store_true",
+                        help="Exit after the pipeline instead of starting the agent")
+    args = parser.parse_args()
+
+    if args.status:
+        for stage_name, reasons in build_pipeline().status().items():
+            print(f"{stage_name}: {'; '.join(reasons) if reasons else 'up to date'}")
+    else:
+        force = () if args.force is None else (args.force or True)
+        run_full_pipeline(force=force, interactive=not args.build_only)
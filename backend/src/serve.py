@@ -0,0 +1,211 @@
+import argparse
+import gc
+import math
+import os
+import signal
+import socket
+import sys
+import time
+
+# Add src directory to Python path to allow absolute imports from src
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from src.config import (SERVE_HOST, SERVE_PORT, SERVE_WORKERS, SERVE_TORCH_THREADS_PER_WORKER, SERVE_BACKLOG,
+                        PROMETHEUS_MULTIPROC_DIR, VECTOR_BACKEND)
+
+MIN_WORKER_UPTIME_SECONDS = 5  # Workers dying sooner than this are restarted with a delay, not in a tight loop
+# CPU quota files of cgroup v2 ("<quota> <period>") and v1 (quota and period in separate files)
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_CPU_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_CPU_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+def _cgroup_cpu_limit():
+    """Cores allowed by the cgroup CPU quota (e.g. docker --cpus), or None if there is no quota."""
+    try:
+        with open(CGROUP_V2_CPU_MAX) as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(CGROUP_V1_CPU_QUOTA) as f, open(CGROUP_V1_CPU_PERIOD) as g:
+            quota, period = int(f.read()), int(g.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    """
+    Cores this process can actually use: its CPU affinity, capped by the cgroup quota. os.cpu_count() is the
+    host's count, which inside a container would start a worker (and a model's worth of memory) per host core.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, math.floor(limit))
+    return max(1, cpus)
+
+
+def _set_torch_threads(num_threads: int):
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(num_threads)
+
+
+def _prepare_metrics_dir(path: str):
+    """Switches prometheus_client to multiprocess mode; must run before anything imports it."""
+    os.makedirs(path, exist_ok=True)
+    # Metric files of a previous run would otherwise be added to this run's totals
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(SERVE_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, torch_threads: int):
+    """Body of a forked worker: one uvicorn server accepting on the shared socket. Never returns."""
+    import uvicorn
+
+    exit_code = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        _set_torch_threads(torch_threads)
+        host, port = sock.getsockname()[:2]
+        # The lifespan warm-up loads only what the parent did not: the Chroma client, the agent and its LLM clients
+        uvicorn.Server(uvicorn.Config(app, host=host, port=port, lifespan="on")).run(sockets=[sock])
+    except BaseException as e:
+        print(f"Worker {os.getpid()} failed: {e!r}")
+        exit_code = 1
+    finally:
+        # Skip the parent's atexit handlers and inherited buffers
+        os._exit(exit_code)
+
+
+class PreforkServer:
+    """
+    Serves src.api:app from `num_workers` processes forked from one parent.
+
+    The parent imports the app and loads the fork-safe models and indexes (registry.preload_shared) before
+    forking, so the workers share those pages copy-on-write instead of each loading bge-large and the indexes
+    again. The workers accept connections on one inherited listening socket. The parent restarts workers that
+    die and stops them all on SIGTERM / SIGINT (a second signal kills them).
+
+    Only what is preloaded is shared. With VECTOR_BACKEND = "chroma" every worker opens its own client and HNSW
+    index, so memory still grows with the worker count; the numpy backend shares its memory-mapped vectors.
+    The query embedding, retrieval and answer caches are per worker too: each worker only hits on questions it
+    served itself, so hit rates fall with more workers (the web search cache is shared through SQLite).
+    """
+
+    def __init__(self, host: str = SERVE_HOST, port: int = SERVE_PORT, num_workers: int = SERVE_WORKERS,
+                 torch_threads: int = SERVE_TORCH_THREADS_PER_WORKER, preload: bool = True):
+        self.host = host
+        self.port = port
+        self.num_workers = max(1, num_workers or available_cpus())
+        self.torch_threads = torch_threads or max(1, available_cpus() // self.num_workers)
+        self.preload = preload
+        self.workers = {}  # pid -> start time
+        self.stopping = False
+
+    def _load_app(self):
+        if self.preload:
+            # Inference in the parent must not start torch's OpenMP thread pool: a forked child inherits the pool's
+            # state but not its threads, and its first parallel op can hang. Workers set their own count.
+            _set_torch_threads(1)
+        from src.api import app
+        from src.agent import registry
+
+        if self.preload:
+            start_time = time.perf_counter()
+            registry.preload_shared()
+            print(f"Preloaded shared models and indexes in {time.perf_counter() - start_time:.1f}s: "
+                  f"{registry.status()['load_seconds']}")
+        if VECTOR_BACKEND == "chroma" and self.num_workers > 1:
+            print("Note: each worker opens its own Chroma client and HNSW index; HAQOOQ_VECTOR_BACKEND=numpy "
+                  "shares the vector index between workers through memory-mapped files.")
+        # Objects that exist now are never collected in the workers; keeping the collector off them stops it
+        # from writing to (and so copying) the shared pages
+        gc.collect()
+        gc.freeze()
+        return app
+
+    def _spawn(self, app, sock: socket.socket):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app, sock, self.torch_threads)
+        self.workers[pid] = time.monotonic()
+
+    def _stop(self, signum, frame):
+        sig = signal.SIGKILL if self.stopping else signal.SIGTERM
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def serve(self):
+        from prometheus_client import multiprocess
+
+        app = self._load_app()
+        sock = _bind_socket(self.host, self.port)
+        print(f"Serving on http://{self.host}:{self.port} with {self.num_workers} workers "
+              f"({self.torch_threads} torch threads each), parent pid {os.getpid()}")
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for _ in range(self.num_workers):
+            self._spawn(app, sock)
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started_at = self.workers.pop(pid, None)
+            if started_at is None:
+                continue
+            multiprocess.mark_process_dead(pid)
+            if self.stopping:
+                continue
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting it.")
+            if time.monotonic() - started_at < MIN_WORKER_UPTIME_SECONDS:
+                time.sleep(MIN_WORKER_UPTIME_SECONDS)
+            self._spawn(app, sock)
+        sock.close()
+        print("All workers stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers that share preloaded models.")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="Worker processes (default: one per usable core)")
+    parser.add_argument("--torch-threads", type=int, default=SERVE_TORCH_THREADS_PER_WORKER,
+                        help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Let every worker load its own models, e.g. to compare memory use")
+    args = parser.parse_args()
+
+    _prepare_metrics_dir(PROMETHEUS_MULTIPROC_DIR)
+    PreforkServer(args.host, args.port, args.workers, args.torch_threads, preload=not args.no_preload).serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Add the backend directory to the Python path so `src` imports work however pytest is started
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+# config reads this on import: keep everything the tests build out of the real data directory
+os.environ["HAQOOQ_DATA_DIR"] = tempfile.mkdtemp(prefix="haqooq-tests-")
@@ -0,0 +1,90 @@
+import asyncio
+from typing import Any
+
+import pytest
+from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import tool
+
+from src.agent.agent import LegalAssistantAgent
+
+ANSWER_TOKENS = ["Section ", "302 ", "PPC ", "covers ", "murder."]
+
+
+@tool
+def lookup(query: str) -> str:
+    """Looks up the law."""
+    return "Section 302 PPC: punishment of qatl-i-amd."
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    Selects `lookup` on its first call, then streams ANSWER_TOKENS. After the first answer token it waits for
+    `answer_seen`, which the test sets once that token has reached the client, so an answer held back until
+    the call ends deadlocks (and times out) instead of passing.
+    """
+
+    answer_seen: Any = None
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="Let me search. ", tool_call_chunks=[
+                {"name": "lookup", "args": '{"query": "murder"}', "id": "call_1", "index": 0}]))
+            return
+        for i, token in enumerate(ANSWER_TOKENS):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+            if i == 0:
+                await asyncio.wait_for(self.answer_seen.wait(), timeout=5)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        chunks = [chunk async for chunk in self._astream(messages, stop, run_manager, **kwargs)]
+        message = AIMessage(content="".join(chunk.message.content for chunk in chunks))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "stub")
+    agent = LegalAssistantAgent()
+    agent.router = None
+    model = FakeStreamingChatModel()
+    agent.agent_executor = AgentExecutor(agent=create_tool_calling_agent(model, [lookup], agent.prompt),
+                                         tools=[lookup])
+    return agent, model
+
+
+def test_answer_tokens_stream_before_the_call_ends(agent):
+    agent, model = agent
+
+    async def run():
+        model.answer_seen = asyncio.Event()
+        events = []
+        async for event in agent.astream("What is the punishment for murder?"):
+            events.append(event)
+            if event["type"] == "token":
+                model.answer_seen.set()
+        return events
+
+    events = asyncio.run(run())
+    tokens = [event["content"] for event in events if event["type"] == "token"]
+    # The tool-selecting call's text never reaches the client; the answer arrives token by token
+    assert tokens == ANSWER_TOKENS
+    assert [event["type"] for event in events[:2]] == ["tool_start", "tool_end"]
+    assert events[-1] == {"type": "done", "answer": "".join(ANSWER_TOKENS)}
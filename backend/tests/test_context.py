@@ -0,0 +1,57 @@
+import pytest
+
+from src.agent import context
+from src.agent.context import build_context, merge_chunks
+
+SECTION_TEXT = "".join(f"{word} " for word in ["The", "Commission", "shall", "exercise", "such", "powers"] * 20)
+
+
+@pytest.fixture(autouse=True)
+def _estimated_tokens(monkeypatch):
+    # Count tokens as ~4 characters each, so budgets do not depend on the tiktoken encoding being available
+    monkeypatch.setattr(context, "_encoding", False)
+
+
+def chunk(start: int, end: int, source_file: str = "a.pdf", section_title: str = "1. Powers", text: str = None):
+    return {"chunk_id": f"{source_file}:{section_title}:{start}", "source_file": source_file,
+            "section_title": section_title, "start_index_in_section": start,
+            "chunk_content": text if text is not None else SECTION_TEXT[start:end]}
+
+
+def test_overlapping_chunks_of_a_section_are_merged_in_document_order():
+    merged = merge_chunks([chunk(30, 90), chunk(0, 50), chunk(150, 200)])
+    assert len(merged) == 1
+    source_file, section_title, passages = merged[0]
+    assert (source_file, section_title) == ("a.pdf", "1. Powers")
+    assert [passage.text for passage in passages] == [SECTION_TEXT[0:90], SECTION_TEXT[150:200]]
+
+
+def test_touching_chunks_are_joined_and_mismatched_overlaps_kept_apart():
+    touching = merge_chunks([chunk(0, 40), chunk(41, 80)])[0][2]
+    assert [passage.text for passage in touching] == [SECTION_TEXT[0:40] + "\n" + SECTION_TEXT[41:80]]
+
+    # Same title and offsets, different text: a repeated title in one file, not an overlap
+    mismatched = merge_chunks([chunk(0, 40), chunk(20, 60, text="x" * 40)])[0][2]
+    assert len(mismatched) == 2
+
+
+def test_duplicates_are_dropped_and_sections_ordered_by_best_rank():
+    merged = merge_chunks([chunk(100, 140, section_title="2. Penalties"), chunk(0, 40), chunk(0, 40),
+                           chunk(200, 240, section_title="2. Penalties"),
+                           # Same text under another title, e.g. a chunk retrieved twice through different laws
+                           chunk(0, 40, section_title="3. Appeals")])
+    assert [section_title for _, section_title, _ in merged] == ["2. Penalties", "1. Powers"]
+    assert [passage.text for passage in merged[1][2]] == [SECTION_TEXT[0:40]]
+
+
+def test_budget_drops_sections_once_too_little_is_left():
+    chunks = [chunk(0, 200), chunk(200, 400, section_title="2. Penalties")]
+    built = build_context(chunks, token_budget=100)
+    assert built == "[Source: a.pdf | 1. Powers]\n" + SECTION_TEXT[0:200]
+
+
+def test_budget_truncates_the_passage_that_overflows():
+    built = build_context([chunk(0, 480)], token_budget=100)
+    header = "[Source: a.pdf | 1. Powers]"
+    remaining = 100 - (len(header) + 3) // 4 - 1
+    assert built == header + "\n" + SECTION_TEXT[:remaining * 4] + " ..."
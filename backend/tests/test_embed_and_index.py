@@ -0,0 +1,79 @@
+import chromadb
+import pandas as pd
+import pytest
+
+from src.benchmarks.stubs import HashingEncoder
+from src.config import COLLECTION_NAME, INDEX_VERSION_PATH, VECTOR_DB_DIR
+from src.data_processing.embed_and_index import assign_chunk_ids, generate_embeddings_and_index
+
+
+def chunk(source_file: str, chunk_content: str, section_title: str = "1. Powers") -> dict:
+    return {"source_file": source_file, "section_title": section_title, "chunk_content": chunk_content,
+            "chunk_length": len(chunk_content), "start_index_in_section": 0}
+
+
+@pytest.fixture
+def chunks_path(tmp_path):
+    return str(tmp_path / "chunks.csv")
+
+
+@pytest.fixture
+def collection_calls(monkeypatch):
+    """Names of the add/update/delete calls made on any Chroma collection, in order."""
+    calls = []
+    collection_class = chromadb.api.models.Collection.Collection
+    for name in ("add", "update", "delete"):
+        method = getattr(collection_class, name)
+
+        def record(self, *args, _name=name, _method=method, **kwargs):
+            calls.append(_name)
+            return _method(self, *args, **kwargs)
+        monkeypatch.setattr(collection_class, name, record)
+    return calls
+
+
+def sync(chunks_df: pd.DataFrame, chunks_path: str, **kwargs):
+    chunks_df.to_csv(chunks_path, index=False)
+    generate_embeddings_and_index(chunks_path, model=HashingEncoder(dimension=64), build_indexes=False, **kwargs)
+    return chromadb.PersistentClient(path=VECTOR_DB_DIR).get_collection(COLLECTION_NAME)
+
+
+def read_index_version() -> str:
+    with open(INDEX_VERSION_PATH) as f:
+        return f.read()
+
+
+def test_sync_adds_new_updates_changed_and_deletes_removed_chunks(chunks_path, collection_calls):
+    first = pd.DataFrame([chunk("a.pdf", "The Commission shall exercise such powers."),
+                          chunk("a.pdf", "The Board may appoint officers."),
+                          chunk("b.pdf", "The Court may grant bail.")])
+    collection = sync(first, chunks_path, rebuild=True)
+    assert collection.count() == 3
+    version = read_index_version()
+
+    # Chunk 0 keeps its text but moves to another section, chunk 1 is gone and a new chunk appears
+    second = pd.DataFrame([chunk("a.pdf", "The Commission shall exercise such powers.", "2. Functions"),
+                           chunk("b.pdf", "The Court may grant bail."),
+                           chunk("b.pdf", "The tenant shall pay rent.")])
+    collection_calls.clear()
+    collection = sync(second, chunks_path)
+
+    ids = assign_chunk_ids(second)
+    stored = collection.get(include=["metadatas"])
+    assert sorted(stored["ids"]) == sorted(ids)
+    metadatas = dict(zip(stored["ids"], stored["metadatas"]))
+    assert metadatas[ids[0]]["section_title"] == "2. Functions"
+    # New chunks are in before anything is deleted or updated
+    assert collection_calls == ["add", "delete", "update"]
+    assert read_index_version() != version
+
+
+def test_sync_without_changes_leaves_the_collection_alone(chunks_path, collection_calls):
+    chunks_df = pd.DataFrame([chunk("a.pdf", "The Commission shall exercise such powers.")])
+    sync(chunks_df, chunks_path, rebuild=True)
+    version = read_index_version()
+
+    collection_calls.clear()
+    sync(chunks_df, chunks_path)
+    assert collection_calls == []
+    assert read_index_version() == version
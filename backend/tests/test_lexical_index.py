@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from src.data_processing.lexical_index import LexicalIndex, build_lexical_index, parse_citations
+
+PPC = "Pakistan Penal Code.pdf"
+CONSTITUTION = "Constitution of Pakistan.pdf"
+
+
+@pytest.mark.parametrize("query, numbers", [
+    ("What is the punishment under section 302 PPC?", ["302"]),
+    ("s. 302 PPC", ["302"]),
+    ("ss. 302 and 34", ["302", "34"]),
+    ("Articles 25 and 26", ["25", "26"]),
+    ("Article 25-A right to education", ["25-a"]),
+    ("art. 25-A", ["25-a"]),
+    ("Pakistan's 2024 budget", []),
+    ("What happened in 302 cases?", []),
+])
+def test_parse_citations(query, numbers):
+    assert parse_citations(query) == numbers
+
+
+@pytest.fixture
+def index(tmp_path):
+    chunks_df = pd.DataFrame({
+        "source_file": [PPC, PPC, CONSTITUTION, CONSTITUTION],
+        "section_title": ["", "", "", ""],
+        "chunk_content": [
+            "302. Punishment of qatl-i-amd. Whoever commits qatl-i-amd shall be punished with death.",
+            "25. Lawful exercise of the right of private defence is not an offence under section 302.",
+            "25. Equality of citizens. All citizens are equal before law.",
+            "26. Non-discrimination in respect of access to public places.",
+        ],
+    })
+    path = str(tmp_path / "lexical_index.npz")
+    build_lexical_index(chunks_df, ["ppc-302", "ppc-25", "const-25", "const-26"], path)
+    return LexicalIndex.load(path)
+
+
+def test_lookup_citations_keys_on_provision_headings(index):
+    # The reference to section 302 inside the PPC's section 25 does not make it part of section 302
+    assert [chunk_id for chunk_id, _ in index.lookup_citations("section 302 PPC")] == ["ppc-302"]
+
+
+def test_lookup_citations_narrows_to_the_named_law(index):
+    assert [chunk_id for chunk_id, _ in index.lookup_citations("Article 25 of the Constitution of Pakistan")] \
+        == ["const-25"]
+    assert [chunk_id for chunk_id, _ in index.lookup_citations("section 25 PPC")] == ["ppc-25"]
+    assert sorted(chunk_id for chunk_id, _ in index.lookup_citations("Articles 25 and 26 constitution pakistan")) \
+        == ["const-25", "const-26"]
+
+
+def test_lookup_citations_ignores_queries_without_a_citation(index):
+    assert index.lookup_citations("Pakistan's 2024 penal code") == []
@@ -0,0 +1,219 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from src.agent import llm_pool
+from src.agent.llm_pool import LLMBackend, LLMBackendError, LLMBackendPool, PooledChatModel, create_backend_model
+from src.benchmarks.stubs import StubLLMServer
+
+UNREACHABLE_BASE_URL = "http://127.0.0.1:9/v1"  # Discard port: connections are refused straight away
+MESSAGES = [HumanMessage(content="What is the punishment for murder?")]
+
+
+@pytest.fixture(autouse=True)
+def _api_key(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "stub")
+
+
+@pytest.fixture
+def fast_server():
+    with StubLLMServer(latency_ms=10) as server:
+        yield server
+
+
+@pytest.fixture
+def slow_server():
+    with StubLLMServer(latency_ms=1500) as server:
+        yield server
+
+
+def make_backend(name: str, base_url: str, fallback: bool = False) -> LLMBackend:
+    spec = {"type": "openai", "base_url": base_url, "model": "stub"}
+    return LLMBackend(name, create_backend_model(spec, temperature=0, max_tokens=256), fallback=fallback)
+
+
+def answer_text(result) -> str:
+    return result.generations[0].message.content
+
+
+# --- Failover ---
+def test_generate_fails_over_to_the_next_backend(fast_server):
+    down = make_backend("down", UNREACHABLE_BASE_URL)
+    up = make_backend("up", fast_server.base_url)
+    pool = LLMBackendPool([down, up], load_balancing="priority", hedging=False)
+
+    assert answer_text(pool.generate(MESSAGES)).startswith("Stub answer")
+    assert down.counts["error"] == 1
+    assert up.counts["ok"] == 1
+    assert down.in_flight == up.in_flight == 0
+
+
+def test_agenerate_and_astream_fail_over(fast_server):
+    down = make_backend("down", UNREACHABLE_BASE_URL)
+    up = make_backend("up", fast_server.base_url)
+    pool = LLMBackendPool([down, up], load_balancing="priority", hedging=False)
+
+    async def run():
+        result = await pool.agenerate(MESSAGES)
+        chunks = [chunk.text async for chunk in pool.astream(MESSAGES)]
+        return answer_text(result), "".join(chunks)
+
+    generated, streamed = asyncio.run(run())
+    assert generated.startswith("Stub answer")
+    assert streamed == generated
+    assert down.counts["error"] == 2
+    assert up.counts["ok"] == 2
+
+
+def test_all_backends_failing_raises_with_every_error():
+    pool = LLMBackendPool([make_backend("a", UNREACHABLE_BASE_URL), make_backend("b", UNREACHABLE_BASE_URL)],
+                          load_balancing="priority", hedging=False)
+    with pytest.raises(LLMBackendError) as excinfo:
+        pool.generate(MESSAGES)
+    assert [name for name, _ in excinfo.value.errors] == ["a", "b"]
+
+
+def test_fallback_backend_is_only_used_when_the_primary_fails(fast_server):
+    primary = make_backend("primary", fast_server.base_url)
+    fallback = make_backend("fallback", fast_server.base_url, fallback=True)
+    # Latency balancing would otherwise prefer whichever backend has no samples yet
+    pool = LLMBackendPool([fallback, primary], hedging=False)
+    for _ in range(3):
+        pool.generate(MESSAGES)
+    assert primary.counts["ok"] == 3
+    assert fallback.counts["ok"] == 0
+
+
+# --- Hedging ---
+def test_generate_hedges_a_slow_backend(monkeypatch, slow_server, fast_server):
+    monkeypatch.setattr(llm_pool, "LLM_HEDGE_DELAY_SECONDS", 0.1)
+    slow = make_backend("slow", slow_server.base_url)
+    fast = make_backend("fast", fast_server.base_url)
+    pool = LLMBackendPool([slow, fast], load_balancing="priority")
+
+    start_time = time.perf_counter()
+    assert answer_text(pool.generate(MESSAGES)).startswith("Stub answer")
+    assert time.perf_counter() - start_time < 1.0
+    assert pool.hedged == 1
+    assert fast.counts["ok"] == 1
+    assert fast_server.requests == 1 and slow_server.requests == 1
+
+
+def test_async_calls_hedge_and_cancel_the_loser(monkeypatch, slow_server, fast_server):
+    monkeypatch.setattr(llm_pool, "LLM_HEDGE_DELAY_SECONDS", 0.1)
+    slow = make_backend("slow", slow_server.base_url)
+    fast = make_backend("fast", fast_server.base_url)
+    pool = LLMBackendPool([slow, fast], load_balancing="priority")
+
+    async def run():
+        result = await pool.agenerate(MESSAGES)
+        chunks = [chunk.text async for chunk in pool.astream(MESSAGES)]
+        return answer_text(result), "".join(chunks)
+
+    start_time = time.perf_counter()
+    generated, streamed = asyncio.run(run())
+    assert time.perf_counter() - start_time < 2.0
+    assert streamed == generated
+    assert pool.hedged == 2
+    assert fast.counts["ok"] == 2
+    assert slow.counts["cancelled"] == 2
+    assert slow.in_flight == fast.in_flight == 0
+
+
+def test_no_hedge_before_the_delay(monkeypatch, fast_server):
+    monkeypatch.setattr(llm_pool, "LLM_HEDGE_DELAY_SECONDS", 5)
+    first = make_backend("first", fast_server.base_url)
+    second = make_backend("second", fast_server.base_url)
+    pool = LLMBackendPool([first, second], load_balancing="priority")
+    pool.generate(MESSAGES)
+    assert pool.hedged == 0
+    assert second.counts == {"ok": 0, "error": 0, "cancelled": 0}
+
+
+# --- Circuit breaker ---
+def open_circuit(backend: LLMBackend):
+    for _ in range(llm_pool.LLM_CIRCUIT_FAILURE_THRESHOLD):
+        assert backend.begin() is False
+        backend.finish("error")
+
+
+def test_circuit_opens_after_consecutive_failures_and_is_skipped(fast_server):
+    down = make_backend("down", UNREACHABLE_BASE_URL)
+    up = make_backend("up", fast_server.base_url)
+    pool = LLMBackendPool([down, up], load_balancing="priority", hedging=False)
+    for _ in range(llm_pool.LLM_CIRCUIT_FAILURE_THRESHOLD):
+        pool.generate(MESSAGES)
+    assert down.opened_at is not None
+
+    pool.generate(MESSAGES)
+    assert down.counts["error"] == llm_pool.LLM_CIRCUIT_FAILURE_THRESHOLD
+    assert pool.select() == [up]
+
+
+def test_half_open_admits_exactly_one_trial(monkeypatch):
+    monkeypatch.setattr(llm_pool, "LLM_CIRCUIT_RESET_SECONDS", 0)
+    backend = make_backend("flaky", UNREACHABLE_BASE_URL)
+    open_circuit(backend)
+
+    claims = []
+    barrier = threading.Barrier(8)
+
+    def claim():
+        barrier.wait()
+        claims.append(backend.begin())
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert claims.count(True) == 1
+    assert claims.count(None) == 7
+    assert backend.in_flight == 1
+
+
+def test_only_the_trial_call_clears_the_trial(monkeypatch):
+    monkeypatch.setattr(llm_pool, "LLM_CIRCUIT_RESET_SECONDS", 0)
+    backend = make_backend("flaky", UNREACHABLE_BASE_URL)
+    assert backend.begin() is False  # A call started while the circuit was still closed
+    open_circuit(backend)
+
+    assert backend.begin() is True
+    backend.finish("cancelled")  # The older, non-trial call ends
+    assert backend.trial_in_flight
+    assert backend.begin() is None
+
+    backend.finish("cancelled", trial=True)
+    assert backend.begin() is True
+
+
+def test_failed_trial_reopens_and_successful_trial_closes(monkeypatch, fast_server):
+    monkeypatch.setattr(llm_pool, "LLM_CIRCUIT_RESET_SECONDS", 0.2)
+    backend = make_backend("flaky", UNREACHABLE_BASE_URL)
+    pool = LLMBackendPool([backend], hedging=False)
+    open_circuit(backend)
+    with pytest.raises(LLMBackendError):
+        pool.generate(MESSAGES)  # Still open: no backend to try
+
+    time.sleep(0.25)
+    with pytest.raises(LLMBackendError):
+        pool.generate(MESSAGES)  # The trial fails and re-opens the circuit at once
+    assert backend.opened_at is not None and not backend.available()
+
+    time.sleep(0.25)
+    backend.model = create_backend_model({"type": "openai", "base_url": fast_server.base_url, "model": "stub"},
+                                         temperature=0, max_tokens=256)
+    assert answer_text(pool.generate(MESSAGES)).startswith("Stub answer")
+    assert backend.opened_at is None and not backend.trial_in_flight
+    assert backend.consecutive_failures == 0
+
+
+def test_pooled_chat_model_invokes_through_the_pool(fast_server):
+    backend = make_backend("up", fast_server.base_url)
+    model = PooledChatModel(pool=LLMBackendPool([backend], hedging=False))
+    assert model.invoke(MESSAGES).content.startswith("Stub answer")
+    assert "".join(chunk.content for chunk in model.stream(MESSAGES)).startswith("Stub answer")
+    assert backend.counts["ok"] == 2
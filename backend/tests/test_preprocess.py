@@ -0,0 +1,32 @@
+import pytest
+
+from src.benchmarks.synthetic_corpus import generate_corpus
+from src.data_processing import preprocess
+
+
+@pytest.fixture
+def raw_csv(tmp_path):
+    path = tmp_path / "raw.csv"
+    generate_corpus(str(path), 12, 30, seed=3)
+    return str(path)
+
+
+def run_into(monkeypatch, directory, raw_csv, **kwargs) -> tuple[bytes, bytes]:
+    """Runs run_preprocessing with its outputs redirected into `directory`; returns the sections and chunks CSVs."""
+    directory.mkdir()
+    sections_path = directory / "sections.csv"
+    chunks_path = directory / "chunks.csv"
+    monkeypatch.setattr(preprocess, "SEMANTIC_SECTIONS_PATH", str(sections_path))
+    monkeypatch.setattr(preprocess, "PROCESSED_CHUNKS_PATH", str(chunks_path))
+    preprocess.run_preprocessing(raw_csv, **kwargs)
+    return sections_path.read_bytes(), chunks_path.read_bytes()
+
+
+def test_pooled_streamed_run_matches_single_process(monkeypatch, tmp_path, raw_csv):
+    sequential = run_into(monkeypatch, tmp_path / "sequential", raw_csv, num_workers=1, read_chunksize=1000)
+    pooled = run_into(monkeypatch, tmp_path / "pooled", raw_csv, num_workers=3, read_chunksize=5)
+
+    assert sequential[1].count(b"\n") > 12
+    assert pooled[0] == sequential[0]
+    assert pooled[1] == sequential[1]
+